@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from chats.models import Chat, Message
+from chats.models import ArchiveSegment, Chat, ChatMember, Message
 
 
-admin.site.register([Chat, Message])
+admin.site.register([Chat, ChatMember, Message, ArchiveSegment])
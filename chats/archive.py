@@ -0,0 +1,225 @@
+import gzip
+import json
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import takewhile
+from typing import Iterator
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from loguru import logger
+
+from chats.models import ArchiveSegment, Chat, Message
+from users.models import Client
+
+
+# Холодный архив: старые сообщения чата переезжают из Message в файлы
+# MEDIA_ROOT/CHAT_ARCHIVE_DIR/<chat_id>/<first_id>-<last_id>.ndjson.gz,
+# по строке JSON на сообщение (text остаётся зашифрованным), рядом —
+# <first_id>-<last_id>.json с описанием сегмента. Индекс для поиска
+# по id — таблица ArchiveSegment. Архивируется только префикс чата,
+# поэтому любой архивный id меньше любого id, оставшегося в Message.
+FIELDS = ("id", "sender_id", "parent_id", "sent_at", "text")
+
+
+def segment_path(chat_id: int, first_id: int, last_id: int) -> str:
+    return os.path.join(
+        settings.CHAT_ARCHIVE_DIR, str(chat_id),
+        f"{first_id:020d}-{last_id:020d}.ndjson.gz",
+    )
+
+
+def full_path(path: str) -> str:
+    return os.path.join(settings.MEDIA_ROOT, path)
+
+
+def index_path(path: str) -> str:
+    return path.removesuffix(".ndjson.gz") + ".json"
+
+
+def write_segment(chat_id: int, rows: list[dict]) -> str:
+    path = segment_path(chat_id, rows[0]["id"], rows[-1]["id"])
+    target = full_path(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = target + ".tmp"
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as segment:
+            for row in rows:
+                line = json.dumps(
+                    {**row, "sent_at": row["sent_at"].isoformat()},
+                    ensure_ascii=False, separators=(",", ":"),
+                )
+                segment.write(line.encode() + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, target)
+    with open(index_path(target), "w") as index:
+        json.dump({
+            "chat": chat_id,
+            "first_id": rows[0]["id"],
+            "last_id": rows[-1]["id"],
+            "count": len(rows),
+            "first_sent_at": rows[0]["sent_at"].isoformat(),
+            "last_sent_at": rows[-1]["sent_at"].isoformat(),
+        }, index)
+    return path
+
+
+def remove_segment_files(path: str):
+    for name in (full_path(path), index_path(full_path(path))):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def live_reply_parent(ids: list[int]) -> int | None:
+    """
+    Самое раннее сообщение из ids, на которое отвечает неархивируемое.
+    parent — CASCADE, удаление такого сообщения снесло бы живой ответ.
+    """
+    return Message.objects.filter(parent_id__in=ids).exclude(
+        id__in=ids
+    ).aggregate(first=Min("parent_id"))["first"]
+
+
+def archive_rows(chat_id: int, rows: list[dict]) -> bool:
+    path = write_segment(chat_id, rows)
+    ids = [row["id"] for row in rows]
+    with transaction.atomic():
+        # FOR UPDATE конфликтует с FOR KEY SHARE, который берёт вставка
+        # ответа на эти строки: пока переносим, новых ответов не появится
+        locked = Message.objects.select_for_update().filter(id__in=ids)
+        if len(locked) == len(ids) and live_reply_parent(ids) is None:
+            ArchiveSegment.objects.create(
+                chat_id=chat_id,
+                first_id=ids[0],
+                last_id=ids[-1],
+                count=len(ids),
+                first_sent_at=rows[0]["sent_at"],
+                last_sent_at=rows[-1]["sent_at"],
+                path=path,
+            )
+            Message.objects.filter(id__in=ids).delete()
+            return True
+    remove_segment_files(path)
+    logger.info(f"Chat {chat_id} changed while archiving, retry later")
+    return False
+
+
+def archive_chat(chat_id: int, cutoff: datetime) -> int:
+    size = settings.CHAT_ARCHIVE_SEGMENT_SIZE
+    archived = 0
+    while True:
+        # самые старые строки чата по индексу (chat_id, id)
+        rows = list(
+            Message.objects.filter(chat_id=chat_id)
+            .order_by("id").values(*FIELDS)[:size]
+        )
+        rows = list(takewhile(lambda row: row["sent_at"] < cutoff, rows))
+        blocked = live_reply_parent([row["id"] for row in rows]) \
+            if rows else None
+        if blocked is not None:
+            rows = [row for row in rows if row["id"] < blocked]
+        if not rows or not archive_rows(chat_id, rows):
+            break
+        archived += len(rows)
+        if len(rows) < size:
+            break
+    return archived
+
+
+def archive_messages(
+    days: int | None = None, chat_ids: list[int] | None = None
+) -> dict:
+    if days is None:
+        days = settings.CHAT_ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    if chat_ids is None:
+        chat_ids = Chat.objects.values_list("id", flat=True).iterator()
+    stats = {"chats": 0, "messages": 0}
+    for chat_id in chat_ids:
+        # одна проба индекса на чат вместо скана Message по sent_at
+        oldest = Message.objects.filter(chat_id=chat_id).order_by(
+            "id"
+        ).values_list("sent_at", flat=True).first()
+        if oldest is None or oldest >= cutoff:
+            continue
+        archived = archive_chat(chat_id, cutoff)
+        if archived:
+            stats["chats"] += 1
+            stats["messages"] += archived
+    logger.info(f"Archived {stats['messages']} messages "
+                f"from {stats['chats']} chats")
+    return stats
+
+
+def read_segment(segment: ArchiveSegment) -> Iterator[dict]:
+    """Построчно распаковывает сегмент, не держа его в памяти целиком."""
+    with gzip.open(full_path(segment.path), "rt", encoding="utf-8") as lines:
+        for line in lines:
+            yield json.loads(line)
+
+
+def to_message(chat_id: int, row: dict) -> Message:
+    return Message(
+        id=row["id"],
+        chat_id=chat_id,
+        sender_id=row["sender_id"],
+        parent_id=row["parent_id"],
+        sent_at=datetime.fromisoformat(row["sent_at"]),
+        text=row["text"],
+    )
+
+
+def read_after(chat_id: int, after_id: int, limit: int) -> list[Message]:
+    """Первые limit архивных сообщений с id > after_id, по возрастанию."""
+    result = []
+    segments = ArchiveSegment.objects.filter(
+        chat_id=chat_id, last_id__gt=after_id
+    ).order_by("first_id")
+    for segment in segments.iterator():
+        for row in read_segment(segment):
+            if row["id"] <= after_id:
+                continue
+            result.append(to_message(chat_id, row))
+            if len(result) >= limit:
+                return result
+    return result
+
+
+def read_before(
+    chat_id: int, before_id: int | None, limit: int
+) -> list[Message]:
+    """Последние limit архивных сообщений с id < before_id, по возрастанию."""
+    result = []
+    segments = ArchiveSegment.objects.filter(chat_id=chat_id)
+    if before_id is not None:
+        segments = segments.filter(first_id__lt=before_id)
+    for segment in segments.order_by("-last_id").iterator():
+        tail = deque(maxlen=limit - len(result))
+        for row in read_segment(segment):
+            if before_id is None or row["id"] < before_id:
+                tail.append(row)
+        result = [to_message(chat_id, row) for row in tail] + result
+        if len(result) >= limit:
+            break
+    return result
+
+
+def has_before(chat_id: int, before_id: int | None) -> bool:
+    segments = ArchiveSegment.objects.filter(chat_id=chat_id)
+    if before_id is not None:
+        segments = segments.filter(first_id__lt=before_id)
+    return segments.exists()
+
+
+def attach_senders(messages: list[Message]):
+    senders = Client.objects.in_bulk(
+        {message.sender_id for message in messages if message.sender_id}
+    )
+    for message in messages:
+        message.sender = senders.get(message.sender_id)
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from collections import Counter, deque
+
+
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+# Счётчики процесса: сколько кадров выброшено, склеено, сколько медленных
+# клиентов отключено и сколько входящих кадров отсечено лимитом.
+counters: Counter = Counter()
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше burst подряд. rate=0 — без лимита."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def allow(self) -> bool:
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class SendQueue:
+    """
+    Ограниченная очередь исходящих кадров одного подключения.
+    Её разбирает отдельная задача, поэтому обработчики group_send
+    не ждут медленный сокет и очередь канала в channel layer не растёт.
+    При переполнении:
+        drop_oldest — выбрасывается самый старый кадр;
+        coalesce — кадр с тем же ключом (например typing) заменяется
+                   новым, иначе как drop_oldest;
+        disconnect — put возвращает False, клиента нужно отключить.
+    """
+
+    def __init__(self, maxsize: int, policy: str = DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown send queue policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items: deque = deque()
+        self.ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, frames: dict, key: str | None = None) -> bool:
+        if key is not None and self.policy == COALESCE:
+            for index, (queued_key, _) in enumerate(self.items):
+                if queued_key == key:
+                    self.items[index] = (key, frames)
+                    counters["coalesced"] += 1
+                    return True
+        if len(self.items) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                counters["disconnected"] += 1
+                return False
+            self.items.popleft()
+            counters["dropped"] += 1
+        self.items.append((key, frames))
+        self.ready.set()
+        return True
+
+    async def get(self) -> dict:
+        while not self.items:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.items.popleft()[1]
@@ -0,0 +1,191 @@
+import asyncio
+import atexit
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, Value, When
+from loguru import logger
+
+from chats.models import ChatMember, Message
+from chats.utils import encrypt_message
+
+
+PREVIEW_LENGTH = 100
+
+
+class MessageWriteBuffer:
+    """
+    Write-behind буфер сообщений чата.
+    Консьюмер кладёт сообщение в буфер без обращения к БД,
+    а фоновая задача пишет накопленное одним bulk_create
+    каждые `batch_size` сообщений или `flush_interval` секунд.
+    Сбросы идут строго по очереди, поэтому порядок сообщений
+    внутри чата сохраняется. В той же транзакции обновляются
+    счётчики непрочитанных и последнее сообщение у ChatMember.
+    Если пачка не записалась, она повторяется по чатам, затем
+    по одному сообщению: теряется (failed) только битая строка.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: list[Message] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._has_data: asyncio.Event | None = None
+        self._full: asyncio.Event | None = None
+        self._lock: asyncio.Lock | None = None
+        self.flushes = 0
+        self.flushed = 0
+        self.failed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def put(self, message: Message):
+        self._ensure_task()
+        self._pending.append(message)
+        self._has_data.set()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    def _ensure_task(self):
+        # задача и примитивы привязаны к циклу событий, в котором созданы
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._has_data = asyncio.Event()
+            self._full = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._has_data.wait()
+            try:
+                await asyncio.wait_for(
+                    self._full.wait(), timeout=self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        self._ensure_task()
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            self._has_data.clear()
+            self._full.clear()
+            if batch:
+                await sync_to_async(self._write)(batch)
+
+    def _write(self, batch: list[Message]):
+        start = time.perf_counter()
+        rows = [row for row in map(self._prepare, batch) if row is not None]
+        try:
+            saved = self._save(rows)
+        except DatabaseError as e:
+            logger.warning(
+                f"Failed to flush {len(rows)} messages, retrying per chat: {e}"
+            )
+            chats: dict[int, list] = {}
+            for row in rows:
+                chats.setdefault(row[0].chat_id, []).append(row)
+            saved = sum(map(self._retry, chats.values()))
+        elapsed = (time.perf_counter() - start) * 1000
+        self.flushes += 1
+        self.flushed += saved
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        logger.debug(f"Message buffer flushed: {self.stats()}")
+
+    def _prepare(self, message: Message) -> tuple[Message, str] | None:
+        # шифруем до транзакции: битое сообщение не должно тянуть за собой
+        # всю пачку, в которой лежат сообщения всех чатов процесса
+        try:
+            preview = message.text[:PREVIEW_LENGTH]
+            message.text = encrypt_message(message.text, message.chat_id)
+        except Exception as e:
+            self._drop(message, e)
+            return None
+        return message, preview
+
+    def _save(self, rows: list[tuple[Message, str]]) -> int:
+        messages = [message for message, _ in rows]
+        try:
+            with transaction.atomic():
+                Message.objects.bulk_create(
+                    messages, batch_size=self.batch_size
+                )
+                self._update_members(rows)
+        except DatabaseError:
+            # транзакция откатилась, выданные id недействительны
+            for message in messages:
+                message.pk = None
+            raise
+        return len(messages)
+
+    def _retry(self, rows: list[tuple[Message, str]]) -> int:
+        """Пачка одного чата, при ошибке — по одной строке."""
+        try:
+            return self._save(rows)
+        except DatabaseError as e:
+            if len(rows) == 1:
+                self._drop(rows[0][0], e)
+                return 0
+        return sum(self._retry([row]) for row in rows)
+
+    def _drop(self, message: Message, error: Exception):
+        self.failed += 1
+        logger.error(
+            f"Dropped message from user {message.sender_id} "
+            f"in chat {message.chat_id}: {error}"
+        )
+
+    def _update_members(self, rows: list[tuple[Message, str]]):
+        # один UPDATE на чат: +N непрочитанных всем, кроме своих сообщений
+        senders: dict[int, Counter] = {}
+        last: dict[int, tuple[Message, str]] = {}
+        for message, preview in rows:
+            senders.setdefault(message.chat_id, Counter())[message.sender_id] += 1
+            last[message.chat_id] = message, preview
+        for chat_id, counter in senders.items():
+            own = [
+                When(user_id=sender_id, then=Value(count))
+                for sender_id, count in counter.items() if sender_id
+            ]
+            message, preview = last[chat_id]
+            ChatMember.objects.filter(chat_id=chat_id).update(
+                unread_count=(
+                    F("unread_count") + Value(counter.total())
+                    - Case(*own, default=Value(0))
+                ),
+                last_message_id=message.pk,
+                last_message_at=message.sent_at,
+                last_message_preview=encrypt_message(preview, chat_id),
+            )
+
+    def close(self):
+        """Синхронный сброс остатка при остановке процесса."""
+        batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._pending),
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+        }
+
+
+message_buffer = MessageWriteBuffer(
+    batch_size=settings.CHAT_WRITE_BATCH_SIZE,
+    flush_interval=settings.CHAT_WRITE_FLUSH_MS / 1000,
+)
+atexit.register(message_buffer.close)
@@ -1,41 +1,391 @@
-import json
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import parse_qs
 
-from channels.generic.websocket import WebsocketConsumer
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 from django.utils import timezone
-from asgiref.sync import async_to_sync
-
-
-class ChatConsumer(WebsocketConsumer):
-
-    def connect(self):
-        print("Consumer connected!")
-        async_to_sync(self.channel_layer.group_add)("chat", self.channel_name)
-        self.accept()
-
-    def disconnect(self, close_code):
-        print("Consumer disconnected!")
-        async_to_sync(self.channel_layer.group_discard)("chat", self.channel_name)
-        self.close(code=close_code)
-
-    def receive(self, text_data: str):
-        print("Object recieved!")
-        json_data = json.loads(text_data)
-        user = json_data.get("user")
-        if user:
-            async_to_sync(self.channel_layer.group_send)(
-                "chat",
-                {
-                    "type": "chat.message",
-                    "user": user,
-                    "date": timezone.now().isoformat(),
-                    "text": json_data.get("text"),
-                },
+from loguru import logger
+from redis.exceptions import RedisError
+
+from chats import membership, presence, replay
+from chats.backpressure import SendQueue, TokenBucket, counters
+from chats.buffer import message_buffer
+from chats.framing import (
+    SUBPROTOCOL_MSGPACK, FrameError, choose_subprotocol,
+    decode_frame, encode_event, encode_json, message_text,
+)
+from chats.models import ChatMember, Message
+
+
+MAX_TEXT_LENGTH = Message._meta.get_field("text").max_length
+
+# отложенные рассылки хвоста окна typing; ссылки держим, чтобы задачи
+# не собрал GC, и они переживают отключение консьюмера
+typing_flushes: set[asyncio.Task] = set()
+
+
+def group_name(chat_id: int) -> str:
+    return f"chat_{chat_id}"
+
+
+@database_sync_to_async
+def recent_chat_ids(user_id: int, limit: int) -> list[int]:
+    # индекс chatmember_user_last_msg_idx: самые активные чаты первыми
+    return list(
+        ChatMember.objects.filter(user_id=user_id)
+        .exclude(chat_id__in=settings.CHAT_BROADCAST_ROOMS)
+        .order_by("-last_message_at")
+        .values_list("chat_id", flat=True)[:limit]
+    )
+
+
+class BaseChatConsumer(AsyncWebsocketConsumer, ABC):
+    """
+    Общая часть консьюмеров чата: пользователь, очередь отправки,
+    лимит входящих, присутствие, replay и рассылка в группу чата.
+    Подписками на чаты управляют наследники: subscribe_initial
+    и handle_frame обязательны.
+    """
+
+    async def connect(self):
+        self.chats: set[int] = set()
+        self.outbox_task = None
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            logger.debug("Not authorized!")
+            await self.close()
+            return
+        self.user_id = user.id
+        self.sender = {"id": user.id, "username": user.username}
+        self.last_heartbeat = float("-inf")
+        self.subprotocol = choose_subprotocol(self.scope.get("subprotocols", []))
+        self.binary = self.subprotocol == SUBPROTOCOL_MSGPACK
+        # chat_id -> seq последней досланной при replay рассылки
+        self.replayed_until: dict[int, tuple[int, int]] = {}
+        self.inbound = TokenBucket(
+            settings.CHAT_INBOUND_RATE, settings.CHAT_INBOUND_BURST
+        )
+        self.outbox = SendQueue(
+            settings.CHAT_SEND_QUEUE_SIZE, settings.CHAT_SEND_QUEUE_POLICY
+        )
+        if not await self.subscribe_initial():
+            logger.debug("Not a member!")
+            await self.close()
+            return
+        await self.accept(subprotocol=self.subprotocol)
+        self.outbox_task = asyncio.create_task(self.drain_outbox())
+        logger.debug(f"Consumer connected to {len(self.chats)} chats")
+        await self.after_accept()
+
+    @abstractmethod
+    async def subscribe_initial(self) -> bool:
+        """Вступает в группы начальных чатов; False — отказать в подключении."""
+
+    async def after_accept(self):
+        pass
+
+    async def disconnect(self, close_code):
+        if self.outbox_task is not None:
+            self.outbox_task.cancel()
+        await asyncio.gather(*(
+            self.channel_layer.group_discard(
+                group_name(chat_id), self.channel_name
             )
+            for chat_id in self.chats
+        ))
+        logger.debug(f"Consumer disconnected from {len(self.chats)} chats")
+
+    async def join(self, chat_id: int):
+        await self.channel_layer.group_add(
+            group_name(chat_id), self.channel_name
+        )
+        self.chats.add(chat_id)
+
+    async def leave(self, chat_id: int):
+        self.chats.discard(chat_id)
+        self.replayed_until.pop(chat_id, None)
+        await self.channel_layer.group_discard(
+            group_name(chat_id), self.channel_name
+        )
+
+    async def receive(self, text_data: str = None, bytes_data: bytes = None):
+        try:
+            data = decode_frame(text_data, bytes_data)
+        except FrameError as e:
+            logger.debug(f"Bad frame: {e}")
+            return
+        if not self.inbound.allow():
+            counters["throttled"] += 1
+            return
+        await self.heartbeat()
+        await self.handle_frame(data)
+
+    @abstractmethod
+    async def handle_frame(self, data: dict):
+        """Разбирает входящий кадр после лимита и heartbeat."""
+
+    async def dispatch_chat_frame(self, chat_id: int, data: dict):
+        # состав чата мог измениться после подписки; проверка — поиск в памяти
+        if not await membership.is_member(chat_id, self.user_id):
+            await self.revoke(chat_id)
+            return
+        kind = data.get("type", "message")
+        if kind == "typing":
+            await self.typing(chat_id)
+        elif kind == "message":
+            try:
+                text = message_text(data, MAX_TEXT_LENGTH)
+            except FrameError as e:
+                await self.send_event({
+                    "type": "error", "chat": chat_id, "error": str(e),
+                })
+                return
+            await self.post_message(chat_id, text)
+
+    async def revoke(self, chat_id: int):
+        await self.leave(chat_id)
+        await self.send_event({
+            "type": "error", "chat": chat_id, "error": "not a member",
+        })
+
+    async def post_message(self, chat_id: int, text: str):
+        message_buffer.put(Message(
+            chat_id=chat_id, sender_id=self.user_id, text=text
+        ))
+        payload = {
+            "type": "message",
+            "chat": chat_id,
+            "user": self.sender,
+            "date": timezone.now().isoformat(),
+            "text": text,
+        }
+        seq = await self.remember(chat_id, payload)
+        if seq:
+            payload["seq"] = seq
+        await self.channel_layer.group_send(
+            group_name(chat_id),
+            {
+                "type": "chat.message",
+                "chat": chat_id,
+                "seq": seq,
+                "frames": encode_event(payload),
+            },
+        )
+
+    async def send_frames(self, frames: dict):
+        if self.binary:
+            await self.send(bytes_data=frames["msgpack"])
         else:
-            print("Not authorized!")
-            self.close()
+            await self.send(text_data=frames["json"])
+
+    async def send_event(self, payload: dict):
+        await self.send_frames(encode_event(payload))
+
+    async def chat_message(self, event: dict):
+        replayed_until = self.replayed_until.get(event["chat"])
+        if replayed_until is not None:
+            # рассылки, пришедшие в группу во время replay, уже отправлены
+            seq = replay.parse_seq(event.get("seq"))
+            if seq is not None and seq <= replayed_until:
+                return
+            del self.replayed_until[event["chat"]]
+        await self.enqueue(event["frames"])
+
+    async def chat_typing(self, event: dict):
+        # при политике coalesce в очереди держится только свежий typing
+        await self.enqueue(event["frames"], key=f"typing:{event['chat']}")
+
+    async def enqueue(self, frames: dict, key: str | None = None):
+        if not self.outbox.put(frames, key):
+            logger.debug(f"Slow consumer dropped, user {self.user_id}")
+            await self.close(code=1008)
+
+    async def drain_outbox(self):
+        while True:
+            await self.send_frames(await self.outbox.get())
+
+    async def remember(self, chat_id: int, payload: dict) -> str | None:
+        if not settings.CHAT_REPLAY_SIZE:
+            return None
+        try:
+            return await replay.append(chat_id, encode_json(payload))
+        except RedisError as e:
+            logger.warning(f"Replay buffer unavailable: {e}")
+            return None
+
+    async def replay(self, chat_id: int, resume_from: str):
+        try:
+            events, gap = await replay.since(chat_id, resume_from)
+        except RedisError as e:
+            logger.warning(f"Replay buffer unavailable: {e}")
+            events, gap = [], True
+        for payload in events:
+            await self.send_event(payload)
+        last = events[-1]["seq"] if events else resume_from
+        self.replayed_until[chat_id] = replay.parse_seq(last)
+        # gap: часть пропущенного вытеснена, догрузить через history API
+        await self.send_event({
+            "type": "replay", "chat": chat_id,
+            "seq": last, "count": len(events), "gap": gap,
+        })
+
+    async def heartbeat(self):
+        now = time.monotonic()
+        if now - self.last_heartbeat < settings.CHAT_HEARTBEAT_INTERVAL:
+            return
+        self.last_heartbeat = now
+        try:
+            await presence.touch(self.user_id)
+        except RedisError as e:
+            logger.warning(f"Presence unavailable: {e}")
+
+    async def typing(self, chat_id: int):
+        try:
+            window = await presence.typing(chat_id, self.user_id)
+        except RedisError as e:
+            logger.warning(f"Presence unavailable: {e}")
+            return
+        if window is not None:
+            await self.broadcast_typing(chat_id, *window)
+
+    async def broadcast_typing(
+        self, chat_id: int, users: list[int], token: str
+    ):
+        await self.channel_layer.group_send(
+            group_name(chat_id),
+            {
+                "type": "chat.typing",
+                "chat": chat_id,
+                "frames": encode_event({
+                    "type": "typing", "chat": chat_id, "users": users,
+                }),
+            },
+        )
+        # кто начал печатать при закрытом окне, уходит по его окончании
+        task = asyncio.create_task(self.flush_typing(chat_id, token))
+        typing_flushes.add(task)
+        task.add_done_callback(typing_flushes.discard)
+
+    async def flush_typing(self, chat_id: int, token: str):
+        await asyncio.sleep(settings.CHAT_TYPING_INTERVAL_MS / 1000)
+        try:
+            users = await presence.flush_typing(chat_id, token)
+        except RedisError as e:
+            logger.warning(f"Presence unavailable: {e}")
+            return
+        if users:
+            await self.broadcast_typing(chat_id, users, token)
+
+
+class ChatConsumer(BaseChatConsumer):
+    """
+    Асинхронный консьюмер чата.
+    Каждое подключение вступает только в группу своего Chat.pk,
+    поэтому рассылка идёт участникам чата, а не всем сокетам сервера.
+    Сообщения сохраняются через write-behind буфер (chats.buffer).
+    Пользователь определяется один раз при подключении по JWT
+    (chats.middleware), кадры клиента идентичность не несут.
+    Кадры {"type": "heartbeat"} и {"type": "typing"} обновляют присутствие
+    (chats.presence); запись в Redis не чаще CHAT_HEARTBEAT_INTERVAL.
+    Формат кадров (JSON или msgpack) согласуется подпротоколом
+    (chats.framing), рассылка кодируется один раз на group_send.
+    Сообщения нумеруются seq из кольцевого буфера комнаты (chats.replay):
+    с ?resume_from=<seq> пропущенное досылается из Redis, без запроса к БД.
+    Исходящие кадры идут через ограниченную очередь (chats.backpressure),
+    входящие режутся token bucket: медленный или шумный клиент
+    не тормозит рассылку остальным участникам комнаты.
+    """
+
+    async def subscribe_initial(self) -> bool:
+        self.chat_id = int(self.scope["url_route"]["kwargs"]["chat_id"])
+        if not await membership.is_member(self.chat_id, self.user_id):
+            return False
+        await self.join(self.chat_id)
+        return True
+
+    async def after_accept(self):
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        resume_from = query.get("resume_from", [None])[0]
+        if settings.CHAT_REPLAY_SIZE and replay.parse_seq(resume_from):
+            await self.replay(self.chat_id, resume_from)
+
+    async def handle_frame(self, data: dict):
+        await self.dispatch_chat_frame(self.chat_id, data)
+
+    async def revoke(self, chat_id: int):
+        await super().revoke(chat_id)
+        await self.close(code=4003)
+
+
+class BroadcastChatConsumer(ChatConsumer):
+    """
+    Тот же чат на pub/sub channel layer: group_send — один PUBLISH
+    на группу, а не запись в очередь каждого участника.
+    Для комнат из CHAT_BROADCAST_ROOMS (см. chats.routing).
+    """
+    channel_layer_alias = "broadcast"
+
+
+class MultiplexChatConsumer(BaseChatConsumer):
+    """
+    Один сокет ws/ на пользователя вместо сокета на каждый чат.
+    При подключении подписывается на CHAT_MULTIPLEX_MAX_CHATS последних
+    активных чатов пользователя, остальные — управляющими кадрами:
+        {"type": "subscribe", "chat": 1, "resume_from": "<seq>"}
+        {"type": "unsubscribe", "chat": 1}
+    Все кадры в обе стороны несут "chat". Комнаты CHAT_BROADCAST_ROOMS
+    живут на отдельном channel layer и доступны только через ws/chat/<id>/.
+    """
+
+    async def subscribe_initial(self) -> bool:
+        chat_ids = await recent_chat_ids(
+            self.user_id, settings.CHAT_MULTIPLEX_MAX_CHATS
+        )
+        await asyncio.gather(*(self.join(chat_id) for chat_id in chat_ids))
+        return True
+
+    async def after_accept(self):
+        await self.send_event({
+            "type": "subscribed", "chats": sorted(self.chats),
+        })
+
+    async def handle_frame(self, data: dict):
+        try:
+            chat_id = int(data.get("chat"))
+        except (TypeError, ValueError):
+            return
+        kind = data.get("type", "message")
+        if kind == "subscribe":
+            await self.subscribe(chat_id, data.get("resume_from"))
+        elif kind == "unsubscribe":
+            await self.leave(chat_id)
+            await self.send_event({"type": "unsubscribed", "chat": chat_id})
+        elif chat_id in self.chats:
+            await self.dispatch_chat_frame(chat_id, data)
 
-    def chat_message(self, event: dict):
-        print("Message sent!")
-        answer = f"{event["date"]} -> {event["user"]["username"]} -> {event["text"]}"
-        self.send(text_data=answer)
+    async def subscribe(self, chat_id: int, resume_from: str | None):
+        if chat_id in settings.CHAT_BROADCAST_ROOMS:
+            await self.send_event({
+                "type": "error", "chat": chat_id,
+                "error": "broadcast room, use ws/chat/<id>/",
+            })
+            return
+        if chat_id not in self.chats:
+            if len(self.chats) >= settings.CHAT_MULTIPLEX_MAX_CHATS:
+                await self.send_event({
+                    "type": "error", "chat": chat_id,
+                    "error": "too many subscriptions",
+                })
+                return
+            if not await membership.is_member(chat_id, self.user_id):
+                await self.send_event({
+                    "type": "error", "chat": chat_id, "error": "not a member",
+                })
+                return
+            await self.join(chat_id)
+        await self.send_event({"type": "subscribed", "chats": [chat_id]})
+        if settings.CHAT_REPLAY_SIZE and replay.parse_seq(resume_from):
+            await self.replay(chat_id, resume_from)
@@ -0,0 +1,63 @@
+import json
+
+import msgpack
+
+
+# Клиент выбирает формат через Sec-WebSocket-Protocol.
+# Без подпротокола — структурированный JSON в текстовых кадрах.
+SUBPROTOCOL_MSGPACK = "chat.msgpack"
+SUBPROTOCOL_JSON = "chat.json"
+SUPPORTED_SUBPROTOCOLS = (SUBPROTOCOL_MSGPACK, SUBPROTOCOL_JSON)
+
+
+class FrameError(ValueError):
+    pass
+
+
+def choose_subprotocol(offered: list[str]) -> str | None:
+    """Первый поддерживаемый в порядке предпочтения клиента."""
+    for subprotocol in offered:
+        if subprotocol in SUPPORTED_SUBPROTOCOLS:
+            return subprotocol
+    return None
+
+
+def encode_json(payload: dict) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_event(payload: dict) -> dict:
+    """
+    Кодирует рассылку один раз на group_send, а не на каждого получателя:
+    консьюмеры просто берут готовые байты нужного формата.
+    """
+    return {
+        "json": encode_json(payload),
+        "msgpack": msgpack.packb(payload),
+    }
+
+
+def decode_frame(text_data: str | None, bytes_data: bytes | None) -> dict:
+    try:
+        if bytes_data is not None:
+            data = msgpack.unpackb(bytes_data)
+        else:
+            data = json.loads(text_data)
+    except (TypeError, ValueError, msgpack.UnpackException) as e:
+        raise FrameError(str(e))
+    if not isinstance(data, dict):
+        raise FrameError("frame must be an object")
+    return data
+
+
+def message_text(data: dict, max_length: int) -> str:
+    """
+    Текст сообщения из кадра. Проверяется до буфера записи и рассылки:
+    msgpack и JSON пропускают любые типы, а bytes не сериализуется в JSON.
+    """
+    text = data.get("text")
+    if not isinstance(text, str) or not text:
+        raise FrameError("text must be a non-empty string")
+    if len(text) > max_length:
+        raise FrameError(f"text is longer than {max_length} characters")
+    return text
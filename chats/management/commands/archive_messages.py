@@ -0,0 +1,27 @@
+from loguru import logger
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chats.archive import archive_messages
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит сообщения старше --days дней из Message "
+        "в gzip NDJSON сегменты архива (MEDIA_ROOT/CHAT_ARCHIVE_DIR)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+        )
+        parser.add_argument(
+            "--chat", type=int, action="append", dest="chats",
+            help="только эти чаты (можно несколько раз)",
+        )
+
+    def handle(self, *args, **options):
+        logger.info("Start archiving chat messages")
+        stats = archive_messages(days=options["days"], chat_ids=options["chats"])
+        logger.info(f"Archiving finished: {stats}")
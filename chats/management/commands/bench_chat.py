@@ -0,0 +1,186 @@
+import asyncio
+import json
+import statistics
+import time
+
+import msgpack
+from loguru import logger
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chats.backpressure import counters
+from chats.buffer import message_buffer
+from chats.framing import SUBPROTOCOL_JSON, SUBPROTOCOL_MSGPACK
+from chats.middleware import JWTAuthMiddlewareStack, token_cache
+from chats.models import Chat, ChatMember
+from chats.routing import websocket_urlpatterns
+from users.models import Client
+
+
+IN_MEMORY_LAYER = {
+    alias: {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+    for alias in ("default", "broadcast")
+}
+BENCH_EMAIL = "bench@chat.local"
+CODECS = {"json": SUBPROTOCOL_JSON, "msgpack": SUBPROTOCOL_MSGPACK}
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк ChatConsumer: messages/sec и задержка рассылки "
+        "в зависимости от количества комнат, размер кадра и CPU "
+        "для JSON и msgpack"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rooms", type=str, default="1,10,50",
+            help="список количеств комнат через запятую",
+        )
+        parser.add_argument(
+            "--clients", type=int, default=5,
+            help="подключений на комнату",
+        )
+        parser.add_argument(
+            "--messages", type=int, default=20,
+            help="сообщений на комнату",
+        )
+        parser.add_argument(
+            "--redis", action="store_true",
+            help="использовать CHANNEL_LAYERS из настроек вместо in-memory",
+        )
+        parser.add_argument(
+            "--codec", choices=["json", "msgpack", "both"], default="both",
+        )
+
+    def setup_fixtures(self, rooms: int) -> list[int]:
+        client = Client.objects.filter(email=BENCH_EMAIL).first()
+        if client is None:
+            # bulk_create, чтобы не дёргать post_save с письмом активации
+            client, = Client.objects.bulk_create([Client(
+                username="bench", email=BENCH_EMAIL,
+                is_active=True, expired_code=timezone.now(),
+            )])
+        self.token = str(AccessToken.for_user(client))
+        chats = Chat.objects.bulk_create([Chat() for _ in range(rooms)])
+        ChatMember.objects.bulk_create([
+            ChatMember(chat=chat, user=client) for chat in chats
+        ])
+        return [chat.pk for chat in chats]
+
+    def decode(self, frame: str | bytes) -> dict:
+        if isinstance(frame, bytes):
+            return msgpack.unpackb(frame)
+        return json.loads(frame)
+
+    async def drive_room(
+        self, clients: list[WebsocketCommunicator], messages: int,
+        latencies: list[float], sizes: list[int],
+    ) -> int:
+        sender = clients[0]
+        delivered = 0
+        for _ in range(messages):
+            sent = time.perf_counter()
+            await sender.send_json_to({"text": str(sent)})
+            for client in clients:
+                frame = await client.receive_from(timeout=10)
+                latencies.append(
+                    time.perf_counter() - float(self.decode(frame)["text"])
+                )
+                sizes.append(len(frame))
+                delivered += 1
+        return delivered
+
+    async def run_case(
+        self, chat_ids: list[int], clients: int, messages: int, codec: str,
+    ) -> dict:
+        application = JWTAuthMiddlewareStack(
+            URLRouter(websocket_urlpatterns)
+        )
+        by_room: list[list[WebsocketCommunicator]] = []
+        for chat_id in chat_ids:
+            room_clients = []
+            for _ in range(clients):
+                communicator = WebsocketCommunicator(
+                    application, f"/ws/chat/{chat_id}/?token={self.token}",
+                    subprotocols=[CODECS[codec]],
+                )
+                connected, _ = await communicator.connect()
+                assert connected, "consumer rejected the connection"
+                room_clients.append(communicator)
+            by_room.append(room_clients)
+
+        latencies: list[float] = []
+        sizes: list[int] = []
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        delivered = await asyncio.gather(*(
+            self.drive_room(room_clients, messages, latencies, sizes)
+            for room_clients in by_room
+        ))
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+
+        for room_clients in by_room:
+            for communicator in room_clients:
+                # лишних сообщений из чужих комнат быть не должно
+                assert await communicator.receive_nothing(timeout=0.01)
+                await communicator.disconnect()
+        await message_buffer.flush()
+
+        latencies.sort()
+        return {
+            "codec": codec,
+            "rooms": len(chat_ids),
+            "sent": len(chat_ids) * messages,
+            "delivered": sum(delivered),
+            "msg_per_sec": sum(delivered) / elapsed,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+            "frame_bytes": statistics.fmean(sizes),
+            "cpu_us_per_delivery": cpu / sum(delivered) * 1_000_000,
+        }
+
+    def report(self, result: dict):
+        logger.info(
+            f"{result['codec']:>7} rooms={result['rooms']:>4} "
+            f"sent={result['sent']:>6} delivered={result['delivered']:>7} "
+            f"msg/s={result['msg_per_sec']:>10.1f} "
+            f"p50={result['p50_ms']:.2f}ms p99={result['p99_ms']:.2f}ms "
+            f"frame={result['frame_bytes']:.0f}B "
+            f"cpu={result['cpu_us_per_delivery']:.1f}us/delivery"
+        )
+        logger.info(f"write buffer: {message_buffer.stats()}")
+        logger.info(
+            f"token cache: hits={token_cache.hits} misses={token_cache.misses}"
+        )
+        logger.info(f"backpressure: {dict(counters)}")
+
+    def handle(self, *args, **options):
+        rooms = [int(r) for r in options["rooms"].split(",") if r]
+        codecs = list(CODECS) if options["codec"] == "both" \
+            else [options["codec"]]
+        logger.info("Start chat benchmark")
+        for count in rooms:
+            for codec in codecs:
+                chat_ids = self.setup_fixtures(count)
+                case = self.run_case(
+                    chat_ids, options["clients"], options["messages"], codec
+                )
+                # отправитель бенчмарка шлёт подряд, лимит входящих не нужен
+                overrides = {"CHAT_INBOUND_RATE": 0}
+                if not options["redis"]:
+                    # без Redis: кольцевой буфер replay тоже выключен
+                    overrides.update(
+                        CHANNEL_LAYERS=IN_MEMORY_LAYER, CHAT_REPLAY_SIZE=0,
+                    )
+                with override_settings(**overrides):
+                    result = asyncio.run(case)
+                self.report(result)
+                Chat.objects.filter(pk__in=chat_ids).delete()
+        logger.info("Chat benchmark finished")
@@ -0,0 +1,120 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from loguru import logger
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+IN_MEMORY_BACKEND = "channels.layers.InMemoryChannelLayer"
+
+
+class Command(BaseCommand):
+    help = (
+        "Поднимает несколько процессов daphne на общем channel layer и "
+        "гоняет script.py по всем сразу: проверка доставки между "
+        "процессами и масштабирования по числу процессов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=str, default="1,2,4",
+            help="список количеств процессов через запятую",
+        )
+        parser.add_argument("--base-port", type=int, default=8100)
+        parser.add_argument(
+            "--rooms", type=str, required=True,
+            help="id существующих чатов через запятую",
+        )
+        parser.add_argument("--token", required=True, help="access JWT")
+        parser.add_argument("--clients", type=int, default=400)
+        parser.add_argument("--rate", type=float, default=200.0)
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument(
+            "--protocol", choices=["json", "msgpack"], default="json",
+        )
+
+    def wait_port(self, port: int, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), 1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"daphne on port {port} did not start")
+
+    def start_servers(self, count: int, base_port: int) -> list:
+        servers = []
+        for port in range(base_port, base_port + count):
+            servers.append(subprocess.Popen(
+                [
+                    sys.executable, "-m", "daphne", "-p", str(port),
+                    "settings.asgi:application",
+                ],
+                cwd=settings.BASE_DIR,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            ))
+        for port in range(base_port, base_port + count):
+            self.wait_port(port)
+        return servers
+
+    def run_load(self, ports: range, options: dict) -> dict:
+        urls = ",".join(f"ws://127.0.0.1:{port}" for port in ports)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "result.json")
+            subprocess.run(
+                [
+                    sys.executable, "script.py",
+                    "--url", urls,
+                    "--rooms", options["rooms"],
+                    "--token", options["token"],
+                    "--clients", str(options["clients"]),
+                    "--rate", str(options["rate"]),
+                    "--duration", str(options["duration"]),
+                    "--protocol", options["protocol"],
+                    "--output", output,
+                ],
+                cwd=settings.BASE_DIR,
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            with open(output) as f:
+                return json.load(f)
+
+    def handle(self, *args, **options):
+        backend = settings.CHANNEL_LAYERS["default"]["BACKEND"]
+        if backend == IN_MEMORY_BACKEND:
+            raise CommandError(
+                "in-memory channel layer не доставляет между процессами, "
+                "нужен Redis (уберите CHANNEL_LAYER=memory)"
+            )
+        logger.info("Start cluster benchmark")
+        for count in [int(p) for p in options["processes"].split(",") if p]:
+            servers = self.start_servers(count, options["base_port"])
+            try:
+                result = self.run_load(
+                    range(options["base_port"], options["base_port"] + count),
+                    options,
+                )
+            finally:
+                for server in servers:
+                    server.terminate()
+                for server in servers:
+                    server.wait()
+            logger.info(
+                f"processes={count:>2} connected={result['connected']:>5} "
+                f"sent={result['sent']:>6} received={result['received']:>7} "
+                f"lost={result['lost']:>6} dropped={result['dropped']:>4} "
+                f"msg/s={result['messages_per_sec']:>9.1f} "
+                f"p50={result['latency_ms']['p50']:.1f}ms "
+                f"p99={result['latency_ms']['p99']:.1f}ms"
+            )
+        logger.info("Cluster benchmark finished")
@@ -1,25 +1,178 @@
 # Python
 import rsa
 import os
+import tempfile
+from datetime import datetime
 
 # Django
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db.models import QuerySet
+
+from chats.archive import read_segment, write_segment
+from chats.models import ArchiveSegment, ChatMember, Message
+from chats.utils import (
+    ENVELOPE_PREFIX, key_path, read_data_key, read_keys_from_file,
+    wrap_data_key, reset_key_cache, encrypt_message, decrypt_message,
+)
+
+
+BATCH_SIZE = 1000
 
 
 class Command(BaseCommand):
+    help = (
+        "Создаёт RSA-пару и ключ данных AES для шифрования сообщений. "
+        "Существующие ключи не перезаписываются без --force"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help=(
+                "пересоздать RSA-пару (ключ данных перешифровывается, "
+                "сообщения в старых форматах переводятся на ключи чатов)"
+            ),
+        )
+
+    def path(self, name: str) -> str:
+        return key_path(name)
+
+    def stage(self, content: str) -> str:
+        """Временный файл рядом с ключами, уже на диске (fsync)."""
+        fd, tmp = tempfile.mkstemp(dir=settings.KEYS_PATH, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp
+
+    def commit(self, tmp: str, name: str):
+        os.replace(tmp, self.path(name))
+        self.sync_dir()
+
+    def write(self, name: str, content: str):
+        self.commit(self.stage(content), name)
+
+    def remove(self, name: str):
+        if os.path.exists(self.path(name)):
+            os.remove(self.path(name))
+            self.sync_dir()
+
+    def sync_dir(self):
+        # переименование долговечно только после fsync каталога
+        fd = os.open(settings.KEYS_PATH, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def finish_rotation(self, data_key: bytes):
+        """
+        Прошлая ротация прервалась: data и public доводятся до текущего
+        private (public меняется последним и может быть старым), только
+        потом private_old можно перезаписать.
+        """
+        private = rsa.PrivateKey.load_pkcs1(
+            read_keys_from_file(file="private").encode("utf-8")
+        )
+        public = rsa.PublicKey(private.n, private.e)
+        self.write("data", wrap_data_key(data_key, public))
+        self.write("public", public.save_pkcs1().decode("utf-8"))
+        self.remove("private_old")
+
     def generate(self):
+        """
+        Файлы ключей меняются атомарно (временный файл + os.replace).
+        Прежний private сохраняется в private_old, пока data не обёрнут
+        новым ключом: сбой между заменами не оставит ключ данных без
+        закрытого ключа, read_data_key возьмёт private_old.
+        """
+        data_key = None
+        if os.path.exists(self.path("data")):
+            # сохраняем ключ данных, иначе старые сообщения не расшифровать
+            reset_key_cache()
+            data_key = read_data_key()
+            if os.path.exists(self.path("private_old")):
+                self.finish_rotation(data_key)
         public_key, private_key = rsa.newkeys(nbits=2048)
-        private_key_str = private_key.save_pkcs1().decode("utf-8")
-        public_key_str = public_key.save_pkcs1().decode("utf-8")
-        with open(f"{settings.KEYS_PATH}/public.txt", "w") as public:
-            public.write(public_key_str)
-        with open(f"{settings.KEYS_PATH}/private.txt", "w") as private:
-            private.write(private_key_str)
+        staged = {
+            "private": self.stage(private_key.save_pkcs1().decode("utf-8")),
+            "public": self.stage(public_key.save_pkcs1().decode("utf-8")),
+        }
+        if data_key is not None:
+            staged["data"] = self.stage(wrap_data_key(data_key, public_key))
+            self.write("private_old", read_keys_from_file(file="private"))
+        for name in ("private", "data", "public"):
+            if name in staged:
+                self.commit(staged[name], name)
+        self.remove("private_old")
         print("Keys created!")
 
+    def generate_data_key(self):
+        public_key = rsa.PublicKey.load_pkcs1(
+            read_keys_from_file(file="public").encode("utf-8")
+        )
+        data_key = os.urandom(32)
+        self.write("data", wrap_data_key(data_key, public_key))
+        print("Data key created!")
+
+    def reencrypt(self):
+        """
+        Голый RSA расшифровывается только старой RSA-парой, поэтому до
+        ротации такие сообщения (и v1 общим ключом) переводятся на ключи чатов.
+        """
+        reset_key_cache()
+        messages = self.reencrypt_rows(Message.objects.all(), "text")
+        previews = self.reencrypt_rows(
+            ChatMember.objects.exclude(last_message_preview=""),
+            "last_message_preview",
+        )
+        segments = sum(
+            map(self.reencrypt_segment, ArchiveSegment.objects.iterator())
+        )
+        print(
+            f"Re-encrypted {messages} messages, {previews} previews, "
+            f"{segments} archive segments"
+        )
+
+    def reencrypt_rows(self, queryset: QuerySet, field: str) -> int:
+        stale = queryset.exclude(
+            **{f"{field}__startswith": ENVELOPE_PREFIX}
+        ).only("id", "chat_id", field).order_by("id")
+        done, last_id = 0, 0
+        while batch := list(stale.filter(id__gt=last_id)[:BATCH_SIZE]):
+            for row in batch:
+                text = decrypt_message(getattr(row, field), row.chat_id)
+                setattr(row, field, encrypt_message(text, row.chat_id))
+            queryset.model.objects.bulk_update(batch, [field])
+            done += len(batch)
+            last_id = batch[-1].pk
+        return done
+
+    def reencrypt_segment(self, segment: ArchiveSegment) -> bool:
+        rows = list(read_segment(segment))
+        if all(row["text"].startswith(ENVELOPE_PREFIX) for row in rows):
+            return False
+        for row in rows:
+            text = decrypt_message(row["text"], segment.chat_id)
+            row["text"] = encrypt_message(text, segment.chat_id)
+            row["sent_at"] = datetime.fromisoformat(row["sent_at"])
+        # тот же путь: файл сегмента подменяется атомарно
+        write_segment(segment.chat_id, rows)
+        return True
+
     def handle(self, *args, **options):
         os.makedirs(settings.KEYS_PATH, exist_ok=True)
         print("Start Generate Keys")
-        self.generate()
+        has_keys = os.path.exists(self.path("private"))
+        if has_keys and not os.path.exists(self.path("data")):
+            self.generate_data_key()
+        if has_keys and options["force"]:
+            self.reencrypt()
+        if options["force"] or not has_keys:
+            self.generate()
+        if not os.path.exists(self.path("data")):
+            self.generate_data_key()
+        reset_key_cache()
         print("Keys generated successfully")
@@ -0,0 +1,95 @@
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from loguru import logger
+from redis.exceptions import RedisError
+
+from chats.models import ChatMember
+from common.lru import ExpiringLRU
+from common.redis_client import get_async_client, get_sync_client
+
+
+# Участники чата: Redis set на все процессы + копия в памяти процесса.
+# Проверка на каждый кадр — поиск в памяти; копия живёт
+# CHAT_MEMBERSHIP_LOCAL_TTL секунд, Redis set устаревает по сигналам
+# (chats.signals) при изменении Chat.users, так что исключённый
+# участник теряет доступ не позже чем через локальный TTL.
+# Ключ множества версионирован поколением чата: invalidate только
+# увеличивает поколение, и читатель, загрузивший из БД старый состав
+# до коммита изменения, запишет его под старым поколением, которое
+# уже никто не читает (классическая гонка cache-aside).
+MEMBERS_KEY = "chat:members:{chat_id}:"
+GENERATION_KEY = "chat:members:gen:{chat_id}"
+# пустое множество в Redis не хранится, поэтому всегда кладём маркер
+EMPTY_MARKER = 0
+
+# поколение и множество этого поколения за один запрос
+READ_SCRIPT = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+return {generation, redis.call('SMEMBERS', ARGV[1] .. generation)}
+"""
+
+local_cache = ExpiringLRU(settings.CHAT_MEMBERSHIP_CACHE_SIZE)
+
+
+@database_sync_to_async
+def load_members(chat_id: int) -> frozenset[int]:
+    return frozenset(
+        ChatMember.objects.filter(chat_id=chat_id)
+        .values_list("user_id", flat=True)
+    )
+
+
+async def fetch_members(chat_id: int) -> frozenset[int]:
+    prefix = MEMBERS_KEY.format(chat_id=chat_id)
+    client = get_async_client()
+    read = client.register_script(READ_SCRIPT)
+    try:
+        generation, cached = await read(
+            keys=[GENERATION_KEY.format(chat_id=chat_id)], args=[prefix]
+        )
+    except RedisError as e:
+        logger.warning(f"Membership cache unavailable: {e}")
+        return await load_members(chat_id)
+    if cached:
+        return frozenset(int(user_id) for user_id in cached) - {EMPTY_MARKER}
+    members = await load_members(chat_id)
+    key = prefix + generation.decode()
+    try:
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.sadd(key, EMPTY_MARKER, *members)
+            pipe.expire(key, settings.CHAT_MEMBERSHIP_TTL)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Membership cache unavailable: {e}")
+    return members
+
+
+async def members(chat_id: int) -> frozenset[int]:
+    chat_members = local_cache.get(chat_id)
+    if chat_members is None:
+        chat_members = await fetch_members(chat_id)
+        local_cache.set(
+            chat_id, chat_members,
+            time.time() + settings.CHAT_MEMBERSHIP_LOCAL_TTL,
+        )
+    return chat_members
+
+
+async def is_member(chat_id: int, user_id: int) -> bool:
+    return user_id in await members(chat_id)
+
+
+def invalidate(*chat_ids: int):
+    for chat_id in chat_ids:
+        local_cache.pop(chat_id)
+    if not chat_ids:
+        return
+    try:
+        with get_sync_client().pipeline(transaction=False) as pipe:
+            for chat_id in chat_ids:
+                pipe.incr(GENERATION_KEY.format(chat_id=chat_id))
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Membership cache unavailable: {e}")
@@ -0,0 +1,80 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from loguru import logger
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from common.lru import ExpiringLRU
+
+
+# токен -> пользователь. Запись живёт не дольше самого токена (exp),
+# поэтому кеш не продлевает доступ, а только экономит проверку подписи
+# и запрос пользователя при массовых переподключениях.
+token_cache = ExpiringLRU(settings.CHAT_WS_TOKEN_CACHE_SIZE)
+
+
+def get_raw_token(scope: dict) -> str | None:
+    """
+    Браузер не умеет ставить заголовки на websocket, поэтому токен
+    берётся из ?token=..., а для остальных клиентов — из Authorization.
+    """
+    query = parse_qs(scope.get("query_string", b"").decode())
+    if query.get("token"):
+        return query["token"][0]
+    headers = dict(scope.get("headers", []))
+    parts = headers.get(b"authorization", b"").decode().split()
+    if len(parts) == 2 and parts[0] in api_settings.AUTH_HEADER_TYPES:
+        return parts[1]
+    return None
+
+
+@database_sync_to_async
+def get_user(user_id):
+    User = get_user_model()
+    try:
+        user = User.objects.only("id", "username", "is_active").get(
+            **{api_settings.USER_ID_FIELD: user_id}
+        )
+    except User.DoesNotExist:
+        return None
+    return user if user.is_active else None
+
+
+async def resolve_user(raw_token: str):
+    user = token_cache.get(raw_token)
+    if user is not None:
+        return user
+    try:
+        token = AccessToken(raw_token)
+    except TokenError as e:
+        logger.debug(f"Bad websocket token: {e}")
+        return None
+    user = await get_user(token[api_settings.USER_ID_CLAIM])
+    if user is not None:
+        token_cache.set(raw_token, user, token["exp"])
+    return user
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Проверяет access-токен SimpleJWT один раз при подключении
+    и кладёт пользователя в scope["user"] (AnonymousUser, если токена
+    нет или он невалиден). Кадры после этого идентичность не несут.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        raw_token = get_raw_token(scope)
+        user = await resolve_user(raw_token) if raw_token else None
+        scope["user"] = user or AnonymousUser()
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    return JWTAuthMiddleware(inner)
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_last_message(apps, schema_editor):
+    ChatMember = apps.get_model("chats", "ChatMember")
+    Message = apps.get_model("chats", "Message")
+    chat_ids = ChatMember.objects.values_list("chat_id", flat=True).distinct()
+    for chat_id in chat_ids:
+        last = Message.objects.filter(chat_id=chat_id).order_by("-id").first()
+        if last is None:
+            continue
+        ChatMember.objects.filter(chat_id=chat_id).update(
+            last_message_id=last.id,
+            last_message_at=last.sent_at,
+            last_read_message_id=last.id,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0003_message_chat_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # таблица chats_chat_users уже существует как неявная M2M,
+        # поэтому меняем только состояние, а новые колонки добавляем ниже
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ChatMember',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='chats.chat', verbose_name='чат')),
+                        ('user', models.ForeignKey(db_column='client_id', on_delete=django.db.models.deletion.CASCADE, related_name='chat_memberships', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+                    ],
+                    options={
+                        'verbose_name': 'участник чата',
+                        'verbose_name_plural': 'участники чатов',
+                        'db_table': 'chats_chat_users',
+                        'ordering': ('id',),
+                        'unique_together': {('chat', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='chat',
+                    name='users',
+                    field=models.ManyToManyField(related_name='users_chats', through='chats.ChatMember', to=settings.AUTH_USER_MODEL, verbose_name='пользователи'),
+                ),
+            ],
+            database_operations=[],
+        ),
+        migrations.AddField(
+            model_name='chatmember',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0, verbose_name='последнее прочитанное сообщение'),
+        ),
+        migrations.AddField(
+            model_name='chatmember',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='непрочитанные'),
+        ),
+        migrations.AddField(
+            model_name='chatmember',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='последнее сообщение'),
+        ),
+        migrations.AddField(
+            model_name='chatmember',
+            name='last_message_preview',
+            field=models.TextField(blank=True, verbose_name='превью последнего сообщения (зашифровано)'),
+        ),
+        migrations.AddField(
+            model_name='chatmember',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='время последнего сообщения'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmember',
+            index=models.Index(fields=['user', '-last_message_at'], name='chatmember_user_last_msg_idx'),
+        ),
+        migrations.RunPython(fill_last_message, migrations.RunPython.noop),
+    ]
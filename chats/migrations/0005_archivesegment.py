@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0004_chatmember'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.BigIntegerField(verbose_name='первое сообщение')),
+                ('last_id', models.BigIntegerField(verbose_name='последнее сообщение')),
+                ('count', models.PositiveIntegerField(verbose_name='сообщений')),
+                ('first_sent_at', models.DateTimeField(verbose_name='отправлено с')),
+                ('last_sent_at', models.DateTimeField(verbose_name='отправлено по')),
+                ('path', models.CharField(max_length=255, verbose_name='файл (от MEDIA_ROOT)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создан')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_segments', to='chats.chat', verbose_name='чат')),
+            ],
+            options={
+                'verbose_name': 'сегмент архива',
+                'verbose_name_plural': 'сегменты архива',
+                'ordering': ('chat', 'first_id'),
+                'indexes': [models.Index(fields=['chat', 'last_id'], name='archive_chat_last_id_idx')],
+            },
+        ),
+    ]
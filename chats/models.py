@@ -11,6 +11,7 @@ class Chat(models.Model):
     )
     users = models.ManyToManyField(
         to="users.Client",
+        through="ChatMember",
         related_name="users_chats",
         verbose_name="пользователи",
     )
@@ -50,6 +51,8 @@ class Message(models.Model):
         verbose_name="чат",
         on_delete=models.CASCADE,
         related_name="chat_messages",
+        # индекс покрывается составным (chat, id) из Meta.indexes
+        db_index=False,
     )
     sent_at = models.DateTimeField(
         auto_now_add=True, verbose_name="отправлено"
@@ -67,9 +70,103 @@ class Message(models.Model):
         ordering = ("id",)
         verbose_name = "сообщение"
         verbose_name_plural = "сообщения"
+        indexes = [
+            models.Index(fields=["chat", "id"], name="message_chat_id_idx"),
+        ]
 
     def __str__(self):
         return (
             f"{self.text[:20]} | {self.sender} "
             f"| {self.sent_at} | {self.chat}"
         )
+
+
+class ChatMember(models.Model):
+    """
+    Участник чата (бывшая неявная таблица Chat.users).
+    Счётчик непрочитанных и последнее сообщение поддерживаются
+    инкрементально при записи сообщений (chats.buffer) и при прочтении,
+    поэтому список чатов пользователя — один запрос по индексу.
+    """
+    chat = models.ForeignKey(
+        to=Chat,
+        on_delete=models.CASCADE,
+        related_name="members",
+        verbose_name="чат",
+    )
+    user = models.ForeignKey(
+        to="users.Client",
+        on_delete=models.CASCADE,
+        related_name="chat_memberships",
+        verbose_name="пользователь",
+        db_column="client_id",
+    )
+    last_read_message_id = models.BigIntegerField(
+        verbose_name="последнее прочитанное сообщение", default=0
+    )
+    unread_count = models.PositiveIntegerField(
+        verbose_name="непрочитанные", default=0
+    )
+    last_message_id = models.BigIntegerField(
+        verbose_name="последнее сообщение", null=True, blank=True
+    )
+    last_message_preview = models.TextField(
+        verbose_name="превью последнего сообщения (зашифровано)", blank=True
+    )
+    last_message_at = models.DateTimeField(
+        verbose_name="время последнего сообщения", null=True, blank=True
+    )
+
+    class Meta:
+        db_table = "chats_chat_users"
+        ordering = ("id",)
+        verbose_name = "участник чата"
+        verbose_name_plural = "участники чатов"
+        unique_together = (("chat", "user"),)
+        indexes = [
+            models.Index(
+                fields=["user", "-last_message_at"],
+                name="chatmember_user_last_msg_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.chat_id} | {self.user_id} | {self.unread_count}"
+
+
+class ArchiveSegment(models.Model):
+    """
+    Индекс сегмента архива: gzip NDJSON со старыми сообщениями чата
+    c id от first_id до last_id (см. chats.archive). Сегменты чата
+    не пересекаются и все старше любого сообщения в таблице Message.
+    """
+    chat = models.ForeignKey(
+        to=Chat,
+        on_delete=models.CASCADE,
+        related_name="archive_segments",
+        verbose_name="чат",
+    )
+    first_id = models.BigIntegerField(verbose_name="первое сообщение")
+    last_id = models.BigIntegerField(verbose_name="последнее сообщение")
+    count = models.PositiveIntegerField(verbose_name="сообщений")
+    first_sent_at = models.DateTimeField(verbose_name="отправлено с")
+    last_sent_at = models.DateTimeField(verbose_name="отправлено по")
+    path = models.CharField(
+        verbose_name="файл (от MEDIA_ROOT)", max_length=255
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name="создан"
+    )
+
+    class Meta:
+        ordering = ("chat", "first_id")
+        verbose_name = "сегмент архива"
+        verbose_name_plural = "сегменты архива"
+        indexes = [
+            models.Index(
+                fields=["chat", "last_id"], name="archive_chat_last_id_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.chat_id} | {self.first_id}-{self.last_id}"
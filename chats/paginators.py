@@ -0,0 +1,37 @@
+from chats import archive
+from common.paginators import KeysetPagination
+
+
+class ChatHistoryPagination(KeysetPagination):
+    """
+    KeysetPagination по Message, продолженная в холодный архив чата.
+    Архив целиком старше таблицы, поэтому страница — это хвост архива
+    и затем строки Message; файлы читаются, только когда таблицы не хватило.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None) -> list:
+        page = super().paginate_queryset(queryset, request, view)
+        chat_id = int(view.kwargs["chat_pk"])
+        limit = self.get_page_size(request)
+        after_id = self.get_int_param(request, "after_id")
+        if after_id is not None:
+            archived = archive.read_after(chat_id, after_id, limit + 1)
+            page = archived + page
+            self.has_more = self.has_more or len(page) > limit
+            page = page[:limit]
+        elif not self.has_more:
+            # таблица кончилась: добираем страницу из архива
+            need = limit - len(page)
+            before_id = page[0].pk if page \
+                else self.get_int_param(request, "before_id")
+            if need:
+                archived = archive.read_before(chat_id, before_id, need + 1)
+                self.has_more = len(archived) > need
+                page = archived[-need:] + page
+            else:
+                self.has_more = archive.has_before(chat_id, before_id)
+        else:
+            return page
+        archive.attach_senders([m for m in page if m._state.adding])
+        self.page = page
+        return page
@@ -0,0 +1,101 @@
+import time
+import uuid
+from typing import Iterable
+
+from django.conf import settings
+
+from common.redis_client import get_async_client, get_sync_client
+
+
+# Кто онлайн: sorted set, member = user_id, score = время последнего heartbeat.
+# Устаревшие записи чистит ExpirePresenceTask, а при чтении они
+# отбрасываются по score, так что точность не зависит от частоты чистки.
+PRESENCE_KEY = "presence:online"
+TYPING_USERS_KEY = "typing:users:{chat_id}"
+TYPING_LOCK_KEY = "typing:lock:{chat_id}"
+
+# Хвост окна typing: забирает тех, кто печатал, пока окно было закрыто,
+# и открывает следующее окно. Срабатывает, только если окно свободно
+# или всё ещё принадлежит вызывающему (ARGV[2] — его токен).
+FLUSH_TYPING_SCRIPT = """
+local owner = redis.call('GET', KEYS[2])
+if owner and owner ~= ARGV[2] then
+    return false
+end
+if redis.call('SCARD', KEYS[1]) == 0 then
+    return false
+end
+redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[1])
+local users = redis.call('SMEMBERS', KEYS[1])
+redis.call('DEL', KEYS[1])
+return users
+"""
+
+
+async def touch(user_id: int):
+    await get_async_client().zadd(PRESENCE_KEY, {user_id: time.time()})
+
+
+async def typing(
+    chat_id: int, user_id: int
+) -> tuple[list[int], str] | None:
+    """
+    Копит печатающих в комнате и не чаще раза в CHAT_TYPING_INTERVAL_MS
+    отдаёт их список для рассылки и токен открытого окна. None — окно
+    ещё не закрыто, пользователь попадёт в рассылку по его окончании
+    (flush_typing у того, кто окно открыл).
+    """
+    client = get_async_client()
+    users_key = TYPING_USERS_KEY.format(chat_id=chat_id)
+    interval = settings.CHAT_TYPING_INTERVAL_MS
+    token = uuid.uuid4().hex
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.sadd(users_key, user_id)
+        pipe.pexpire(users_key, interval * 2)
+        pipe.set(
+            TYPING_LOCK_KEY.format(chat_id=chat_id),
+            token, nx=True, px=interval,
+        )
+        *_, acquired = await pipe.execute()
+    if not acquired:
+        return None
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.smembers(users_key)
+        pipe.delete(users_key)
+        users, _ = await pipe.execute()
+    return sorted(int(user) for user in users), token
+
+
+async def flush_typing(chat_id: int, token: str) -> list[int] | None:
+    """Рассылка по окончании окна token; None — рассылать некого."""
+    flush = get_async_client().register_script(FLUSH_TYPING_SCRIPT)
+    users = await flush(
+        keys=[
+            TYPING_USERS_KEY.format(chat_id=chat_id),
+            TYPING_LOCK_KEY.format(chat_id=chat_id),
+        ],
+        args=[settings.CHAT_TYPING_INTERVAL_MS, token],
+    )
+    if not users:
+        return None
+    return sorted(int(user) for user in users)
+
+
+def online_users(user_ids: Iterable[int]) -> set[int]:
+    """Кто из переданных пользователей онлайн — один ZMSCORE."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    scores = get_sync_client().zmscore(PRESENCE_KEY, user_ids)
+    alive_since = time.time() - settings.CHAT_PRESENCE_TTL
+    return {
+        user_id for user_id, score in zip(user_ids, scores)
+        if score is not None and score >= alive_since
+    }
+
+
+def expire() -> int:
+    alive_since = time.time() - settings.CHAT_PRESENCE_TTL
+    return get_sync_client().zremrangebyscore(
+        PRESENCE_KEY, "-inf", alive_since
+    )
@@ -0,0 +1,77 @@
+import json
+import re
+
+from django.conf import settings
+
+from common.redis_client import get_async_client
+
+
+# Последние CHAT_REPLAY_SIZE рассылок комнаты в Redis stream.
+# id записи стрима — курсор: он уходит клиенту полем "seq",
+# а при переподключении возвращается в ?resume_from=<seq>.
+# Живёт в том же Redis, что и присутствие: это такое же эфемерное состояние.
+REPLAY_KEY = "chat:replay:{chat_id}"
+SEQ_RE = re.compile(r"^\d{1,20}-\d{1,20}$")
+
+# Запись помнит id предыдущей (поле p): разрыв после seq есть, только
+# если первая оставшаяся запись после него ссылается не на seq.
+# Приблизительная обрезка (~) не перестраивает стрим на каждом XADD.
+APPEND_SCRIPT = """
+local last = redis.call('XREVRANGE', KEYS[1], '+', '-', 'COUNT', 1)
+local prev = ''
+if last[1] then
+    prev = last[1][1]
+end
+local seq = redis.call(
+    'XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'e', ARGV[1], 'p', prev
+)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return seq
+"""
+
+
+def parse_seq(seq: str | None) -> tuple[int, int] | None:
+    if not seq or not SEQ_RE.match(seq):
+        return None
+    ms, counter = seq.split("-")
+    return int(ms), int(counter)
+
+
+async def append(chat_id: int, payload_json: str) -> str:
+    """Добавляет рассылку в кольцевой буфер комнаты и возвращает её seq."""
+    append_entry = get_async_client().register_script(APPEND_SCRIPT)
+    seq = await append_entry(
+        keys=[REPLAY_KEY.format(chat_id=chat_id)],
+        args=[payload_json, settings.CHAT_REPLAY_SIZE, settings.CHAT_REPLAY_TTL],
+    )
+    return seq.decode()
+
+
+async def since(chat_id: int, seq: str) -> tuple[list[dict], bool]:
+    """
+    Рассылки после seq и флаг разрыва: True, если часть пропущенного
+    уже вытеснена из буфера и клиенту нужно догрузить историю из API.
+    """
+    key = REPLAY_KEY.format(chat_id=chat_id)
+    limit = settings.CHAT_REPLAY_SIZE
+    async with get_async_client().pipeline(transaction=False) as pipe:
+        pipe.exists(key)
+        # с конца: при обрезке по ~ записей бывает больше limit,
+        # и отдать нужно самые свежие
+        pipe.xrevrange(key, max="+", min=f"({seq}", count=limit + 1)
+        exists, entries = await pipe.execute()
+    # пустой стрим при известном seq — буфер истёк по TTL целиком
+    gap = not exists
+    if len(entries) > limit:
+        entries = entries[:limit]
+        gap = True
+    elif entries:
+        # запись сразу после seq; без p — записана до появления поля
+        _, fields = entries[-1]
+        gap = fields.get(b"p") != seq.encode()
+    events = []
+    for entry_id, fields in reversed(entries):
+        payload = json.loads(fields[b"e"])
+        payload["seq"] = entry_id.decode()
+        events.append(payload)
+    return events, gap
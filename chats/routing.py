@@ -1,9 +1,30 @@
+from django.conf import settings
 from django.urls import re_path
 
-from chats.consumer import ChatConsumer
+from chats.consumer import (
+    BroadcastChatConsumer, ChatConsumer, MultiplexChatConsumer,
+)
+
+
+class ChatLayerRouter:
+    """
+    Выбирает channel layer по комнате. Все подключения одной комнаты
+    обязаны попасть в один layer, поэтому решение зависит только от chat_id.
+    """
+
+    def __init__(self):
+        self.default = ChatConsumer.as_asgi()
+        self.broadcast = BroadcastChatConsumer.as_asgi()
+
+    async def __call__(self, scope, receive, send):
+        chat_id = int(scope["url_route"]["kwargs"]["chat_id"])
+        if chat_id in settings.CHAT_BROADCAST_ROOMS:
+            return await self.broadcast(scope, receive, send)
+        return await self.default(scope, receive, send)
 
 
 websocket_urlpatterns = [
-    re_path(r"ws/chat/(?P<room_name>\w+)/$", 
-    ChatConsumer.as_asgi()),
+    re_path(r"ws/chat/(?P<chat_id>\d{1,18})/$",
+    ChatLayerRouter()),
+    re_path(r"ws/$", MultiplexChatConsumer.as_asgi()),
 ]
@@ -1,3 +1,47 @@
+from rest_framework import serializers
+
+from chats.models import ChatMember, Message
+from users.serializers import FriendSerializer
+
+
+class MessageHistorySerializer(serializers.ModelSerializer):
+    """text должен быть уже расшифрован (см. chats.utils.decrypt_messages)."""
+    sender = FriendSerializer(read_only=True)
+
+    class Meta:
+        model = Message
+        fields = [
+            "id",
+            "text",
+            "parent",
+            "sender",
+            "sent_at",
+        ]
+
+
+class ChatMemberSerializer(serializers.ModelSerializer):
+    """last_message_preview должен быть уже расшифрован."""
+    title = serializers.CharField(source="chat.title", read_only=True)
+    is_group = serializers.BooleanField(source="chat.is_group", read_only=True)
+
+    class Meta:
+        model = ChatMember
+        fields = [
+            "chat",
+            "title",
+            "is_group",
+            "unread_count",
+            "last_read_message_id",
+            "last_message_id",
+            "last_message_preview",
+            "last_message_at",
+        ]
+
+
+class ChatReadSerializer(serializers.Serializer):
+    message_id = serializers.IntegerField(min_value=1)
+
+
 # from rest_framework import serializers
 
 # from chats.utils import encrypt_message, decrypt_message
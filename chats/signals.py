@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from chats import archive, membership
+from chats.models import ArchiveSegment, Chat, ChatMember
+
+
+def invalidate_on_commit(*chat_ids: int):
+    # после коммита: иначе консьюмер успеет перечитать старый состав из БД
+    transaction.on_commit(lambda: membership.invalidate(*chat_ids))
+
+
+@receiver(signal=m2m_changed, sender=Chat.users.through)
+def chat_users_changed(
+    instance, action: str, reverse: bool, pk_set: set | None, **kwargs
+):
+    if not reverse:
+        # chat.users.add/remove/clear
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_on_commit(instance.pk)
+        return
+    # user.users_chats.add/remove/clear: pk_set — id чатов
+    if action == "pre_clear":
+        instance._cleared_chat_ids = list(
+            instance.users_chats.values_list("id", flat=True)
+        )
+    elif action == "post_clear":
+        invalidate_on_commit(*getattr(instance, "_cleared_chat_ids", []))
+    elif action in ("post_add", "post_remove"):
+        invalidate_on_commit(*pk_set)
+
+
+@receiver(signal=post_save, sender=ChatMember)
+def chat_member_created(instance: ChatMember, created: bool, **kwargs):
+    # обычные save() меняют только счётчики и last_read, не состав
+    if created:
+        invalidate_on_commit(instance.chat_id)
+
+
+@receiver(signal=post_delete, sender=ChatMember)
+def chat_member_deleted(instance: ChatMember, **kwargs):
+    invalidate_on_commit(instance.chat_id)
+
+
+@receiver(signal=post_delete, sender=ArchiveSegment)
+def archive_segment_deleted(instance: ArchiveSegment, **kwargs):
+    # удаление чата каскадом удаляет сегменты, файлы уходят вместе с ними
+    transaction.on_commit(
+        lambda: archive.remove_segment_files(instance.path)
+    )
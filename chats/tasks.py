@@ -0,0 +1,22 @@
+from celery import Task
+
+from chats import archive, presence
+from settings import celery_app
+
+
+class ExpirePresenceTask(Task):
+    name = "expire-presence"
+
+    def run(self):
+        return presence.expire()
+
+
+class ArchiveMessagesTask(Task):
+    name = "archive-messages"
+
+    def run(self):
+        return archive.archive_messages()
+
+
+celery_app.register_task(task=ExpirePresenceTask())
+celery_app.register_task(task=ArchiveMessagesTask())
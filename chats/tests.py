@@ -1,3 +1,774 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+import rsa
+from asgiref.sync import async_to_sync
+from cryptography.exceptions import InvalidTag
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chats import archive, membership, replay
+from chats.backpressure import (
+    COALESCE, DISCONNECT, DROP_OLDEST, SendQueue, TokenBucket, counters,
+)
+from chats.buffer import MessageWriteBuffer
+from chats.management.commands.generate_rsa import (
+    Command as GenerateKeysCommand,
+)
+from chats.consumer import (
+    MAX_TEXT_LENGTH, BaseChatConsumer, ChatConsumer, MultiplexChatConsumer,
+)
+from chats.framing import (
+    SUBPROTOCOL_JSON, SUBPROTOCOL_MSGPACK, FrameError, choose_subprotocol,
+    decode_frame, encode_event, message_text,
+)
+from chats.middleware import (
+    get_raw_token, get_user, resolve_user, token_cache,
+)
+from chats.models import Chat, ChatMember, Message
+from chats.utils import (
+    decrypt_message, decrypt_messages, encrypt_message, key_path,
+    load_public_key, reset_key_cache,
+)
+from common.redis_client import get_sync_client
+from users.models import Client
+
+
+class KeysMixin:
+    """Свежие RSA-пара и ключ данных во временном KEYS_PATH."""
+
+    @classmethod
+    def setUpClass(cls):
+        # до super(): setUpTestData уже шифрует сообщения
+        cls.keys_path = tempfile.mkdtemp()
+        cls.keys_settings = override_settings(KEYS_PATH=cls.keys_path)
+        cls.keys_settings.enable()
+        call_command("generate_rsa")
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.keys_settings.disable()
+        shutil.rmtree(cls.keys_path)
+        reset_key_cache()
+
+
+class ChatDataMixin:
+
+    @classmethod
+    def setUpTestData(cls):
+        with mock.patch("users.signals.ActivateAccountTask.apply_async"):
+            cls.users = [
+                Client.objects.create(
+                    username=f"user{i}", email=f"user{i}@test.local"
+                )
+                for i in range(2)
+            ]
+        cls.chats = [Chat.objects.create() for _ in range(2)]
+        for chat in cls.chats:
+            for user in cls.users:
+                ChatMember.objects.create(chat=chat, user=user)
+
+
+class MessageWriteBufferTest(KeysMixin, ChatDataMixin, TestCase):
+
+    def setUp(self):
+        self.buffer = MessageWriteBuffer(batch_size=100, flush_interval=1)
+
+    def message(self, chat: Chat, text) -> Message:
+        return Message(chat=chat, sender=self.users[0], text=text)
+
+    def saved_texts(self) -> list[str]:
+        return [
+            decrypt_message(text, chat_id)
+            for chat_id, text in Message.objects.order_by("id").values_list(
+                "chat_id", "text"
+            )
+        ]
+
+    def unread(self, chat: Chat) -> int:
+        return ChatMember.objects.get(chat=chat, user=self.users[1]).unread_count
+
+    def test_bad_message_is_dropped_alone(self):
+        first, second = self.chats
+        self.buffer._write([
+            self.message(first, "hello"),
+            self.message(first, 5),
+            self.message(second, "hi"),
+        ])
+        self.assertEqual(self.saved_texts(), ["hello", "hi"])
+        self.assertEqual(self.buffer.stats()["flushed"], 2)
+        self.assertEqual(self.buffer.stats()["failed"], 1)
+        self.assertEqual(self.unread(first), 1)
+
+    def test_failed_insert_is_retried_per_chat_then_per_row(self):
+        first, second = self.chats
+        poison = self.message(second, "boom")
+        bulk_create = Message.objects.bulk_create
+
+        def failing_bulk_create(messages, **kwargs):
+            if any(message is poison for message in messages):
+                raise DatabaseError("poison")
+            return bulk_create(messages, **kwargs)
+
+        with mock.patch.object(
+            Message.objects, "bulk_create", side_effect=failing_bulk_create
+        ):
+            self.buffer._write([
+                self.message(first, "a"),
+                self.message(second, "b"),
+                poison,
+                self.message(first, "c"),
+            ])
+        self.assertEqual(self.saved_texts(), ["a", "c", "b"])
+        self.assertEqual(self.buffer.stats()["flushed"], 3)
+        self.assertEqual(self.buffer.stats()["failed"], 1)
+        self.assertEqual((self.unread(first), self.unread(second)), (2, 1))
+
+
+    def test_stats_count_flushes(self):
+        first, second = self.chats
+        self.buffer._write([self.message(first, "a"), self.message(first, 1)])
+        self.buffer._pending.append(self.message(second, "queued"))
+        stats = self.buffer.stats()
+        self.assertEqual(
+            (stats["queue_depth"], stats["flushes"], stats["flushed"],
+             stats["failed"]),
+            (1, 1, 1, 1),
+        )
+        self.buffer._write([self.message(second, "b")])
+        stats = self.buffer.stats()
+        self.assertEqual((stats["flushes"], stats["flushed"]), (2, 2))
+        self.assertGreater(stats["last_flush_ms"], 0)
+        self.assertGreaterEqual(stats["max_flush_ms"], stats["last_flush_ms"])
+
+    def test_stats_endpoint_is_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        url = reverse("chats-buffer-stats")
+        self.assertEqual(client.get(url).status_code, 403)
+        admin = self.users[1]
+        admin.is_staff = True
+        admin.save(update_fields=["is_staff"])
+        client.force_authenticate(admin)
+        with mock.patch(
+            "chats.views.message_buffer.stats",
+            return_value={"queue_depth": 0, "flushes": 5},
+        ):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"queue_depth": 0, "flushes": 5})
+
+
+class ChatReadTest(KeysMixin, ChatDataMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.chat = cls.chats[0]
+        cls.sender, cls.reader = cls.users
+        cls.messages = [
+            Message(chat=cls.chat, sender=cls.sender, text=f"m{i}")
+            for i in range(3)
+        ]
+        MessageWriteBuffer(batch_size=100, flush_interval=1)._write(
+            cls.messages
+        )
+
+    def read(self, message_id: int, user: Client | None = None, chat=None):
+        client = APIClient()
+        client.force_authenticate(user or self.reader)
+        return client.post(
+            reverse("chats-read", args=[(chat or self.chat).pk]),
+            {"message_id": message_id},
+            format="json",
+        )
+
+    def member(self) -> ChatMember:
+        return ChatMember.objects.get(chat=self.chat, user=self.reader)
+
+    def test_read_advances_marker_and_recounts_unread(self):
+        self.assertEqual(self.member().unread_count, 3)
+        first, _, last = self.messages
+        response = self.read(first.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            "last_read_message_id": first.pk, "unread_count": 2,
+        })
+        # дальше последнего сообщения маркер не уходит
+        response = self.read(last.pk + 100)
+        self.assertEqual(response.data, {
+            "last_read_message_id": last.pk, "unread_count": 0,
+        })
+        member = self.member()
+        self.assertEqual(
+            (member.last_read_message_id, member.unread_count), (last.pk, 0)
+        )
+
+    def test_read_does_not_move_marker_back(self):
+        first, second, _ = self.messages
+        self.read(second.pk)
+        response = self.read(first.pk)
+        self.assertEqual(response.data, {
+            "last_read_message_id": second.pk, "unread_count": 1,
+        })
+
+    def test_non_member_gets_404(self):
+        with mock.patch("users.signals.ActivateAccountTask.apply_async"):
+            stranger = Client.objects.create(
+                username="stranger", email="stranger@test.local"
+            )
+        response = self.read(self.messages[0].pk, user=stranger)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.read(1, chat=Chat(pk=0)).status_code, 404)
+
+
+class EncryptionTest(KeysMixin, ChatDataMixin, TestCase):
+
+    def test_ciphertext_is_bound_to_its_chat(self):
+        first, second = self.chats
+        encrypted = encrypt_message("secret", first.pk)
+        self.assertEqual(decrypt_messages(first.pk, [encrypted]), ["secret"])
+        with self.assertRaises(InvalidTag):
+            decrypt_message(encrypted, second.pk)
+
+    def test_force_rotation_keeps_legacy_messages_readable(self):
+        chat = self.chats[0]
+        legacy = Message.objects.create(
+            chat=chat, sender=self.users[0],
+            text=rsa.encrypt(b"old", load_public_key()).hex(),
+        )
+        current = Message.objects.create(
+            chat=chat, sender=self.users[0],
+            text=encrypt_message("new", chat.pk),
+        )
+        call_command("generate_rsa", force=True)
+        legacy.refresh_from_db()
+        current.refresh_from_db()
+        self.assertTrue(legacy.text.startswith("v2:"))
+        self.assertEqual(
+            decrypt_messages(chat.pk, [legacy.text, current.text]),
+            ["old", "new"],
+        )
+
+
+    def test_interrupted_rotation_keeps_data_key_readable(self):
+        # сбой после замены private, до замены data: data ещё обёрнут
+        # прежним ключом, он берётся из private_old
+        chat = self.chats[0]
+        text = encrypt_message("new", chat.pk)
+        commit = GenerateKeysCommand.commit
+
+        def fail_on_data(command, tmp, name):
+            if name == "data":
+                raise OSError("No space left on device")
+            commit(command, tmp, name)
+
+        with mock.patch.object(
+            GenerateKeysCommand, "commit", autospec=True,
+            side_effect=fail_on_data,
+        ), self.assertRaises(OSError):
+            call_command("generate_rsa", force=True)
+        reset_key_cache()
+        self.assertTrue(os.path.exists(key_path("private_old")))
+        self.assertEqual(decrypt_message(text, chat.pk), "new")
+        # следующий запуск доводит прерванную ротацию
+        call_command("generate_rsa", force=True)
+        reset_key_cache()
+        self.assertFalse(os.path.exists(key_path("private_old")))
+        self.assertEqual(decrypt_message(text, chat.pk), "new")
+
+
+class FramingTest(SimpleTestCase):
+
+    def test_subprotocol_follows_client_preference(self):
+        self.assertEqual(
+            choose_subprotocol(["x", SUBPROTOCOL_MSGPACK, SUBPROTOCOL_JSON]),
+            SUBPROTOCOL_MSGPACK,
+        )
+        self.assertIsNone(choose_subprotocol(["x"]))
+
+    def test_event_is_encoded_in_both_formats(self):
+        payload = {"type": "message", "text": "привет"}
+        frames = encode_event(payload)
+        self.assertEqual(json.loads(frames["json"]), payload)
+        self.assertEqual(msgpack.unpackb(frames["msgpack"]), payload)
+
+    def test_decode_frame(self):
+        payload = {"type": "typing", "chat": 1}
+        self.assertEqual(decode_frame(json.dumps(payload), None), payload)
+        self.assertEqual(decode_frame(None, msgpack.packb(payload)), payload)
+        for text_data, bytes_data in (
+            ("{", None), ("[1]", None), (None, b"\xc1"), (None, None),
+        ):
+            with self.assertRaises(FrameError):
+                decode_frame(text_data, bytes_data)
+
+    def test_message_text(self):
+        self.assertEqual(message_text({"text": "hi"}, 10), "hi")
+        for text in (None, "", 5, b"hi", ["hi"], "x" * 11):
+            with self.assertRaises(FrameError):
+                message_text({"text": text}, 10)
+
+
+class ChatFrameDispatchTest(SimpleTestCase):
+    """Кадр с неверным text не доходит до буфера записи и рассылки."""
+
+    def setUp(self):
+        self.consumer = ChatConsumer()
+        self.consumer.user_id = 1
+        self.consumer.send_event = mock.AsyncMock()
+        self.consumer.post_message = mock.AsyncMock()
+        patcher = mock.patch(
+            "chats.consumer.membership.is_member",
+            mock.AsyncMock(return_value=True),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def dispatch(self, data: dict):
+        async_to_sync(self.consumer.dispatch_chat_frame)(7, data)
+
+    def test_valid_text_is_posted(self):
+        self.dispatch({"text": "hello"})
+        self.consumer.post_message.assert_awaited_once_with(7, "hello")
+        self.consumer.send_event.assert_not_awaited()
+
+    def test_bad_text_is_rejected_with_error_event(self):
+        for text in (5, b"bytes", "", "x" * (MAX_TEXT_LENGTH + 1)):
+            self.dispatch({"type": "message", "text": text})
+        self.consumer.post_message.assert_not_awaited()
+        self.assertEqual(self.consumer.send_event.await_count, 4)
+        event = self.consumer.send_event.await_args.args[0]
+        self.assertEqual((event["type"], event["chat"]), ("error", 7))
+
+
+class JWTAuthMiddlewareTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        with mock.patch("users.signals.ActivateAccountTask.apply_async"):
+            cls.user = Client.objects.create(
+                username="ws", email="ws@test.local", is_active=True
+            )
+
+    def setUp(self):
+        token_cache.items.clear()
+
+    def test_token_from_query_or_authorization_header(self):
+        self.assertEqual(
+            get_raw_token({"query_string": b"token=abc"}), "abc"
+        )
+        self.assertEqual(
+            get_raw_token({"headers": [(b"authorization", b"Bearer abc")]}),
+            "abc",
+        )
+        self.assertIsNone(
+            get_raw_token({"headers": [(b"authorization", b"Basic abc")]})
+        )
+
+    def test_valid_token_is_checked_once(self):
+        raw_token = str(AccessToken.for_user(self.user))
+        with mock.patch(
+            "chats.middleware.get_user",
+            mock.AsyncMock(return_value=self.user),
+        ) as get_user:
+            for _ in range(2):
+                self.assertEqual(
+                    async_to_sync(resolve_user)(raw_token), self.user
+                )
+        get_user.assert_awaited_once_with(self.user.pk)
+
+    def test_bad_token_or_missing_user_is_not_cached(self):
+        raw_token = str(AccessToken.for_user(self.user))
+        with mock.patch(
+            "chats.middleware.get_user", mock.AsyncMock(return_value=None)
+        ) as get_user:
+            self.assertIsNone(async_to_sync(resolve_user)("garbage"))
+            self.assertIsNone(async_to_sync(resolve_user)(raw_token))
+        get_user.assert_awaited_once()
+        self.assertEqual(len(token_cache.items), 0)
+
+    def test_inactive_user_is_rejected(self):
+        self.assertEqual(get_user.func(self.user.pk), self.user)
+        Client.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(get_user.func(self.user.pk))
+
+
+@override_settings(CHAT_REPLAY_SIZE=3)
+class ReplayTest(SimpleTestCase):
+    """Кольцевой буфер комнаты в Redis (PRESENCE_REDIS_URL)."""
+    chat_id = 10 ** 12
+
+    def tearDown(self):
+        get_sync_client().delete(replay.REPLAY_KEY.format(chat_id=self.chat_id))
+
+    def append(self, n: int) -> list[str]:
+        return [
+            async_to_sync(replay.append)(
+                self.chat_id, json.dumps({"text": str(i)})
+            )
+            for i in range(n)
+        ]
+
+    def since(self, seq: str) -> tuple[list[dict], bool]:
+        return async_to_sync(replay.since)(self.chat_id, seq)
+
+    def test_parse_seq(self):
+        self.assertEqual(replay.parse_seq("17-2"), (17, 2))
+        for seq in (None, "", "17", "a-b", "1-2-3"):
+            self.assertIsNone(replay.parse_seq(seq))
+
+    def test_events_after_seq(self):
+        seqs = self.append(3)
+        events, gap = self.since(seqs[0])
+        self.assertFalse(gap)
+        self.assertEqual(
+            [(event["text"], event["seq"]) for event in events],
+            [("1", seqs[1]), ("2", seqs[2])],
+        )
+        self.assertEqual(self.since(seqs[-1]), ([], False))
+
+    def test_overflow_returns_newest_with_gap(self):
+        seqs = self.append(6)
+        events, gap = self.since(seqs[0])
+        self.assertTrue(gap)
+        self.assertEqual([event["seq"] for event in events], seqs[-3:])
+
+    def test_expired_buffer_is_a_gap(self):
+        self.assertEqual(self.since("1-0"), ([], True))
+
+    def test_trimmed_cursor_without_lost_entries_is_not_a_gap(self):
+        # вытеснена только запись самого курсора: пропущенного нет
+        seqs = self.append(3)
+        key = replay.REPLAY_KEY.format(chat_id=self.chat_id)
+        get_sync_client().xtrim(key, maxlen=2, approximate=False)
+        events, gap = self.since(seqs[0])
+        self.assertFalse(gap)
+        self.assertEqual([event["seq"] for event in events], seqs[1:])
+        get_sync_client().xtrim(key, maxlen=1, approximate=False)
+        events, gap = self.since(seqs[0])
+        self.assertTrue(gap)
+        self.assertEqual([event["seq"] for event in events], seqs[2:])
+
+
+class TokenBucketTest(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch("chats.backpressure.time.monotonic")
+        self.clock = patcher.start()
+        self.clock.return_value = 100.0
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_refill_at_rate(self):
+        bucket = TokenBucket(rate=2, burst=3)
+        self.assertEqual(
+            [bucket.allow() for _ in range(4)], [True, True, True, False]
+        )
+        self.clock.return_value += 0.5
+        self.assertEqual([bucket.allow(), bucket.allow()], [True, False])
+
+    def test_refill_is_capped_by_burst(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.clock.return_value += 60
+        self.assertEqual(
+            [bucket.allow() for _ in range(3)], [True, True, False]
+        )
+
+    def test_zero_rate_is_unlimited(self):
+        bucket = TokenBucket(rate=0, burst=0)
+        self.assertTrue(all(bucket.allow() for _ in range(100)))
+
+
+class SendQueueTest(SimpleTestCase):
+
+    def setUp(self):
+        counters.clear()
+
+    def drain(self, queue: SendQueue) -> list:
+        return [async_to_sync(queue.get)() for _ in range(len(queue))]
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            SendQueue(1, "block")
+
+    def test_drop_oldest(self):
+        queue = SendQueue(2, DROP_OLDEST)
+        self.assertTrue(all(queue.put(n) for n in range(3)))
+        self.assertEqual(self.drain(queue), [1, 2])
+        self.assertEqual(counters["dropped"], 1)
+
+    def test_coalesce_replaces_same_key_in_place(self):
+        queue = SendQueue(3, COALESCE)
+        queue.put("typing 1", key="typing:1")
+        queue.put("message")
+        queue.put("typing 2", key="typing:1")
+        self.assertEqual(self.drain(queue), ["typing 2", "message"])
+        self.assertEqual(counters["coalesced"], 1)
+
+    def test_coalesce_without_match_drops_oldest(self):
+        queue = SendQueue(2, COALESCE)
+        for n in range(3):
+            queue.put(n, key=f"typing:{n}")
+        self.assertEqual(self.drain(queue), [1, 2])
+        self.assertEqual(counters["dropped"], 1)
+
+    def test_disconnect_rejects_when_full(self):
+        queue = SendQueue(1, DISCONNECT)
+        self.assertTrue(queue.put("a"))
+        self.assertFalse(queue.put("b"))
+        self.assertEqual(self.drain(queue), ["a"])
+        self.assertEqual(counters["disconnected"], 1)
+
+    def test_get_waits_for_put(self):
+        async def scenario():
+            queue = SendQueue(1)
+            waiter = asyncio.create_task(queue.get())
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            queue.put("late")
+            return await asyncio.wait_for(waiter, timeout=1)
+
+        self.assertEqual(async_to_sync(scenario)(), "late")
+
+
+@override_settings(CHAT_MULTIPLEX_MAX_CHATS=2, CHAT_BROADCAST_ROOMS={99})
+class MultiplexChatConsumerTest(SimpleTestCase):
+    """Управляющие кадры ws/ без channel layer и Redis."""
+
+    def setUp(self):
+        self.consumer = MultiplexChatConsumer()
+        self.consumer.user_id = 1
+        self.consumer.chats = set()
+        self.consumer.replayed_until = {}
+        self.consumer.channel_name = "test"
+        self.consumer.channel_layer = mock.AsyncMock()
+        self.consumer.send_event = mock.AsyncMock()
+        patcher = mock.patch(
+            "chats.consumer.membership.is_member",
+            mock.AsyncMock(side_effect=lambda chat_id, user_id: chat_id < 10),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def frame(self, **data) -> dict:
+        self.consumer.send_event.reset_mock()
+        async_to_sync(self.consumer.handle_frame)(data)
+        if not self.consumer.send_event.await_count:
+            return {}
+        return self.consumer.send_event.await_args.args[0]
+
+    def test_base_consumer_is_abstract(self):
+        with self.assertRaises(TypeError):
+            BaseChatConsumer()
+
+    def test_subscribe_and_unsubscribe(self):
+        self.assertEqual(
+            self.frame(type="subscribe", chat=1),
+            {"type": "subscribed", "chats": [1]},
+        )
+        self.assertEqual(self.consumer.chats, {1})
+        self.assertEqual(
+            self.frame(type="unsubscribe", chat="1"),
+            {"type": "unsubscribed", "chat": 1},
+        )
+        self.assertEqual(self.consumer.chats, set())
+
+    def test_subscribe_is_refused(self):
+        self.assertEqual(
+            self.frame(type="subscribe", chat=10)["error"], "not a member"
+        )
+        self.assertEqual(
+            self.frame(type="subscribe", chat=99)["error"],
+            "broadcast room, use ws/chat/<id>/",
+        )
+        self.frame(type="subscribe", chat=1)
+        self.frame(type="subscribe", chat=2)
+        self.assertEqual(
+            self.frame(type="subscribe", chat=3)["error"],
+            "too many subscriptions",
+        )
+        self.assertEqual(self.consumer.chats, {1, 2})
+
+    def test_frames_for_other_chats_are_ignored(self):
+        with mock.patch.object(
+            self.consumer, "dispatch_chat_frame", mock.AsyncMock()
+        ) as dispatch:
+            self.frame(type="message", chat=5, text="hi")
+            self.frame(type="message", chat="x", text="hi")
+            self.consumer.chats.add(5)
+            self.frame(type="message", chat=5, text="hi")
+        dispatch.assert_awaited_once_with(
+            5, {"type": "message", "chat": 5, "text": "hi"}
+        )
+
+
+class MembershipCacheTest(SimpleTestCase):
+    """Redis set участников (PRESENCE_REDIS_URL) без устаревших записей."""
+    chat_id = 10 ** 12
+
+    def setUp(self):
+        membership.local_cache.pop(self.chat_id)
+
+    def tearDown(self):
+        client = get_sync_client()
+        client.delete(membership.GENERATION_KEY.format(chat_id=self.chat_id))
+        prefix = membership.MEMBERS_KEY.format(chat_id=self.chat_id)
+        for key in client.scan_iter(match=prefix + "*"):
+            client.delete(key)
+
+    def fetch(self) -> frozenset[int]:
+        return async_to_sync(membership.fetch_members)(self.chat_id)
+
+    def test_members_are_cached(self):
+        load = mock.AsyncMock(return_value=frozenset({1, 2}))
+        with mock.patch("chats.membership.load_members", load):
+            self.assertEqual(self.fetch(), {1, 2})
+            self.assertEqual(self.fetch(), {1, 2})
+        load.assert_awaited_once()
+
+    def test_stale_load_is_not_written_back(self):
+        async def load(chat_id):
+            if load.calls:
+                return frozenset({1})
+            # участника удалили и инвалидировали, пока читали БД
+            load.calls += 1
+            membership.invalidate(chat_id)
+            return frozenset({1, 2})
+
+        load.calls = 0
+        with mock.patch("chats.membership.load_members", load):
+            self.assertEqual(self.fetch(), {1, 2})
+            self.assertEqual(self.fetch(), {1})
+            self.assertEqual(self.fetch(), {1})
+
+
+@override_settings(CHAT_ARCHIVE_SEGMENT_SIZE=3)
+class ChatHistoryTest(KeysMixin, ChatDataMixin, TestCase):
+    """
+    История чата: 10 сообщений, m0..m5 в архиве сегментами по 3,
+    m6..m9 в таблице; страницы по 3 листаются через границу.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.chat = cls.chats[0]
+        cls.ids = [
+            Message.objects.create(
+                chat=cls.chat, sender=cls.users[i % 2],
+                text=encrypt_message(f"m{i}", cls.chat.pk),
+            ).pk
+            for i in range(10)
+        ]
+        Message.objects.filter(pk__in=cls.ids[:6]).update(
+            sent_at=timezone.now() - timedelta(days=30)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def archive(self) -> int:
+        return archive.archive_chat(
+            self.chat.pk, timezone.now() - timedelta(days=1)
+        )
+
+    def history(self, **params) -> tuple[list[str], bool]:
+        response = self.client.get(
+            reverse("chat-history-list", args=[self.chat.pk]),
+            {"page_size": 3, **params},
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        results = response.data["results"]
+        for message in results:
+            index = self.ids.index(message["id"])
+            self.assertEqual(message["sender"]["pk"], self.users[index % 2].pk)
+        return [m["text"] for m in results], response.data["has_more"]
+
+    def test_archive_is_split_into_segments(self):
+        self.assertEqual(self.archive(), 6)
+        self.assertEqual(
+            list(self.chat.archive_segments.values_list("first_id", "last_id")),
+            [(self.ids[0], self.ids[2]), (self.ids[3], self.ids[5])],
+        )
+        self.assertEqual(
+            list(Message.objects.filter(chat=self.chat).values_list(
+                "pk", flat=True
+            )),
+            self.ids[6:],
+        )
+
+    def test_pages_backwards_through_table_and_archive(self):
+        self.archive()
+        self.assertEqual(self.history(), (["m7", "m8", "m9"], True))
+        # m6 из таблицы, m4 и m5 из архива
+        self.assertEqual(
+            self.history(before_id=self.ids[7]), (["m4", "m5", "m6"], True)
+        )
+        # через границу сегментов
+        self.assertEqual(
+            self.history(before_id=self.ids[4]), (["m1", "m2", "m3"], True)
+        )
+        self.assertEqual(self.history(before_id=self.ids[1]), (["m0"], False))
+
+    def test_full_table_page_reports_archive(self):
+        self.archive()
+        self.assertEqual(
+            self.history(page_size=4), (["m6", "m7", "m8", "m9"], True)
+        )
+
+    def test_pages_forwards_through_archive_and_table(self):
+        self.archive()
+        self.assertEqual(
+            self.history(after_id=self.ids[1]), (["m2", "m3", "m4"], True)
+        )
+        self.assertEqual(
+            self.history(after_id=self.ids[4]), (["m5", "m6", "m7"], True)
+        )
+        self.assertEqual(
+            self.history(after_id=self.ids[7]), (["m8", "m9"], False)
+        )
+
+    def test_both_cursors_are_rejected(self):
+        response = self.client.get(
+            reverse("chat-history-list", args=[self.chat.pk]),
+            {"before_id": self.ids[5], "after_id": self.ids[1]},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_live_reply_blocks_archiving_its_parent(self):
+        Message.objects.filter(pk=self.ids[7]).update(parent_id=self.ids[4])
+        self.assertEqual(self.archive(), 4)
+        self.assertEqual(
+            list(self.chat.archive_segments.values_list("first_id", "last_id")),
+            [(self.ids[0], self.ids[2]), (self.ids[3], self.ids[3])],
+        )
+        self.assertEqual(
+            self.history(before_id=self.ids[6]), (["m3", "m4", "m5"], True)
+        )
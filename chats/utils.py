@@ -1,33 +1,140 @@
-from typing import Literal
+import base64
+import os
+from functools import lru_cache
+from typing import Iterable, Literal
 
 import rsa
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from django.conf import settings
 
 
-def read_keys_from_file(file: Literal["private", "public"]) -> str:
-    path: str = settings.KEYS_PATH
-    if file == "private":
-        path += "/private.txt"
-    elif file == "public":
-        path += "/public.txt"
-    with open(file=path, mode="r") as f:
+# Сообщения шифруются AES-GCM ключом своего чата: он выводится HKDF
+# из мастер-ключа данных (data key) и chat_id, поэтому шифртекст,
+# перенесённый в другой чат, не расшифруется. Сам мастер-ключ хранится
+# на диске зашифрованным RSA (envelope), RSA используется один раз
+# при загрузке ключа, а не на каждое сообщение.
+ENVELOPE_PREFIX = "v2:"
+# v1 — общий ключ данных без привязки к чату, только чтение
+GLOBAL_ENVELOPE_PREFIX = "v1:"
+NONCE_SIZE = 12
+CHAT_KEY_CACHE_SIZE = 1024
+
+
+KeyFile = Literal["private", "public", "data", "private_old"]
+
+
+def key_path(file: KeyFile) -> str:
+    return os.path.join(settings.KEYS_PATH, f"{file}.txt")
+
+
+def read_keys_from_file(file: KeyFile) -> str:
+    with open(file=key_path(file), mode="r") as f:
         content = f.read()
     return content
 
 
-def encrypt_message(text: str) -> str:
+@lru_cache(maxsize=1)
+def load_public_key() -> rsa.PublicKey:
     key = read_keys_from_file(file="public")
-    public_key: rsa.PublicKey = \
-        rsa.PublicKey.load_pkcs1(key.encode("utf-8"))
-    message: bytes = text.encode("utf-8")
-    encrypted_text = rsa.encrypt(message=message, pub_key=public_key)
-    return encrypted_text.hex()
+    return rsa.PublicKey.load_pkcs1(key.encode("utf-8"))
 
 
-def decrypt_message(encrypted_text: str) -> str:
+@lru_cache(maxsize=1)
+def load_private_key() -> rsa.PrivateKey:
     key = read_keys_from_file(file="private")
-    private_key: rsa.PrivateKey = \
-        rsa.PrivateKey.load_pkcs1(key.encode("utf-8"))
-    message: bytes = bytes.fromhex(encrypted_text)
-    decrypted: bytes = rsa.decrypt(message, private_key)
+    return rsa.PrivateKey.load_pkcs1(key.encode("utf-8"))
+
+
+def wrap_data_key(data_key: bytes, public_key: rsa.PublicKey) -> str:
+    return rsa.encrypt(message=data_key, pub_key=public_key).hex()
+
+
+def unwrap_data_key(wrapped: str, private_key: rsa.PrivateKey) -> bytes:
+    return rsa.decrypt(bytes.fromhex(wrapped.strip()), private_key)
+
+
+def read_data_key() -> bytes:
+    """
+    Ключ данных с диска. Пока generate_rsa --force меняет файлы,
+    прежний закрытый ключ лежит в private_old: если ротация прервалась
+    после замены private, но до замены data, data ещё обёрнут им.
+    """
+    wrapped = read_keys_from_file(file="data")
+    try:
+        return unwrap_data_key(wrapped, load_private_key())
+    except rsa.DecryptionError:
+        if not os.path.exists(key_path("private_old")):
+            raise
+    old_private = rsa.PrivateKey.load_pkcs1(
+        read_keys_from_file(file="private_old").encode("utf-8")
+    )
+    return unwrap_data_key(wrapped, old_private)
+
+
+@lru_cache(maxsize=1)
+def load_data_key() -> bytes:
+    return read_data_key()
+
+
+@lru_cache(maxsize=1)
+def load_cipher() -> AESGCM:
+    return AESGCM(load_data_key())
+
+
+@lru_cache(maxsize=CHAT_KEY_CACHE_SIZE)
+def load_chat_cipher(chat_id: int) -> AESGCM:
+    key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=f"chat:{chat_id}".encode("ascii"),
+    ).derive(load_data_key())
+    return AESGCM(key)
+
+
+def reset_key_cache():
+    load_public_key.cache_clear()
+    load_private_key.cache_clear()
+    load_data_key.cache_clear()
+    load_cipher.cache_clear()
+    load_chat_cipher.cache_clear()
+
+
+def is_legacy(encrypted_text: str) -> bool:
+    """Зашифровано до перехода на envelope: голый RSA в hex."""
+    return not encrypted_text.startswith(
+        (ENVELOPE_PREFIX, GLOBAL_ENVELOPE_PREFIX)
+    )
+
+
+def decrypt_legacy(encrypted_text: str, private_key: rsa.PrivateKey) -> str:
+    return rsa.decrypt(
+        bytes.fromhex(encrypted_text), private_key
+    ).decode("utf-8")
+
+
+def encrypt_message(text: str, chat_id: int) -> str:
+    nonce = os.urandom(NONCE_SIZE)
+    encrypted = load_chat_cipher(chat_id).encrypt(
+        nonce, text.encode("utf-8"), None
+    )
+    return ENVELOPE_PREFIX + base64.b64encode(nonce + encrypted).decode("ascii")
+
+
+def decrypt_message(encrypted_text: str, chat_id: int) -> str:
+    if is_legacy(encrypted_text):
+        return decrypt_legacy(encrypted_text, load_private_key())
+    if encrypted_text.startswith(GLOBAL_ENVELOPE_PREFIX):
+        cipher = load_cipher()
+    else:
+        cipher = load_chat_cipher(chat_id)
+    raw = base64.b64decode(encrypted_text.split(":", 1)[1])
+    decrypted = cipher.decrypt(raw[:NONCE_SIZE], raw[NONCE_SIZE:], None)
     return decrypted.decode("utf-8")
+
+
+def decrypt_messages(chat_id: int, encrypted_texts: Iterable[str]) -> list[str]:
+    """Расшифровка страницы истории: ключ чата выводится один раз на пачку."""
+    return [decrypt_message(text, chat_id) for text in encrypted_texts]
@@ -1,3 +1,145 @@
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.exceptions import NotFound
+from rest_framework.viewsets import ViewSet
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.db import transaction
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+
+from chats.buffer import message_buffer
+from chats.models import Chat, ChatMember, Message
+from chats.paginators import ChatHistoryPagination
+from chats.serializers import (
+    ChatMemberSerializer, ChatReadSerializer, MessageHistorySerializer,
+)
+from chats.utils import decrypt_message, decrypt_messages
+
+
+class ChatListViewSet(ViewSet):
+    """
+    GET  /api/v1/chats/              чаты пользователя с непрочитанными
+    POST /api/v1/chats/<pk>/read/    отметить прочитанным до message_id
+    GET  /api/v1/chats/buffer-stats/ метрики write-behind буфера (админ)
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(responses={200: ChatMemberSerializer(many=True)})
+    def list(self, request: Request) -> Response:
+        # один запрос по индексу (client_id, last_message_at DESC)
+        members = list(
+            ChatMember.objects.filter(user=request.user)
+            .select_related("chat")
+            .order_by("-last_message_at")
+        )
+        for member in members:
+            if member.last_message_preview:
+                member.last_message_preview = decrypt_message(
+                    member.last_message_preview, member.chat_id
+                )
+        serializer = ChatMemberSerializer(instance=members, many=True)
+        return Response(data=serializer.data)
+
+    @swagger_auto_schema(responses={200: "write buffer stats"})
+    @action(
+        methods=["get"], detail=False, url_path="buffer-stats",
+        permission_classes=[IsAdminUser],
+    )
+    def buffer_stats(self, request: Request) -> Response:
+        # буфер свой у каждого ASGI-процесса: метрики того, кто ответил
+        return Response(data=message_buffer.stats())
+
+    @swagger_auto_schema(
+        request_body=ChatReadSerializer,
+        responses={
+            200: "unread counter updated",
+            400: "bad request",
+            404: "chat not found",
+        },
+    )
+    @action(methods=["post"], detail=True)
+    def read(self, request: Request, pk: int) -> Response:
+        serializer = ChatReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            member = ChatMember.objects.select_for_update().filter(
+                chat_id=pk, user=request.user
+            ).first()
+            if member is None:
+                raise NotFound(detail="chat not found")
+            message_id = min(
+                serializer.validated_data["message_id"],
+                member.last_message_id or 0,
+            )
+            if message_id > member.last_read_message_id:
+                unread = 0
+                if message_id < member.last_message_id:
+                    # считаем только хвост после прочитанного по (chat_id, id)
+                    unread = Message.objects.filter(
+                        chat_id=pk, pk__gt=message_id
+                    ).exclude(sender=request.user).count()
+                member.last_read_message_id = message_id
+                member.unread_count = unread
+                member.save(
+                    update_fields=["last_read_message_id", "unread_count"]
+                )
+        return Response(data={
+            "last_read_message_id": member.last_read_message_id,
+            "unread_count": member.unread_count,
+        })
+
+
+class ChatHistoryViewSet(ViewSet):
+    """
+    GET /api/v1/chats/<chat_pk>/history/?before_id=&after_id=&page_size=
+    Листает историю по индексу (chat_id, id) без COUNT(*) и OFFSET,
+    старше таблицы — из холодного архива (chats.archive).
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = ChatHistoryPagination
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                name="before_id",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="сообщения старше этого id",
+            ),
+            openapi.Parameter(
+                name="after_id",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="сообщения новее этого id",
+            ),
+            openapi.Parameter(
+                name="page_size",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+        responses={
+            200: MessageHistorySerializer(many=True),
+            400: "bad cursor",
+            404: "chat not found",
+        },
+    )
+    def list(self, request: Request, chat_pk: int) -> Response:
+        if not Chat.objects.filter(pk=chat_pk, users=request.user).exists():
+            raise NotFound(detail="chat not found")
+        messages = Message.objects.filter(
+            chat_id=chat_pk
+        ).select_related("sender")
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(messages, request, view=self)
+        texts = decrypt_messages(chat_pk, (message.text for message in page))
+        for message, text in zip(page, texts):
+            message.text = text
+        serializer = MessageHistorySerializer(instance=page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
 # from rest_framework.request import Request
 # from rest_framework.response import Response
 # from rest_framework.exceptions import PermissionDenied, NotFound
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from loguru import logger
+from redis.exceptions import LockError
+
+from comments.models import Comments, LikeDislike
+from comments.reactions import (
+    FLUSH_LOCK_TTL, TARGETS, discard_pending, flush_lock, flush_pending,
+)
+from common.redis_client import get_sync_client
+from images.models import Image
+from posts.models import Post
+
+
+# Post.comments_count и Comments.replies_count меняются F()-апдейтами
+# в транзакции вставки/удаления комментария (comments.signals).
+# bulk_create, сырой SQL и ручные правки в обход сигналов дают дрейф —
+# его чинит reconcile_* (команда reconcile_comment_counters).
+# Так же сверяются Image.likes_count/dislikes_count (comments.reactions).
+
+
+def comment_created(comment: Comments):
+    Post.objects.filter(pk=comment.post_id).update(
+        comments_count=F("comments_count") + 1
+    )
+    if comment.parent_id is not None:
+        Comments.objects.filter(pk=comment.parent_id).update(
+            replies_count=F("replies_count") + 1
+        )
+
+
+def comment_deleted(comment: Comments):
+    # при каскадном удалении поста/родителя строка уже может быть удалена,
+    # UPDATE тогда просто ничего не затронет
+    Post.objects.filter(pk=comment.post_id, comments_count__gt=0).update(
+        comments_count=F("comments_count") - 1
+    )
+    if comment.parent_id is not None:
+        Comments.objects.filter(
+            pk=comment.parent_id, replies_count__gt=0
+        ).update(replies_count=F("replies_count") - 1)
+
+
+def count_of(queryset, field: str):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef("pk")})
+            .order_by().values(field)
+            .annotate(total=Count("*")).values("total")
+        ),
+        Value(0),
+    )
+
+
+def reconcile(
+    model, counter: str, actual, batch_size: int, before_batch=None
+) -> int:
+    """
+    Пересчитывает counter по диапазонам pk, по транзакции на пачку,
+    чтобы не держать блокировки на всей таблице. Обновляются только
+    разошедшиеся строки; возвращает их число.
+    before_batch(pks) вызывается перед пересчётом каждой пачки.
+    """
+    fixed = 0
+    last_pk = 0
+    while True:
+        bounds = list(
+            model.objects.filter(pk__gt=last_pk).order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not bounds:
+            return fixed
+        if before_batch is not None:
+            before_batch(bounds)
+        with transaction.atomic():
+            fixed += model.objects.filter(
+                pk__gte=bounds[0], pk__lte=bounds[-1]
+            ).annotate(actual=actual).exclude(
+                **{counter: F("actual")}
+            ).update(**{counter: actual})
+        last_pk = bounds[-1]
+
+
+def reconcile_comment_counters(batch_size: int = 1000) -> dict:
+    stats = {
+        "posts": reconcile(
+            Post, "comments_count",
+            count_of(Comments.objects.all(), "post"), batch_size,
+        ),
+        "comments": reconcile(
+            Comments, "replies_count",
+            count_of(Comments.objects.all(), "parent"), batch_size,
+        ),
+    }
+    logger.info(f"Comment counters reconciled: {stats}")
+    return stats
+
+
+def reactions_of(is_like: bool):
+    # картинка может быть целью в любой из трёх ролей
+    reactions = LikeDislike.objects.filter(is_like=is_like)
+    first, *rest = (count_of(reactions, target) for target in TARGETS)
+    for count in rest:
+        first = first + count
+    return first
+
+
+def reconcile_reaction_counters(batch_size: int = 1000) -> dict:
+    """
+    Держит блокировку переноса на всю сверку: FlushReactionsTask
+    не применит дельты поверх пересчёта. Сначала переносятся накопленные
+    дельты, затем перед пересчётом пачки сбрасываются её дельты,
+    пришедшие за время сверки: пересчёт из LikeDislike их уже учёл.
+    LockError, если перенос не отпустил блокировку за FLUSH_LOCK_TTL.
+    """
+    client = get_sync_client()
+    lock = flush_lock(client, blocking_timeout=FLUSH_LOCK_TTL)
+    if not lock.acquire():
+        raise LockError("Reaction counters flush is still running")
+    try:
+        flush_pending(client, lock, settings.REACTION_FLUSH_BATCH_SIZE)
+        stats = {
+            counter: reconcile(
+                Image, f"{counter}_count", reactions_of(is_like), batch_size,
+                before_batch=lambda pks, counter=counter: discard_pending(
+                    client, lock, counter, pks
+                ),
+            )
+            for counter, is_like in (("likes", True), ("dislikes", False))
+        }
+    finally:
+        lock.release()
+    logger.info(f"Reaction counters reconciled: {stats}")
+    return stats
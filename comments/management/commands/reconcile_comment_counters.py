@@ -0,0 +1,30 @@
+from loguru import logger
+
+from django.core.management.base import BaseCommand, CommandError
+from redis.exceptions import RedisError
+
+from comments.counters import (
+    reconcile_comment_counters, reconcile_reaction_counters,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает Post.comments_count, Comments.replies_count "
+        "и Image.likes_count/dislikes_count пачками по --batch-size "
+        "строк, исправляя дрейф счётчиков"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        logger.info("Start reconciling comment counters")
+        stats = reconcile_comment_counters(batch_size=options["batch_size"])
+        try:
+            stats.update(
+                reconcile_reaction_counters(batch_size=options["batch_size"])
+            )
+        except RedisError as e:
+            raise CommandError(f"Reaction counters not reconciled: {e}")
+        logger.info(f"Reconciling finished: {stats}")
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+PATH_STEP = 12
+
+
+def fill_paths(apps, schema_editor):
+    Comments = apps.get_model("comments", "Comments")
+    # по уровням: у родителя path уже посчитан, когда дошли до детей
+    level = Comments.objects.filter(parent__isnull=True)
+    depth = 0
+    while True:
+        batch = []
+        for comment in level.select_related("parent").only(
+            "id", "parent_id", "parent__path"
+        ).iterator(chunk_size=2000):
+            prefix = comment.parent.path if comment.parent_id else ""
+            comment.path = prefix + f"{comment.id:0{PATH_STEP}d}"
+            comment.depth = depth
+            batch.append(comment)
+        if not batch:
+            break
+        Comments.objects.bulk_update(
+            batch, fields=["path", "depth"], batch_size=1000
+        )
+        level = Comments.objects.filter(path="").exclude(parent__path="")
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0002_comments_parent_comments_post_comments_user_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comments',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='уровень вложенности'),
+        ),
+        migrations.AddField(
+            model_name='comments',
+            name='path',
+            field=models.TextField(default='', editable=False, verbose_name='путь в дереве'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comments',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+    ]
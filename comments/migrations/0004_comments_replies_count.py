@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Comments = apps.get_model("comments", "Comments")
+    Post = apps.get_model("posts", "Post")
+
+    def count_of(field):
+        return Coalesce(
+            Subquery(
+                Comments.objects.filter(**{field: OuterRef("pk")})
+                .order_by().values(field)
+                .annotate(total=Count("*")).values("total")
+            ),
+            Value(0),
+        )
+
+    Post.objects.update(comments_count=count_of("post"))
+    Comments.objects.update(replies_count=count_of("parent"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0003_comment_path'),
+        ('posts', '0005_post_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comments',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='ответов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0004_comments_replies_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReactionFlush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.CharField(max_length=32, verbose_name='прогон')),
+                ('first_image_id', models.BigIntegerField(verbose_name='первая картинка')),
+                ('last_image_id', models.BigIntegerField(verbose_name='последняя картинка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'перенос счётчиков реакций',
+                'verbose_name_plural': 'переносы счётчиков реакций',
+                'ordering': ('id',),
+                'constraints': [models.UniqueConstraint(fields=('generation', 'first_image_id'), name='unique_reaction_flush_batch')],
+            },
+        ),
+    ]
@@ -1,8 +1,33 @@
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
 from django.utils import timezone
 
 
+# Материализованный путь: id всех предков и самого комментария,
+# каждый дополнен нулями до PATH_STEP цифр. Сортировка по path даёт
+# порядок обхода дерева в глубину, ответы — по порядку создания.
+PATH_STEP = 12
+
+
+def path_segment(comment_id: int) -> str:
+    return f"{comment_id:0{PATH_STEP}d}"
+
+
+class CommentsQuerySet(models.QuerySet):
+    def thread(
+        self, post_id: int, max_depth: int | None = None
+    ) -> "CommentsQuerySet":
+        """
+        Обсуждение поста в порядке показа одним запросом по индексу
+        (post_id, path); max_depth — отбросить ответы глубже. Курсор
+        страниц — в comments.paginators.CommentThreadPagination.
+        """
+        queryset = self.filter(post_id=post_id)
+        if max_depth is not None:
+            queryset = queryset.filter(depth__lte=max_depth)
+        return queryset.order_by("path")
+
+
 class Comments(models.Model):
     post = models.ForeignKey(
         to="posts.Post",
@@ -34,15 +59,62 @@ class Comments(models.Model):
         verbose_name="дата создания",
         default=timezone.now,
     )
+    path = models.TextField(
+        verbose_name="путь в дереве",
+        default="",
+        editable=False,
+    )
+    depth = models.PositiveSmallIntegerField(
+        verbose_name="уровень вложенности",
+        default=0,
+        editable=False,
+    )
+    # прямые ответы; меняется вместе с ними (comments.signals)
+    replies_count = models.PositiveIntegerField(
+        verbose_name="ответов",
+        default=0,
+        editable=False,
+    )
+
+    objects = CommentsQuerySet.as_manager()
 
     class Meta:
         ordering = ("id",)
         verbose_name = "комментарий"
         verbose_name_plural = "комментарии"
+        indexes = [
+            models.Index(
+                fields=["post", "path"], name="comment_post_path_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} | {self.text[:20]}..."
 
+    def save(self, *args, **kwargs):
+        """
+        path считается при вставке: он содержит собственный id.
+        Ответ всегда принадлежит посту родителя; родителя после
+        создания не меняют, иначе пути поддерева устареют.
+        bulk_create save() не вызывает — path и счётчики
+        (comments.counters) нужно поправить самому.
+        """
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        if self.parent_id is not None:
+            self.post_id = self.parent.post_id
+        # одна транзакция со счётчиками из сигнала post_save
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.path:
+                return
+            prefix = self.parent.path if self.parent_id is not None else ""
+            self.path = prefix + path_segment(self.pk)
+            self.depth = len(self.path) // PATH_STEP - 1
+            Comments.objects.filter(pk=self.pk).update(
+                path=self.path, depth=self.depth
+            )
+
 
 class LikeDislike(models.Model):
     user = models.ForeignKey(
@@ -125,3 +197,32 @@ class LikeDislike(models.Model):
             self.user_avatar or self.public or self.gallery_image or "???"
         )
         return f"{self.user} → {'лайк' if self.is_like else 'дизлайк'} для {target}"
+
+
+class ReactionFlush(models.Model):
+    """
+    Пачка дельт реакций, уже перенесённая из Redis в Image
+    (comments.reactions.flush). Пишется в транзакции переноса, поэтому
+    повтор после сбоя между коммитом и HDEL не применит пачку дважды.
+    generation — прогон переноса, метки живут, пока он не закончен.
+    """
+    generation = models.CharField(verbose_name="прогон", max_length=32)
+    first_image_id = models.BigIntegerField(verbose_name="первая картинка")
+    last_image_id = models.BigIntegerField(verbose_name="последняя картинка")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("id",)
+        verbose_name = "перенос счётчиков реакций"
+        verbose_name_plural = "переносы счётчиков реакций"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["generation", "first_image_id"],
+                name="unique_reaction_flush_batch",
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.generation} | {self.first_image_id}-{self.last_image_id}"
+        )
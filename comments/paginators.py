@@ -0,0 +1,46 @@
+import re
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from comments.models import PATH_STEP
+from common.paginators import KeysetPagination
+
+
+PATH_RE = re.compile(rf"(\d{{{PATH_STEP}}})+")
+
+
+class CommentThreadPagination(KeysetPagination):
+    """
+    Курсор — path последнего показанного комментария: ?after=<path>.
+    Страницы идут в порядке показа дерева, продолжение — диапазон
+    того же индекса (post_id, path), без COUNT(*) и OFFSET.
+    """
+    page_size = 100
+    max_page_size = 500
+
+    def get_path_param(self, request: Request, name: str) -> str | None:
+        value = request.query_params.get(name)
+        if value is None:
+            return None
+        if not PATH_RE.fullmatch(value):
+            raise ValidationError(detail={name: "must be a comment path"})
+        return value
+
+    def paginate_queryset(self, queryset, request, view=None) -> list:
+        limit = self.get_page_size(request)
+        after = self.get_path_param(request, "after")
+        if after is not None:
+            queryset = queryset.filter(path__gt=after)
+        page = list(queryset.order_by("path")[:limit + 1])
+        self.has_more = len(page) > limit
+        self.page = page[:limit]
+        return self.page
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(data={
+            "after": self.page[-1].path if self.page else None,
+            "has_more": self.has_more,
+            "results": data,
+        })
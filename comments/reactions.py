@@ -0,0 +1,314 @@
+import uuid
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from loguru import logger
+from redis.exceptions import RedisError
+from redis.lock import Lock
+
+from comments.models import LikeDislike, ReactionFlush
+from common.redis_client import get_sync_client
+from images.models import Image
+
+
+# Роли картинки в LikeDislike: на каждую — своя колонка и свой
+# уникальный индекс (user, <колонка>). Строки реакций пишутся в БД
+# сразу, а счётчики Image.likes_count/dislikes_count — нет: популярная
+# картинка превратила бы их строку в очередь на блокировку. Изменения
+# копятся в Redis hash PENDING_KEY (HINCRBY, поле "<image_id>:<счётчик>")
+# и раз в несколько секунд переносятся в Image (FlushReactionsTask).
+# Чтение складывает колонку Image с ещё не перенесёнными дельтами.
+TARGETS = ("user_avatar", "public_avatar", "gallery_image")
+# обратная связь Image, через которую картинка получает роль
+TARGET_RELATIONS = {
+    "user_avatar": "user_avatar",
+    "public_avatar": "public_avatar",
+    "gallery_image": "gallery_usage",
+}
+COUNTERS = ("likes", "dislikes")
+MAX_BATCH = 100
+PENDING_KEY = "reactions:pending"
+# hash, который сейчас переносится; при сбое переносится следующим
+FLUSHING_KEY = "reactions:flushing"
+# прогон переноса FLUSHING_KEY: им помечаются перенесённые пачки
+# (ReactionFlush), чтобы повтор после сбоя не применил их второй раз
+FLUSH_GENERATION_KEY = "reactions:flushing:generation"
+# один перенос за раз, даже если прошлый не уложился в период beat;
+# redis-py Lock: токен владельца, снятие и продление сравнивают его
+FLUSH_LOCK_KEY = "reactions:flush:lock"
+FLUSH_LOCK_TTL = 300
+
+# PENDING_KEY -> FLUSHING_KEY с новым прогоном, если прошлый перенос
+# закончен; иначе продолжается прерванный. Возвращает прогон или nil.
+START_FLUSH_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return false
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    redis.call('DEL', KEYS[3])
+end
+redis.call('SET', KEYS[3], ARGV[1], 'NX')
+return redis.call('GET', KEYS[3])
+"""
+
+
+def pending_field(image_id: int, counter: str) -> str:
+    return f"{image_id}:{counter}"
+
+
+def persist(deltas: dict[int, dict[str, int]]):
+    """Одним UPDATE по пачке картинок, счётчик не уходит ниже нуля."""
+    ids = sorted(deltas)
+    Image.objects.filter(pk__in=ids).update(**{
+        f"{counter}_count": Greatest(
+            F(f"{counter}_count") + Case(
+                *(
+                    When(pk=image_id, then=Value(deltas[image_id][counter]))
+                    for image_id in ids if deltas[image_id].get(counter)
+                ),
+                default=Value(0),
+            ),
+            Value(0),
+        )
+        for counter in COUNTERS
+    })
+
+
+def add_pending(image_id: int, deltas: dict[str, int]):
+    try:
+        with get_sync_client().pipeline(transaction=False) as pipe:
+            for counter, delta in deltas.items():
+                pipe.hincrby(
+                    PENDING_KEY, pending_field(image_id, counter), delta
+                )
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Reaction counters cache unavailable: {e}")
+        persist({image_id: deltas})
+
+
+def apply_delta(image_id: int, likes: int = 0, dislikes: int = 0):
+    deltas = {
+        counter: delta
+        for counter, delta in zip(COUNTERS, (likes, dislikes)) if delta
+    }
+    if deltas:
+        # после коммита: откаченная реакция не должна попасть в счётчик
+        transaction.on_commit(lambda: add_pending(image_id, deltas))
+
+
+def reaction_delta(is_like: bool, sign: int = 1) -> dict:
+    return {"likes" if is_like else "dislikes": sign}
+
+
+def has_role(image_id: int, target: str) -> bool:
+    return Image.objects.filter(
+        pk=image_id, **{f"{TARGET_RELATIONS[target]}__isnull": False}
+    ).exists()
+
+
+def insert_reaction(
+    user_id: int, image_id: int, target: str, is_like: bool
+) -> bool:
+    """
+    INSERT ... ON CONFLICT DO NOTHING: вставка без гонки с параллельным
+    кликом того же пользователя. True — строка новая.
+    """
+    column = f"{target}_id"
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {LikeDislike._meta.db_table}
+                (user_id, {column}, is_like, created_at)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (user_id, {column}) DO NOTHING
+            RETURNING id
+        """, [user_id, image_id, is_like, timezone.now()])
+        return cursor.fetchone() is not None
+
+
+def toggle(
+    user_id: int, image_id: int, target: str, is_like: bool
+) -> bool | None:
+    """
+    Повторный клик той же реакции снимает её, противоположный —
+    переключает. Возвращает итоговую реакцию пользователя.
+    """
+    with transaction.atomic():
+        while True:
+            if insert_reaction(user_id, image_id, target, is_like):
+                apply_delta(image_id, **reaction_delta(is_like))
+                return is_like
+            # конфликт: строка уже есть и закоммичена, блокируем её
+            reaction = LikeDislike.objects.select_for_update().filter(
+                user_id=user_id, **{f"{target}_id": image_id}
+            ).first()
+            if reaction is not None:
+                break
+            # строку удалил параллельный клик (двойное снятие) между
+            # INSERT и блокировкой: снова вставляем
+        if reaction.is_like == is_like:
+            # счётчик уменьшит сигнал post_delete
+            reaction.delete()
+            return None
+        reaction.is_like = is_like
+        reaction.save(update_fields=["is_like"])
+        apply_delta(
+            image_id,
+            **reaction_delta(is_like),
+            **reaction_delta(not is_like, sign=-1),
+        )
+        return is_like
+
+
+def reaction_deleted(reaction: LikeDislike):
+    for target in TARGETS:
+        image_id = getattr(reaction, f"{target}_id")
+        if image_id is not None:
+            apply_delta(image_id, **reaction_delta(reaction.is_like, -1))
+
+
+def flush_lock(client: redis.Redis, **kwargs) -> Lock:
+    return client.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TTL, **kwargs)
+
+
+def flush(batch_size: int | None = None) -> int:
+    """
+    Переносит накопленные дельты в Image пачками по batch_size картинок.
+    PENDING_KEY атомарно переименовывается: новые клики копятся
+    в свежем hash, пока этот переносится. Пачка помечается ReactionFlush
+    в своей транзакции, поля удаляются после коммита: сбой между ними
+    не применит пачку дважды, повтор только удалит её поля.
+    """
+    batch_size = batch_size or settings.REACTION_FLUSH_BATCH_SIZE
+    try:
+        client = get_sync_client()
+        lock = flush_lock(client)
+        if not lock.acquire(blocking=False):
+            return 0
+        try:
+            return flush_pending(client, lock, batch_size)
+        finally:
+            lock.release()
+    except RedisError as e:
+        logger.warning(f"Reaction counters flush failed: {e}")
+        return 0
+
+
+def flush_pending(client: redis.Redis, lock: Lock, batch_size: int) -> int:
+    start_flush = client.register_script(START_FLUSH_SCRIPT)
+    generation = start_flush(
+        keys=[PENDING_KEY, FLUSHING_KEY, FLUSH_GENERATION_KEY],
+        args=[uuid.uuid4().hex],
+    )
+    if generation is None:
+        # кликов не было
+        return 0
+    generation = generation.decode()
+    ReactionFlush.objects.exclude(generation=generation).delete()
+    applied = list(
+        ReactionFlush.objects.filter(generation=generation)
+        .values_list("first_image_id", "last_image_id")
+    )
+    deltas, done = {}, []
+    for field, delta in client.hgetall(FLUSHING_KEY).items():
+        image_id, counter = field.decode().split(":")
+        if any(first <= int(image_id) <= last for first, last in applied):
+            # пачка закоммичена, но прошлый прогон упал до HDEL
+            done.append(field)
+            continue
+        deltas.setdefault(int(image_id), {})[counter] = int(delta)
+    if done:
+        client.hdel(FLUSHING_KEY, *done)
+    ids = sorted(deltas)
+    for start in range(0, len(ids), batch_size):
+        # продлевает блокировку; LockNotOwnedError, если её уже перехватили
+        lock.reacquire()
+        batch_ids = ids[start:start + batch_size]
+        batch = {image_id: deltas[image_id] for image_id in batch_ids}
+        with transaction.atomic():
+            persist(batch)
+            ReactionFlush.objects.create(
+                generation=generation,
+                first_image_id=batch_ids[0],
+                last_image_id=batch_ids[-1],
+            )
+        client.hdel(FLUSHING_KEY, *(
+            pending_field(image_id, counter)
+            for image_id, counters in batch.items() for counter in counters
+        ))
+    ReactionFlush.objects.filter(generation=generation).delete()
+    if ids:
+        logger.info(f"Flushed reaction counters of {len(ids)} images")
+    return len(ids)
+
+
+def discard_pending(
+    client: redis.Redis, lock: Lock, counter: str, image_ids: list[int]
+):
+    """
+    Сбрасывает дельты counter, накопленные до пересчёта этих картинок
+    из LikeDislike: пересчёт их уже учёл (comments.counters).
+    """
+    lock.reacquire()
+    client.hdel(PENDING_KEY, *(
+        pending_field(image_id, counter) for image_id in image_ids
+    ))
+
+
+def pending(image_ids: list[int]) -> dict[int, dict[str, int]]:
+    """Дельты, ещё не перенесённые в Image: в PENDING_KEY и FLUSHING_KEY."""
+    fields = [
+        pending_field(image_id, counter)
+        for image_id in image_ids for counter in COUNTERS
+    ]
+    result = {image_id: dict.fromkeys(COUNTERS, 0) for image_id in image_ids}
+    try:
+        with get_sync_client().pipeline(transaction=False) as pipe:
+            pipe.hmget(PENDING_KEY, fields)
+            pipe.hmget(FLUSHING_KEY, fields)
+            for values in pipe.execute():
+                for field, value in zip(fields, values):
+                    if value is not None:
+                        image_id, counter = field.split(":")
+                        result[int(image_id)][counter] += int(value)
+    except RedisError as e:
+        logger.warning(f"Reaction counters cache unavailable: {e}")
+    return result
+
+
+def reactions(user_id: int, image_ids: list[int]) -> list[dict]:
+    """
+    Счётчики и собственная реакция пользователя для пачки картинок
+    одним запросом: счётчики из колонок Image плюс дельты из Redis,
+    реакция — подзапрос по уникальным индексам (user, <роль>).
+    """
+    own = LikeDislike.objects.filter(user_id=user_id).filter(
+        Q(user_avatar=OuterRef("pk"))
+        | Q(public_avatar=OuterRef("pk"))
+        | Q(gallery_image=OuterRef("pk"))
+    ).order_by("-id").values("is_like")[:1]
+    rows = Image.objects.filter(pk__in=image_ids).annotate(
+        my_reaction=Subquery(own)
+    ).order_by("pk").values(
+        "id", "likes_count", "dislikes_count", "my_reaction"
+    )
+    rows = list(rows)
+    deltas = pending([row["id"] for row in rows]) if rows else {}
+    return [
+        {
+            "image": row["id"],
+            "likes": max(
+                row["likes_count"] + deltas[row["id"]]["likes"], 0
+            ),
+            "dislikes": max(
+                row["dislikes_count"] + deltas[row["id"]]["dislikes"], 0
+            ),
+            "my_reaction": row["my_reaction"],
+        }
+        for row in rows
+    ]
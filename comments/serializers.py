@@ -0,0 +1,62 @@
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+
+from comments.models import Comments
+from comments.reactions import MAX_BATCH, TARGETS, has_role
+from images.models import Image
+from users.serializers import FriendSerializer
+
+
+class CommentThreadSerializer(serializers.ModelSerializer):
+    user = FriendSerializer(read_only=True)
+
+    class Meta:
+        model = Comments
+        fields = [
+            "id",
+            "parent",
+            "user",
+            "text",
+            "date_created",
+            "depth",
+            "path",
+            "replies_count",
+        ]
+
+
+class ReactionToggleSerializer(serializers.Serializer):
+    image = serializers.IntegerField(min_value=1)
+    target = serializers.ChoiceField(choices=TARGETS, default="gallery_image")
+    is_like = serializers.BooleanField()
+
+    def validate(self, attrs: dict) -> dict:
+        if not Image.objects.filter(pk=attrs["image"]).exists():
+            raise NotFound(detail="image not found")
+        if not has_role(attrs["image"], attrs["target"]):
+            # иначе реакция легла бы на роль, которой у картинки нет
+            raise serializers.ValidationError(
+                {"target": "image has no such role"}
+            )
+        return attrs
+
+
+class ReactionBatchSerializer(serializers.Serializer):
+    images = serializers.CharField(help_text="id картинок через запятую")
+
+    def validate_images(self, value: str) -> list[int]:
+        try:
+            ids = {int(image_id) for image_id in value.split(",") if image_id}
+        except ValueError:
+            raise serializers.ValidationError("must be comma-separated ids")
+        if not ids:
+            raise serializers.ValidationError("at least one id required")
+        if len(ids) > MAX_BATCH:
+            raise serializers.ValidationError(f"at most {MAX_BATCH} ids")
+        return sorted(ids)
+
+
+class ReactionCountsSerializer(serializers.Serializer):
+    image = serializers.IntegerField()
+    likes = serializers.IntegerField()
+    dislikes = serializers.IntegerField()
+    my_reaction = serializers.BooleanField(allow_null=True)
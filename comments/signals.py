@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from comments import counters, reactions
+from comments.models import Comments, LikeDislike
+
+
+@receiver(signal=post_save, sender=Comments)
+def comment_created(instance: Comments, created: bool, **kwargs):
+    # внутри транзакции Comments.save(): счётчики откатятся вместе с ним
+    if created:
+        counters.comment_created(instance)
+
+
+@receiver(signal=post_delete, sender=Comments)
+def comment_deleted(instance: Comments, **kwargs):
+    # delete() и каскады Django выполняются в транзакции, шлют сигнал
+    # на каждый удалённый комментарий, включая ответы
+    counters.comment_deleted(instance)
+
+
+@receiver(signal=post_delete, sender=LikeDislike)
+def reaction_deleted(instance: LikeDislike, **kwargs):
+    # снятие реакции в toggle(), админка и каскад от пользователя
+    reactions.reaction_deleted(instance)
@@ -0,0 +1,14 @@
+from celery import Task
+
+from comments import reactions
+from settings import celery_app
+
+
+class FlushReactionsTask(Task):
+    name = "flush-reactions"
+
+    def run(self):
+        return reactions.flush()
+
+
+celery_app.register_task(task=FlushReactionsTask())
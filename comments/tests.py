@@ -1,3 +1,321 @@
+from unittest import mock
+
+import redis
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from redis.exceptions import LockError, RedisError
+from rest_framework.test import APIClient
+
+from comments import reactions
+from comments.counters import reconcile_reaction_counters
+from comments.models import Comments, LikeDislike, ReactionFlush, path_segment
+from common.redis_client import get_sync_client
+from images.models import Gallery, Image
+from posts.models import Post
+from users.models import Client
+
+
+class CommentThreadTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(title="post", description="text")
+        # порядок создания отличается от порядка показа
+        cls.root = Comments.objects.create(post=cls.post, text="root")
+        cls.second_root = Comments.objects.create(post=cls.post, text="root 2")
+        cls.reply = Comments.objects.create(parent=cls.root, text="reply")
+        cls.second_reply = Comments.objects.create(
+            parent=cls.second_root, text="reply 2"
+        )
+        cls.nested = Comments.objects.create(parent=cls.reply, text="nested")
+        cls.thread = [
+            cls.root, cls.reply, cls.nested, cls.second_root, cls.second_reply,
+        ]
+
+    def get(self, **params):
+        return self.client.get(
+            reverse("post-comments-list", args=[self.post.pk]), params
+        )
+
+    def ids(self, response) -> list[int]:
+        self.assertEqual(response.status_code, 200)
+        return [comment["id"] for comment in response.data["results"]]
+
+    def test_save_sets_path_and_depth(self):
+        self.assertEqual(
+            (self.root.path, self.root.depth), (path_segment(self.root.pk), 0)
+        )
+        self.assertEqual(
+            self.reply.path, self.root.path + path_segment(self.reply.pk)
+        )
+        self.assertEqual(self.reply.depth, 1)
+        self.assertEqual(
+            self.nested.path, self.reply.path + path_segment(self.nested.pk)
+        )
+        self.assertEqual(self.nested.depth, 2)
+        # ответ наследует пост родителя, path записан и в БД
+        self.assertEqual(self.nested.post_id, self.post.pk)
+        self.nested.refresh_from_db()
+        self.assertEqual(self.nested.depth, 2)
+
+    def test_thread_is_depth_first(self):
+        self.assertEqual(
+            self.ids(self.get()), [comment.pk for comment in self.thread]
+        )
+
+    def test_max_depth(self):
+        self.assertEqual(
+            self.ids(self.get(max_depth=0)),
+            [self.root.pk, self.second_root.pk],
+        )
+        self.assertEqual(
+            self.ids(self.get(max_depth=1)),
+            [self.root.pk, self.reply.pk, self.second_root.pk,
+             self.second_reply.pk],
+        )
+
+    def test_after_cursor(self):
+        ids, params = [], {"page_size": 2}
+        while True:
+            response = self.get(**params)
+            ids += self.ids(response)
+            if not response.data["has_more"]:
+                break
+            params["after"] = response.data["after"]
+        self.assertEqual(ids, [comment.pk for comment in self.thread])
+        self.assertEqual(self.get(after="not-a-path").status_code, 400)
+
+
+class CommentCountersTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(title="post", description="text")
+
+    def comments_count(self, post: Post | None = None) -> int:
+        return Post.objects.get(pk=(post or self.post).pk).comments_count
+
+    def test_create_increments_with_f_expression(self):
+        with CaptureQueriesContext(connection) as queries:
+            root = Comments.objects.create(post=self.post, text="root")
+        self.assertTrue(any(
+            '"comments_count" + 1' in query["sql"] for query in queries
+        ))
+        Comments.objects.create(parent=root, text="reply")
+        self.assertEqual(self.comments_count(), 2)
+        root.refresh_from_db()
+        self.assertEqual(root.replies_count, 1)
+
+    def test_delete_decrements(self):
+        root = Comments.objects.create(post=self.post, text="root")
+        reply = Comments.objects.create(parent=root, text="reply")
+        reply.delete()
+        self.assertEqual(self.comments_count(), 1)
+        root.refresh_from_db()
+        self.assertEqual(root.replies_count, 0)
+
+    def test_cascade_delete_subtracts_subtree(self):
+        root = Comments.objects.create(post=self.post, text="root")
+        reply = Comments.objects.create(parent=root, text="reply")
+        Comments.objects.create(parent=reply, text="nested")
+        Comments.objects.create(post=self.post, text="other root")
+        root.delete()
+        self.assertEqual(self.comments_count(), 1)
+
+    def test_reconcile_fixes_drift_across_batches(self):
+        posts = [self.post] + [
+            Post.objects.create(title=f"post {i}", description="text")
+            for i in range(2)
+        ]
+        for post in posts:
+            root = Comments.objects.create(post=post, text="root")
+            Comments.objects.create(parent=root, text="reply")
+        # правки в обход сигналов
+        Post.objects.filter(pk__in=[posts[0].pk, posts[2].pk]).update(
+            comments_count=7
+        )
+        Comments.objects.filter(parent=None).update(replies_count=0)
+        call_command("reconcile_comment_counters", batch_size=1)
+        self.assertEqual(
+            [self.comments_count(post) for post in posts], [2, 2, 2]
+        )
+        self.assertEqual(
+            list(Comments.objects.filter(parent=None)
+                 .values_list("replies_count", flat=True)),
+            [1, 1, 1],
+        )
+
+
+class ReactionsTestMixin:
+    """
+    Картинки и пользователи для реакций. Дельты счётчиков живут
+    в Redis (PRESENCE_REDIS_URL): поля тестовых картинок чистятся.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        with mock.patch("users.signals.ActivateAccountTask.apply_async"):
+            cls.users = [
+                Client.objects.create(
+                    username=f"fan{i}", email=f"fan{i}@test.local"
+                )
+                for i in range(2)
+            ]
+        cls.images = [
+            Image.objects.create(image=f"gallery/{i}.png") for i in range(2)
+        ]
+
+    def tearDown(self):
+        fields = [
+            reactions.pending_field(image.pk, counter)
+            for image in self.images for counter in reactions.COUNTERS
+        ]
+        client = get_sync_client()
+        client.hdel(reactions.PENDING_KEY, *fields)
+        client.hdel(reactions.FLUSHING_KEY, *fields)
+
+    def toggle(self, user: Client, image: Image, is_like: bool):
+        with self.captureOnCommitCallbacks(execute=True):
+            return reactions.toggle(
+                user.pk, image.pk, "gallery_image", is_like
+            )
+
+    def counts(self, image: Image, user: Client | None = None) -> tuple:
+        row, = reactions.reactions((user or self.users[0]).pk, [image.pk])
+        return row["likes"], row["dislikes"], row["my_reaction"]
+
+
+class ReactionToggleTest(ReactionsTestMixin, TestCase):
+
+    def test_like_unlike_and_switch(self):
+        fan, other = self.users
+        image = self.images[0]
+        self.assertTrue(self.toggle(fan, image, True))
+        self.assertTrue(self.toggle(other, image, True))
+        self.assertEqual(self.counts(image, fan), (2, 0, True))
+        self.assertFalse(self.toggle(fan, image, False))
+        self.assertEqual(self.counts(image, fan), (1, 1, False))
+        self.assertIsNone(self.toggle(fan, image, False))
+        self.assertEqual(self.counts(image, fan), (1, 0, None))
+        self.assertEqual(LikeDislike.objects.count(), 1)
+
+    def test_reaction_deleted_between_insert_and_lock(self):
+        # INSERT наткнулся на строку, которую тут же удалил параллельный
+        # клик: toggle вставляет заново, а не падает с DoesNotExist
+        insert = reactions.insert_reaction
+        attempts = iter([lambda *args: False, insert])
+        with mock.patch(
+            "comments.reactions.insert_reaction",
+            side_effect=lambda *args: next(attempts)(*args),
+        ) as insert_reaction:
+            self.assertTrue(self.toggle(self.users[0], self.images[0], True))
+        self.assertEqual(insert_reaction.call_count, 2)
+        self.assertEqual(self.counts(self.images[0]), (1, 0, True))
+
+    def test_toggle_endpoint_checks_role(self):
+        fan = self.users[0]
+        image = self.images[0]
+        Gallery.objects.create(user=fan).images.add(image)
+        client = APIClient()
+        client.force_authenticate(fan)
+
+        def post(**data):
+            return client.post(
+                reverse("reactions-toggle"),
+                {"image": image.pk, "is_like": True, **data},
+                format="json",
+            )
+
+        response = post()
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(response.data["my_reaction"], True)
+        # картинка из галереи не аватар: роль отклоняется до toggle
+        response = post(target="user_avatar")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("target", response.data)
+        self.assertEqual(post(image=self.images[1].pk).status_code, 400)
+        self.assertEqual(post(image=image.pk + 1000).status_code, 404)
+        self.assertEqual(LikeDislike.objects.count(), 1)
+
+    def test_batch_endpoint(self):
+        fan = self.users[0]
+        self.toggle(fan, self.images[1], False)
+        client = APIClient()
+        client.force_authenticate(fan)
+        ids = ",".join(str(image.pk) for image in self.images)
+        response = client.get(reverse("reactions-list"), {"images": ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (row["image"], row["likes"], row["dislikes"])
+                for row in response.data
+            ],
+            [(self.images[0].pk, 0, 0), (self.images[1].pk, 0, 1)],
+        )
+        self.assertEqual(
+            [row["my_reaction"] for row in response.data], [None, False]
+        )
+
+
+class ReactionFlushTest(ReactionsTestMixin, TestCase):
+
+    def likes_count(self, image: Image) -> int:
+        image.refresh_from_db()
+        return image.likes_count
+
+    def test_flush_moves_deltas_to_image(self):
+        image = self.images[0]
+        for user in self.users:
+            self.toggle(user, image, True)
+        self.assertEqual(reactions.flush(), 1)
+        self.assertEqual(self.likes_count(image), 2)
+        self.assertEqual(self.counts(image), (2, 0, True))
+        self.assertFalse(ReactionFlush.objects.exists())
+
+    def test_rerun_after_crash_does_not_apply_batch_twice(self):
+        # пачка закоммичена, а HDEL её полей не прошёл
+        image = self.images[0]
+        self.toggle(self.users[0], image, True)
+        with mock.patch.object(
+            redis.Redis, "hdel", side_effect=RedisError("down")
+        ):
+            self.assertEqual(reactions.flush(), 0)
+        self.assertEqual(self.likes_count(image), 1)
+        self.assertTrue(ReactionFlush.objects.exists())
+        reactions.flush()
+        self.assertEqual(self.likes_count(image), 1)
+        self.assertEqual(self.counts(image), (1, 0, True))
+        self.assertFalse(ReactionFlush.objects.exists())
+
+    def test_flush_skips_while_locked(self):
+        self.toggle(self.users[0], self.images[0], True)
+        lock = reactions.flush_lock(get_sync_client())
+        self.assertTrue(lock.acquire(blocking=False))
+        try:
+            self.assertEqual(reactions.flush(), 0)
+        finally:
+            lock.release()
+        self.assertEqual(self.likes_count(self.images[0]), 0)
+
+    def test_reconcile_discards_pending_deltas(self):
+        # дельта пришла после переноса, но до пересчёта: пересчёт
+        # уже учёл строку реакции, дельта не должна лечь поверх
+        image = self.images[0]
+        self.toggle(self.users[0], image, True)
+        with mock.patch("comments.counters.flush_pending"):
+            reconcile_reaction_counters()
+        self.assertEqual(self.likes_count(image), 1)
+        self.assertEqual(self.counts(image), (1, 0, True))
 
-# Create your tests here.
+    def test_reconcile_raises_while_flush_holds_lock(self):
+        lock = reactions.flush_lock(get_sync_client())
+        self.assertTrue(lock.acquire(blocking=False))
+        try:
+            with mock.patch("comments.counters.FLUSH_LOCK_TTL", 0.1):
+                with self.assertRaises(LockError):
+                    reconcile_reaction_counters()
+        finally:
+            lock.release()
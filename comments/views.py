@@ -1,3 +1,112 @@
-from django.shortcuts import render
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.exceptions import NotFound
+from rest_framework.viewsets import ViewSet
+from rest_framework.decorators import action
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
 
-# Create your views here.
+from comments import reactions
+from comments.models import Comments
+from comments.paginators import CommentThreadPagination
+from comments.serializers import (
+    CommentThreadSerializer, ReactionBatchSerializer,
+    ReactionCountsSerializer, ReactionToggleSerializer,
+)
+from posts.models import Post
+
+
+class CommentThreadViewSet(ViewSet):
+    """
+    GET /api/v1/posts/<post_pk>/comments/?max_depth=&after=&page_size=
+    Обсуждение поста уже в порядке показа: ответ идёт сразу после
+    родителя, глубина — в depth. Одна выборка по индексу (post_id, path).
+    """
+    permission_classes = [AllowAny]
+    pagination_class = CommentThreadPagination
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                name="max_depth",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="0 — только корневые комментарии",
+            ),
+            openapi.Parameter(
+                name="after",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="path последнего комментария прошлой страницы",
+            ),
+            openapi.Parameter(
+                name="page_size",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+        responses={
+            200: CommentThreadSerializer(many=True),
+            400: "bad cursor",
+            404: "post not found",
+        },
+    )
+    def list(self, request: Request, post_pk: int) -> Response:
+        if not Post.objects.filter(pk=post_pk).exists():
+            raise NotFound(detail="post not found")
+        paginator = self.pagination_class()
+        max_depth = paginator.get_int_param(request, "max_depth", minimum=0)
+        comments = Comments.objects.thread(
+            post_id=post_pk, max_depth=max_depth
+        ).select_related("user")
+        page = paginator.paginate_queryset(comments, request, view=self)
+        serializer = CommentThreadSerializer(instance=page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class ReactionViewSet(ViewSet):
+    """
+    GET  /api/v1/reactions/?images=1,2,3   счётчики и своя реакция, до 100 id
+    POST /api/v1/reactions/toggle/         поставить/снять/сменить реакцию
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        query_serializer=ReactionBatchSerializer,
+        responses={
+            200: ReactionCountsSerializer(many=True),
+            400: "bad ids",
+        },
+    )
+    def list(self, request: Request) -> Response:
+        serializer = ReactionBatchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        rows = reactions.reactions(
+            user_id=request.user.pk,
+            image_ids=serializer.validated_data["images"],
+        )
+        return Response(data=ReactionCountsSerializer(rows, many=True).data)
+
+    @swagger_auto_schema(
+        request_body=ReactionToggleSerializer,
+        responses={
+            200: ReactionCountsSerializer,
+            400: "bad request",
+            404: "image not found",
+        },
+    )
+    @action(methods=["post"], detail=False)
+    def toggle(self, request: Request) -> Response:
+        serializer = ReactionToggleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        image_id = serializer.validated_data["image"]
+        reactions.toggle(
+            user_id=request.user.pk,
+            image_id=image_id,
+            target=serializer.validated_data["target"],
+            is_like=serializer.validated_data["is_like"],
+        )
+        # перечитываем: счётчики с учётом параллельных кликов
+        row, = reactions.reactions(request.user.pk, [image_id])
+        return Response(data=ReactionCountsSerializer(row).data)
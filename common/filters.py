@@ -1,10 +1,12 @@
 from typing import Any
 
-from loguru import logger
 from rest_framework.request import Request
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.filters import BaseFilterBackend
-from django.db.models import Q, QuerySet
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Q, QuerySet
+
+from common.search import build_search_vector
 
 
 class SearchFilter(BaseFilterBackend):
@@ -17,9 +19,7 @@ class SearchFilter(BaseFilterBackend):
         search_fields: list = getattr(view, "search_fields", [])
         search_value = request.query_params.get("search")
         if not search_value:
-            logger.info("There is no search value")
             return queryset
-        logger.info("We get value, let's filter this shit")
         query = Q()
         for field in search_fields:
             query |= Q(**{f"{field}__icontains": search_value})
@@ -27,6 +27,52 @@ class SearchFilter(BaseFilterBackend):
         return queryset.filter(query)
         
 
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Полнотекстовый поиск Postgres вместо OR из icontains.
+    ?search= разбирается как websearch_to_tsquery ("a b", -c, "фраза"),
+    результаты сортируются по релевантности и получают атрибут rank.
+    Во вьюшке: search_fields и, при желании, search_weights
+    {поле: "A".."D"}. Если поля и веса совпадают с хранимым
+    search_vector модели (SEARCH_WEIGHTS), поиск идёт по GIN-индексу,
+    иначе вектор считается на лету (без индекса).
+    """
+    search_param = "search"
+
+    def get_weights(self, view, model) -> dict[str, str]:
+        stored = getattr(model, "SEARCH_WEIGHTS", {})
+        weights = getattr(view, "search_weights", {})
+        return {
+            field: weights.get(field, stored.get(field, "D"))
+            for field in getattr(view, "search_fields", [])
+        }
+
+    def filter_queryset(
+        self,
+        request: Request,
+        queryset: QuerySet,
+        view: ModelViewSet | Any
+    ):
+        search_value = request.query_params.get(self.search_param, "").strip()
+        weights = self.get_weights(view, queryset.model)
+        if not search_value or not weights:
+            return queryset
+        config = getattr(queryset.model, "SEARCH_CONFIG", "simple")
+        query = SearchQuery(search_value, search_type="websearch", config=config)
+        if weights == getattr(queryset.model, "SEARCH_WEIGHTS", None):
+            vector = F("search_vector")
+        else:
+            queryset = queryset.annotate(
+                search_vector_view=build_search_vector(weights, config)
+            )
+            vector = F("search_vector_view")
+        return queryset.filter(
+            **{vector.name: query}
+        ).annotate(
+            rank=SearchRank(vector, query)
+        ).order_by("-rank", "-pk")
+
+
 class SortFilter(BaseFilterBackend):
     """
     Создайте фильтр сортировки по date_joined
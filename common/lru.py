@@ -0,0 +1,41 @@
+import time
+from collections import OrderedDict
+
+
+class ExpiringLRU:
+    """
+    LRU в памяти процесса: ключ -> (значение, момент истечения по time.time()).
+    Не потокобезопасен: рассчитан на один цикл событий (консьюмеры channels).
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.items: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        item = self.items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        value, expires_at = item
+        if expires_at <= time.time():
+            del self.items[key]
+            self.misses += 1
+            return None
+        self.items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, expires_at: float):
+        self.items[key] = (value, expires_at)
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def pop(self, key):
+        self.items.pop(key, None)
+
+    def clear(self):
+        self.items.clear()
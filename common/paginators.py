@@ -1,7 +1,75 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 10  # сколько объектов на странице
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по курсору id: ?before_id=<id> листает назад,
+    ?after_id=<id> — вперёд, без параметров — последняя страница.
+    Оба курсора сразу — 400.
+    Не делает COUNT(*) и OFFSET, поэтому скорость не зависит от
+    размера таблицы, если queryset отфильтрован по префиксу индекса.
+    Результаты всегда идут по возрастанию id.
+    """
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def get_int_param(
+        self, request: Request, name: str, minimum: int = 1
+    ) -> int | None:
+        value = request.query_params.get(name)
+        if value is None:
+            return None
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError(detail={name: "must be an integer"})
+        if value < minimum:
+            raise ValidationError(detail={name: f"must be >= {minimum}"})
+        return value
+
+    def get_page_size(self, request: Request) -> int:
+        page_size = self.get_int_param(request, self.page_size_query_param)
+        if page_size is None:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None) -> list:
+        limit = self.get_page_size(request)
+        before_id = self.get_int_param(request, "before_id")
+        after_id = self.get_int_param(request, "after_id")
+        if before_id is not None and after_id is not None:
+            raise ValidationError(
+                detail="before_id and after_id are mutually exclusive"
+            )
+        if after_id is not None:
+            page = list(
+                queryset.filter(pk__gt=after_id).order_by("pk")[:limit + 1]
+            )
+            self.has_more = len(page) > limit
+            page = page[:limit]
+        else:
+            if before_id is not None:
+                queryset = queryset.filter(pk__lt=before_id)
+            page = list(queryset.order_by("-pk")[:limit + 1])
+            self.has_more = len(page) > limit
+            page = page[:limit][::-1]
+        self.page = page
+        return page
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(data={
+            "before_id": self.page[0].pk if self.page else None,
+            "after_id": self.page[-1].pk if self.page else None,
+            "has_more": self.has_more,
+            "results": data,
+        })
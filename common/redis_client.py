@@ -0,0 +1,29 @@
+import asyncio
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+
+# Общие клиенты Redis (PRESENCE_REDIS_URL) для presence, чатов, лент
+# и счётчиков реакций: по одному пулу соединений на процесс.
+_async_client: aioredis.Redis | None = None
+_async_loop: asyncio.AbstractEventLoop | None = None
+_sync_client: redis.Redis | None = None
+
+
+def get_async_client() -> aioredis.Redis:
+    # пул соединений redis.asyncio привязан к циклу событий
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_loop is not loop:
+        _async_client = aioredis.Redis.from_url(settings.PRESENCE_REDIS_URL)
+        _async_loop = loop
+    return _async_client
+
+
+def get_sync_client() -> redis.Redis:
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(settings.PRESENCE_REDIS_URL)
+    return _sync_client
@@ -0,0 +1,16 @@
+from functools import reduce
+from operator import add
+
+from django.contrib.postgres.search import SearchVector
+
+
+def build_search_vector(weights: dict[str, str], config: str) -> SearchVector:
+    """
+    setweight(to_tsvector(config, field), weight) || ... по полям.
+    Конфигурация задана явно: так выражение IMMUTABLE и годится
+    для GeneratedField и GIN-индекса.
+    """
+    return reduce(add, (
+        SearchVector(field, weight=weight, config=config)
+        for field, weight in weights.items()
+    ))
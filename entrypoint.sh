@@ -3,6 +3,9 @@
 echo "Применяем миграции..."
 python manage.py migrate
 
+echo "Проверяем ключи шифрования..."
+python manage.py generate_rsa
+
 echo "Собираем статику"
 python manage.py collectstatic
 
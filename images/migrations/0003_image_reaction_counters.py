@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:21
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Image = apps.get_model("images", "Image")
+    LikeDislike = apps.get_model("comments", "LikeDislike")
+
+    def reactions_of(is_like):
+        total = Value(0)
+        for target in ("user_avatar", "public_avatar", "gallery_image"):
+            total = total + Coalesce(
+                Subquery(
+                    LikeDislike.objects.filter(
+                        is_like=is_like, **{target: OuterRef("pk")}
+                    ).order_by().values(target)
+                    .annotate(total=Count("*")).values("total")
+                ),
+                Value(0),
+            )
+        return total
+
+    Image.objects.update(
+        likes_count=reactions_of(True),
+        dislikes_count=reactions_of(False),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0002_gallery_public_gallery_user_and_more'),
+        ('comments', '0002_comments_parent_comments_post_comments_user_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='дизлайков'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='лайков'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -26,6 +26,14 @@ class Image(models.Model):
     created_at = models.DateTimeField(
         verbose_name="дата создания", auto_now_add=True
     )
+    # денормализация LikeDislike по всем трём ролям картинки
+    # (comments.reactions)
+    likes_count = models.PositiveIntegerField(
+        verbose_name="лайков", default=0, editable=False
+    )
+    dislikes_count = models.PositiveIntegerField(
+        verbose_name="дизлайков", default=0, editable=False
+    )
 
     class Meta:
         ordering = ("id",)
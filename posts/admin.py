@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from posts.models import Post, PostImage
+from posts.models import Category, NewsIngestJob, Post, PostImage
 
 
-admin.site.register([Post, PostImage])
+admin.site.register([Category, NewsIngestJob, Post, PostImage])
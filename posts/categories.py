@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from posts.models import Category, PostCategory
+
+
+# Список категорий со счётчиками — один небольшой объект в кэше.
+# Сбрасывается при изменении самих категорий (posts.signals), счётчики
+# в нём отстают от Category.posts_count не больше чем на TTL.
+CATEGORY_LIST_KEY = "categories:list"
+
+
+def category_list() -> list[dict]:
+    return cache.get_or_set(
+        CATEGORY_LIST_KEY,
+        lambda: list(
+            Category.objects.order_by("title")
+            .values("id", "title", "posts_count")
+        ),
+        settings.CATEGORY_LIST_CACHE_TTL,
+    )
+
+
+def latest_post_ids(
+    category_id: int, before_id: int | None, limit: int
+) -> list[int]:
+    """
+    limit + 1 id свежих постов категории, старше поста before_id.
+    Диапазон индекса (category, -date_publication, -post) без Post:
+    все нужные колонки в индексе, подходит index-only scan.
+    """
+    links = PostCategory.objects.filter(category_id=category_id)
+    if before_id is not None:
+        # дата курсора — отдельным запросом по unique (post, category):
+        # в условии страницы только константы, без подзапроса на строку
+        cursor = links.filter(post_id=before_id).values_list(
+            "date_publication", flat=True
+        ).first()
+        if cursor is None:
+            return []
+        links = links.filter(
+            Q(date_publication__lt=cursor)
+            | Q(date_publication=cursor, post_id__lt=before_id)
+        )
+    return list(
+        links.order_by("-date_publication", "-post_id")
+        .values_list("post_id", flat=True)[:limit + 1]
+    )
@@ -0,0 +1,123 @@
+import statistics
+import time
+from types import SimpleNamespace
+
+from loguru import logger
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from common.filters import FullTextSearchFilter, SearchFilter
+from posts.models import Article
+
+
+BENCH_URL = "https://bench.local/"
+SEARCH_FIELDS = ["title", "description", "content"]
+VOCABULARY = (
+    "market election climate energy government president minister court "
+    "police economy inflation bank stock price oil gas war peace talks "
+    "health vaccine hospital school student research university science "
+    "space rocket launch satellite football league match team coach player "
+    "storm flood fire earthquake city village river mountain border trade "
+    "export import tax budget deficit growth crisis strike union worker "
+    "company startup investor profit loss merger technology software phone "
+    "network security attack hacker data privacy law parliament vote "
+    "campaign party leader protest rally festival film music award artist"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк поиска по Article: icontains (SearchFilter) против "
+        "полнотекстового FullTextSearchFilter на --rows сгенерированных строк"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument(
+            "--queries", type=str,
+            default="climate,oil price,football coach,hacker -privacy",
+            help="поисковые запросы через запятую",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--keep", action="store_true",
+            help="не удалять сгенерированные статьи после прогона",
+        )
+
+    def seed(self, rows: int):
+        existing = Article.objects.filter(url__startswith=BENCH_URL).count()
+        if existing >= rows:
+            return
+        logger.info(f"Seeding {rows - existing} articles")
+        # генерация на стороне Postgres: миллион строк за один INSERT
+        words = "ARRAY[" + ",".join(f"'{word}'" for word in VOCABULARY) + "]"
+        text = (
+            "array_to_string(ARRAY(SELECT ({words})[1 + floor(random() * "
+            "{count})::int] FROM generate_series(1, {length}) "
+            "WHERE g.g > 0), ' ')"
+        )
+
+        def phrase(length: int) -> str:
+            return text.format(
+                words=words, count=len(VOCABULARY), length=length
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO posts_article (
+                    source_name, author, title, description, url,
+                    url_to_image, published_at, content
+                )
+                SELECT
+                    'bench', '', {phrase(8)}, {phrase(30)},
+                    %s || g.g, '', now() - g.g * interval '1 second',
+                    {phrase(150)}
+                FROM generate_series(%s, %s) AS g
+            """, [BENCH_URL, existing + 1, rows])
+            cursor.execute("ANALYZE posts_article")
+
+    def timed(self, queryset, repeat: int) -> tuple[float, int]:
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            page = list(queryset[:20])
+            durations.append((time.perf_counter() - start) * 1000)
+        return statistics.median(durations), len(page)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("нужен PostgreSQL")
+        self.seed(options["rows"])
+        factory = APIRequestFactory()
+        stored = SimpleNamespace(search_fields=SEARCH_FIELDS)
+        # веса не совпадают с хранимыми: вектор считается на лету
+        computed = SimpleNamespace(
+            search_fields=SEARCH_FIELDS,
+            search_weights={"title": "A", "description": "A"},
+        )
+        backends = [
+            ("icontains", SearchFilter(), stored),
+            ("fts stored", FullTextSearchFilter(), stored),
+            ("fts computed", FullTextSearchFilter(), computed),
+        ]
+        queryset = Article.objects.all()
+        logger.info(f"Articles in table: {queryset.count()}")
+        for value in [q for q in options["queries"].split(",") if q]:
+            request = Request(factory.get("/", {"search": value}))
+            for name, backend, view in backends:
+                filtered = backend.filter_queryset(request, queryset, view)
+                ms, found = self.timed(filtered, options["repeat"])
+                logger.info(
+                    f"{value!r:>22} {name:>12}: top-20 in {ms:9.1f} ms "
+                    f"(got {found})"
+                )
+            plan = FullTextSearchFilter().filter_queryset(
+                request, queryset, stored
+            )[:20].explain()
+            logger.info(f"plan:\n{plan}")
+        if not options["keep"]:
+            Article.objects.filter(url__startswith=BENCH_URL).delete()
+        logger.info("Search benchmark finished")
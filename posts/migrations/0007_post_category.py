@@ -0,0 +1,73 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_post_categories(apps, schema_editor):
+    Category = apps.get_model("posts", "Category")
+    Post = apps.get_model("posts", "Post")
+    PostCategory = apps.get_model("posts", "PostCategory")
+    PostCategory.objects.update(date_publication=Subquery(
+        Post.objects.filter(pk=OuterRef("post_id"))
+        .values("date_publication")
+    ))
+    Category.objects.update(posts_count=Coalesce(
+        Subquery(
+            PostCategory.objects.filter(category=OuterRef("pk"))
+            .order_by().values("category")
+            .annotate(total=Count("*")).values("total")
+        ),
+        Value(0),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_post_user_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='постов'),
+        ),
+        # таблица posts_post_categories уже есть: неявная M2M
+        # становится моделью PostCategory без пересоздания
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PostCategory',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posts.category', verbose_name='категория')),
+                        ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posts.post', verbose_name='статья')),
+                    ],
+                    options={
+                        'verbose_name': 'категория статьи',
+                        'verbose_name_plural': 'категории статей',
+                        'db_table': 'posts_post_categories',
+                        'unique_together': {('post', 'category')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='categories',
+                    field=models.ManyToManyField(related_name='post_categories', through='posts.PostCategory', to='posts.category', verbose_name='категории'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='postcategory',
+            name='date_publication',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='дата публикации'),
+        ),
+        migrations.RunPython(fill_post_categories, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='postcategory',
+            index=models.Index(fields=['category', '-date_publication', 'post'], name='post_category_latest_idx'),
+        ),
+    ]
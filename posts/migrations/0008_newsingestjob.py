@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:29
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_post_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsIngestJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'в очереди'), ('running', 'выполняется'), ('done', 'готово'), ('failed', 'ошибка')], default='pending', max_length=10, verbose_name='статус')),
+                ('params', models.JSONField(default=dict, verbose_name='параметры')),
+                ('pages_total', models.PositiveIntegerField(default=0, verbose_name='страниц всего')),
+                ('pages_done', models.PositiveIntegerField(default=0, verbose_name='страниц загружено')),
+                ('fetched', models.PositiveIntegerField(default=0, verbose_name='получено')),
+                ('inserted', models.PositiveIntegerField(default=0, verbose_name='добавлено')),
+                ('skipped', models.PositiveIntegerField(default=0, verbose_name='пропущено')),
+                ('errors', models.JSONField(default=list, verbose_name='ошибки')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='дата создания')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='дата завершения')),
+            ],
+            options={
+                'verbose_name': 'загрузка новостей',
+                'verbose_name_plural': 'загрузки новостей',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
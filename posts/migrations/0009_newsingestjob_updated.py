@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_newsingestjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsingestjob',
+            name='updated',
+            field=models.PositiveIntegerField(default=0, verbose_name='обновлено'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_newsingestjob_updated'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='postcategory',
+            name='post_category_latest_idx',
+        ),
+        migrations.AddIndex(
+            model_name='postcategory',
+            index=models.Index(fields=['category', '-date_publication', '-post'], name='post_category_latest_idx'),
+        ),
+    ]
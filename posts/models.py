@@ -1,11 +1,21 @@
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 
+from common.search import build_search_vector
+
 
 class Category(models.Model):
     title = models.CharField(
         verbose_name="категория", unique=True, max_length=50
     )
+    # денормализация: меняется вместе с PostCategory (posts.signals)
+    posts_count = models.PositiveIntegerField(
+        verbose_name="постов", default=0, editable=False
+    )
 
     class Meta:
         ordering = ("id",)
@@ -38,9 +48,24 @@ class Post(models.Model):
     )
     categories = models.ManyToManyField(
         to=Category,
+        through="PostCategory",
         verbose_name="категории",
         related_name="post_categories",
     )
+    # денормализация: меняется вместе с Comments (comments.signals)
+    comments_count = models.PositiveIntegerField(
+        verbose_name="комментариев",
+        default=0,
+        editable=False,
+    )
+    # полнотекстовый индекс (common.filters.FullTextSearchFilter)
+    SEARCH_CONFIG = "russian"
+    SEARCH_WEIGHTS = {"title": "A", "description": "B"}
+    search_vector = models.GeneratedField(
+        expression=build_search_vector(SEARCH_WEIGHTS, SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     class Meta:
         ordering = ("id",)
@@ -51,11 +76,57 @@ class Post(models.Model):
                 fields=["title", "user"], name="unique_post"
             )
         ]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="post_search_vector_idx"),
+            # лента друзей (posts.timeline): свежие посты автора
+            models.Index(
+                fields=["user", "-date_publication"],
+                name="post_user_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} | {self.date_publication}"
 
 
+class PostCategory(models.Model):
+    """
+    Связь поста с категорией (бывшая неявная таблица M2M). Копия
+    date_publication поста позволяет отдать свежие посты категории
+    диапазоном индекса post_category_latest_idx, не трогая Post.
+    """
+    post = models.ForeignKey(
+        to=Post,
+        on_delete=models.CASCADE,
+        verbose_name="статья",
+    )
+    category = models.ForeignKey(
+        to=Category,
+        on_delete=models.CASCADE,
+        verbose_name="категория",
+    )
+    # заполняется из поста в posts.signals, default — для M2M add()
+    date_publication = models.DateTimeField(
+        verbose_name="дата публикации",
+        default=timezone.now,
+    )
+
+    class Meta:
+        db_table = "posts_post_categories"
+        verbose_name = "категория статьи"
+        verbose_name_plural = "категории статей"
+        unique_together = [("post", "category")]
+        indexes = [
+            models.Index(
+                fields=["category", "-date_publication", "-post"],
+                name="post_category_latest_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} | {self.category_id}"
+
+
 class PostImage(models.Model):
     image = models.ForeignKey(
         to="images.Image",
@@ -95,9 +166,67 @@ class Article(models.Model):
     url_to_image = models.URLField(blank=True)
     published_at = models.DateTimeField()
     content = models.TextField(blank=True)
+    # NewsAPI тянется с language=en
+    SEARCH_CONFIG = "english"
+    SEARCH_WEIGHTS = {"title": "A", "description": "B", "content": "C"}
+    search_vector = models.GeneratedField(
+        expression=build_search_vector(SEARCH_WEIGHTS, SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     class Meta:
         ordering = ("-published_at",)
+        indexes = [
+            GinIndex(
+                fields=["search_vector"], name="article_search_vector_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.title[:80]
+
+
+class NewsIngestJob(models.Model):
+    """Фоновая загрузка статей из NewsAPI (posts.news), её прогресс."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "в очереди"
+        RUNNING = "running", "выполняется"
+        DONE = "done", "готово"
+        FAILED = "failed", "ошибка"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(
+        verbose_name="статус",
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    # {"queries": [...], "countries": [...], "pages": N}
+    params = models.JSONField(verbose_name="параметры", default=dict)
+    pages_total = models.PositiveIntegerField(
+        verbose_name="страниц всего", default=0
+    )
+    pages_done = models.PositiveIntegerField(
+        verbose_name="страниц загружено", default=0
+    )
+    fetched = models.PositiveIntegerField(verbose_name="получено", default=0)
+    inserted = models.PositiveIntegerField(verbose_name="добавлено", default=0)
+    updated = models.PositiveIntegerField(verbose_name="обновлено", default=0)
+    skipped = models.PositiveIntegerField(verbose_name="пропущено", default=0)
+    errors = models.JSONField(verbose_name="ошибки", default=list)
+    created_at = models.DateTimeField(
+        verbose_name="дата создания", auto_now_add=True
+    )
+    finished_at = models.DateTimeField(
+        verbose_name="дата завершения", null=True, blank=True
+    )
+
+    class Meta:
+        ordering = ("-created_at",)
+        verbose_name = "загрузка новостей"
+        verbose_name_plural = "загрузки новостей"
+
+    def __str__(self):
+        return f"{self.pk} | {self.status}"
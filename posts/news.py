@@ -0,0 +1,259 @@
+import math
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from itertools import islice
+from typing import Iterable
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from loguru import logger
+
+from posts.models import Article, NewsIngestJob
+
+
+# Загрузка статей из NewsAPI в фоне (IngestNewsTask). Задание — набор
+# запросов: по строке q — /everything, по стране — /top-headlines.
+# Страницы всех запросов качаются пулом из NEWSAPI_CONCURRENCY потоков,
+# в полёте не больше NEWSAPI_CONCURRENCY страниц; каждая сохраняется
+# в основном потоке, как только пришла, так что память ограничена.
+PAGE_SIZE = 100
+# всё, кроме url: по ним решается, изменилась ли статья
+UPSERT_FIELDS = (
+    "source_id", "source_name", "author", "title", "description",
+    "url_to_image", "published_at", "content",
+)
+
+
+def specs(queries: list[str], countries: list[str]) -> list[tuple[str, dict]]:
+    return [
+        ("everything", {"q": q, "sortBy": "publishedAt", "language": "en"})
+        for q in queries
+    ] + [
+        ("top-headlines", {"country": country}) for country in countries
+    ]
+
+
+def fetch_page(endpoint: str, params: dict, page: int) -> dict:
+    response = requests.get(
+        f"{settings.NEWSAPI_BASE_URL.rstrip('/')}/{endpoint}",
+        params={
+            **params,
+            "page": page,
+            "pageSize": PAGE_SIZE,
+            "apiKey": settings.NEWSAPI_KEY,
+        },
+        timeout=settings.NEWSAPI_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json() or {}
+
+
+def describe_error(error: Exception) -> str:
+    # текст requests содержит URL с apiKey, а ошибки видны в API
+    response = getattr(error, "response", None)
+    if response is not None:
+        return f"HTTP {response.status_code}"
+    return type(error).__name__
+
+
+def parse_published_at(value: str | None) -> datetime | None:
+    """None без даты или с нечитаемой датой: её подставит fill_published_at."""
+    if not value:
+        return None
+    try:
+        # ISO8601, часто с 'Z'
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def fill_published_at(articles: list[Article]):
+    """
+    Статьям без даты — дата, уже сохранённая под этим url, иначе
+    текущее время: с now() на каждом прогоне такая статья считалась бы
+    изменившейся (updated) и переписывалась бы каждый раз.
+    """
+    missing = {
+        article.url: article for article in articles
+        if article.published_at is None
+    }
+    if not missing:
+        return
+    saved = dict(
+        Article.objects.filter(url__in=missing)
+        .values_list("url", "published_at")
+    )
+    now = timezone.now()
+    for url, article in missing.items():
+        article.published_at = saved.get(url, now)
+
+
+def max_length(name: str) -> int:
+    return Article._meta.get_field(name).max_length
+
+
+def clip(value: str | None, name: str) -> str:
+    return (value or "")[:max_length(name)]
+
+
+def to_article(item: dict) -> Article | None:
+    """
+    Статья из ответа API или None без url. Обрезанный URL битый:
+    слишком длинная статья пропускается, слишком длинная картинка
+    отбрасывается; текстовые поля обрезаются по max_length.
+    """
+    url = item.get("url")
+    if not url or len(url) > max_length("url"):
+        return None
+    image = item.get("urlToImage") or ""
+    if len(image) > max_length("url_to_image"):
+        image = ""
+    source = item.get("source") or {}
+    return Article(
+        source_id=clip(source.get("id"), "source_id") or None,
+        source_name=clip(source.get("name"), "source_name"),
+        author=clip(item.get("author"), "author"),
+        title=clip(item.get("title"), "title"),
+        description=item.get("description") or "",
+        url=url,
+        url_to_image=image,
+        published_at=parse_published_at(item.get("publishedAt")),
+        content=item.get("content") or "",
+    )
+
+
+def upsert_batch(articles: list[Article]) -> tuple[int, int]:
+    """
+    Один INSERT ... ON CONFLICT (url) DO UPDATE на пачку. Строка
+    обновляется, только если что-то изменилось (IS DISTINCT FROM),
+    и только тогда попадает в RETURNING; xmax = 0 у вставленных.
+    Возвращает (inserted, updated).
+    """
+    table = Article._meta.db_table
+    fields = [Article._meta.get_field(name) for name in ("url", *UPSERT_FIELDS)]
+    row = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    params = [
+        field.get_db_prep_save(getattr(article, field.attname), connection)
+        for article in articles for field in fields
+    ]
+    current = ", ".join(f"{table}.{name}" for name in UPSERT_FIELDS)
+    excluded = ", ".join(f"EXCLUDED.{name}" for name in UPSERT_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {table} ({", ".join(f.column for f in fields)})
+            VALUES {", ".join([row] * len(articles))}
+            ON CONFLICT (url) DO UPDATE SET
+                {", ".join(f"{n} = EXCLUDED.{n}" for n in UPSERT_FIELDS)}
+            WHERE ({current}) IS DISTINCT FROM ({excluded})
+            RETURNING (xmax = 0)
+        """, params)
+        inserted = [is_new for is_new, in cursor.fetchall()]
+    return sum(inserted), len(inserted) - sum(inserted)
+
+
+def upsert_articles(
+    items: Iterable[dict], batch_size: int | None = None
+) -> dict:
+    """
+    Потоково сохраняет статьи: в памяти не больше batch_size за раз.
+    skipped — без url, повторы url в пачке и не изменившиеся статьи.
+    """
+    batch_size = batch_size or settings.ARTICLE_UPSERT_BATCH_SIZE
+    stats = {"inserted": 0, "updated": 0, "skipped": 0}
+    items = iter(items)
+    while batch := list(islice(items, batch_size)):
+        # ON CONFLICT не может менять одну строку дважды за запрос
+        articles = {}
+        for item in batch:
+            article = to_article(item)
+            if article is not None:
+                articles[article.url] = article
+        inserted = updated = 0
+        if articles:
+            articles = list(articles.values())
+            fill_published_at(articles)
+            inserted, updated = upsert_batch(articles)
+        stats["inserted"] += inserted
+        stats["updated"] += updated
+        stats["skipped"] += len(batch) - inserted - updated
+    return stats
+
+
+def ingest(job_id) -> dict:
+    job = NewsIngestJob.objects.get(pk=job_id)
+    job.status = NewsIngestJob.Status.RUNNING
+    job.save(update_fields=["status"])
+    max_pages = job.params.get("pages", 1)
+    queue = [
+        (endpoint, params, 1)
+        for endpoint, params in specs(
+            job.params.get("queries", []), job.params.get("countries", [])
+        )
+    ]
+    job.pages_total = len(queue)
+    in_flight: dict[Future, tuple[str, dict, int]] = {}
+    with ThreadPoolExecutor(max_workers=settings.NEWSAPI_CONCURRENCY) as pool:
+        while queue or in_flight:
+            while queue and len(in_flight) < settings.NEWSAPI_CONCURRENCY:
+                task = queue.pop()
+                in_flight[pool.submit(fetch_page, *task)] = task
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                endpoint, params, page = in_flight.pop(future)
+                try:
+                    payload = future.result()
+                except (requests.RequestException, ValueError) as e:
+                    error = f"{endpoint} {params} page {page}: " \
+                        f"{describe_error(e)}"
+                    job.errors.append(error)
+                    logger.warning(f"NewsAPI {error}")
+                    continue
+                if page == 1:
+                    # остальные страницы известны после первой
+                    pages = min(
+                        math.ceil(payload.get("totalResults", 0) / PAGE_SIZE),
+                        max_pages,
+                    )
+                    queue.extend(
+                        (endpoint, params, n) for n in range(2, pages + 1)
+                    )
+                    job.pages_total += max(pages - 1, 0)
+                items = payload.get("articles") or []
+                try:
+                    # страница целиком или никак: повтор не задвоит счётчики
+                    with transaction.atomic():
+                        saved = upsert_articles(items)
+                except DatabaseError as e:
+                    error = f"{endpoint} {params} page {page}: " \
+                        f"{describe_error(e)}"
+                    job.errors.append(error)
+                    logger.warning(f"Failed to save news {error}: {e}")
+                    continue
+                job.pages_done += 1
+                job.fetched += len(items)
+                job.inserted += saved["inserted"]
+                job.updated += saved["updated"]
+                job.skipped += saved["skipped"]
+            job.save(update_fields=[
+                "pages_total", "pages_done", "fetched", "inserted",
+                "updated", "skipped", "errors",
+            ])
+    # ни одной страницы, только ошибки: ключ, лимит API или сеть
+    failed = job.errors and not job.pages_done
+    job.status = (
+        NewsIngestJob.Status.FAILED if failed else NewsIngestJob.Status.DONE
+    )
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "finished_at"])
+    logger.info(
+        f"News job {job.pk}: {job.pages_done}/{job.pages_total} pages, "
+        f"{job.inserted} inserted, {job.updated} updated, "
+        f"{len(job.errors)} errors"
+    )
+    return {
+        "pages": job.pages_done,
+        "inserted": job.inserted,
+        "updated": job.updated,
+    }
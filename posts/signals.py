@@ -0,0 +1,102 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from posts import timeline
+from posts.categories import CATEGORY_LIST_KEY
+from posts.models import Category, Post, PostCategory
+from posts.tasks import FanOutPostTask
+from users.models import Client
+
+
+@receiver(signal=post_save, sender=Post)
+def post_published(instance: Post, created: bool, **kwargs):
+    if created:
+        # после коммита: воркер должен увидеть пост в БД
+        transaction.on_commit(
+            lambda: FanOutPostTask().apply_async(
+                kwargs={"post_id": instance.pk}
+            )
+        )
+    else:
+        # копия даты в PostCategory держит порядок в категории
+        PostCategory.objects.filter(post=instance).exclude(
+            date_publication=instance.date_publication
+        ).update(date_publication=instance.date_publication)
+
+
+def categories_added(links):
+    """Новые связи: дата поста в PostCategory и +1 в счётчики категорий."""
+    links.update(date_publication=Subquery(
+        Post.objects.filter(pk=OuterRef("post_id"))
+        .values("date_publication")
+    ))
+    added = {}
+    for category_id in links.values_list("category_id", flat=True):
+        added[category_id] = added.get(category_id, 0) + 1
+    for category_id, count in added.items():
+        Category.objects.filter(pk=category_id).update(
+            posts_count=F("posts_count") + count
+        )
+
+
+@receiver(signal=m2m_changed, sender=PostCategory)
+def post_categories_added(
+    instance, action: str, reverse: bool, pk_set: set | None, **kwargs
+):
+    # add() вставляет связи bulk_create, без post_save; pk_set здесь —
+    # только действительно добавленные. Удаления ловит post_delete ниже
+    if action != "post_add" or not pk_set:
+        return
+    if reverse:
+        # category.post_categories.add(*posts)
+        links = PostCategory.objects.filter(
+            category=instance, post_id__in=pk_set
+        )
+    else:
+        links = PostCategory.objects.filter(
+            post=instance, category_id__in=pk_set
+        )
+    categories_added(links)
+
+
+@receiver(signal=post_save, sender=PostCategory)
+def post_category_created(instance: PostCategory, created: bool, **kwargs):
+    # PostCategory.objects.create() в обход post.categories.add()
+    if created:
+        categories_added(PostCategory.objects.filter(pk=instance.pk))
+
+
+@receiver(signal=post_delete, sender=PostCategory)
+def post_category_deleted(instance: PostCategory, **kwargs):
+    # remove(), clear() и каскад от Post удаляют строки через Collector,
+    # он шлёт сигнал на каждую
+    Category.objects.filter(
+        pk=instance.category_id, posts_count__gt=0
+    ).update(posts_count=F("posts_count") - 1)
+
+
+@receiver(signal=post_save, sender=Category)
+@receiver(signal=post_delete, sender=Category)
+def category_changed(**kwargs):
+    # счётчики в кэше устаревают только на CATEGORY_LIST_CACHE_TTL
+    transaction.on_commit(lambda: cache.delete(CATEGORY_LIST_KEY))
+
+
+@receiver(signal=m2m_changed, sender=Client.friends.through)
+def friends_changed(
+    instance: Client, action: str, pk_set: set | None, **kwargs
+):
+    # дружба симметрична: меняются ленты обеих сторон
+    if action == "pre_clear":
+        instance._cleared_friend_ids = list(
+            instance.friends.values_list("id", flat=True)
+        )
+    elif action == "post_clear":
+        user_ids = [instance.pk, *getattr(instance, "_cleared_friend_ids", [])]
+        transaction.on_commit(lambda: timeline.invalidate(*user_ids))
+    elif action in ("post_add", "post_remove"):
+        user_ids = [instance.pk, *pk_set]
+        transaction.on_commit(lambda: timeline.invalidate(*user_ids))
@@ -0,0 +1,41 @@
+from celery import Task
+from redis.exceptions import RedisError
+
+from posts import news, timeline
+from posts.models import NewsIngestJob
+from settings import celery_app
+
+
+class FanOutPostTask(Task):
+    name = "fan-out-post"
+    default_retry_delay = 10
+
+    def run(self, post_id: int):
+        try:
+            return timeline.fan_out(post_id)
+        except RedisError as e:
+            # повтор безопасен: ZADD того же поста ничего не меняет
+            raise self.retry(
+                exc=e,
+                countdown=self.default_retry_delay * (self.request.retries + 1),
+            )
+
+
+class IngestNewsTask(Task):
+    name = "ingest-news"
+
+    def run(self, job_id: str):
+        try:
+            return news.ingest(job_id)
+        except Exception as e:
+            # ошибки страниц, записанные до падения, сохраняются
+            job = NewsIngestJob.objects.filter(pk=job_id).first()
+            if job is not None:
+                job.status = NewsIngestJob.Status.FAILED
+                job.errors.append(news.describe_error(e))
+                job.save(update_fields=["status", "errors"])
+            raise
+
+
+celery_app.register_task(task=FanOutPostTask())
+celery_app.register_task(task=IngestNewsTask())
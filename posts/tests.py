@@ -1,3 +1,517 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from celery.exceptions import Retry
+from django.db import DataError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import RedisError
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from common.filters import FullTextSearchFilter
+from common.redis_client import get_sync_client
+from images.models import Image
+from posts import news, timeline
+from posts.models import Article, Category, NewsIngestJob, Post, PostImage
+from posts.tasks import FanOutPostTask, IngestNewsTask
+from users.models import Client
+
+
+class PostViewSetQueriesTest(TestCase):
+    """
+    Число запросов списка и карточки поста не зависит от числа постов,
+    категорий и картинок. Падает, если сериализатор начал ходить
+    в БД за связью, не загруженной в PostViewSet.get_queryset.
+    """
+    # COUNT пагинации + посты с авторами + категории + картинки
+    LIST_QUERIES = 4
+    # пост с автором + категории + картинки
+    RETRIEVE_QUERIES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        with mock.patch("users.signals.ActivateAccountTask.apply_async"):
+            cls.authors = [
+                Client.objects.create(
+                    username=f"author{i}", email=f"author{i}@test.local"
+                )
+                for i in range(3)
+            ]
+        cls.categories = [
+            Category.objects.create(title=f"category {i}") for i in range(3)
+        ]
+        for i in range(12):
+            post = Post.objects.create(
+                title=f"post {i}",
+                description="text",
+                user=cls.authors[i % len(cls.authors)],
+            )
+            post.categories.set(cls.categories[:i % 3 + 1])
+            for position in (2, 0, 1):
+                PostImage.objects.create(
+                    post=post,
+                    position=position,
+                    image=Image.objects.create(image=f"posts/{i}-{position}.png"),
+                )
+        cls.post = post
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        for page_size in (1, 5, 10):
+            with self.assertNumQueries(self.LIST_QUERIES):
+                response = self.client.get(
+                    reverse("posts-list"), {"page_size": page_size}
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["results"]), page_size)
+
+    def test_retrieve_queries(self):
+        with self.assertNumQueries(self.RETRIEVE_QUERIES):
+            response = self.client.get(
+                reverse("posts-detail", args=[self.post.pk])
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [image["position"] for image in response.data["images"]],
+            [0, 1, 2],
+        )
+        self.assertEqual(len(response.data["categories"]), 3)
+        self.assertEqual(response.data["user"]["pk"], self.authors[2].pk)
+
+
+class PostSearchTest(TestCase):
+    """FullTextSearchFilter на PostViewSet (только Postgres)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.in_title = Post.objects.create(
+            title="Oil market", description="Brent is flat today",
+        )
+        cls.in_description = Post.objects.create(
+            title="Morning digest", description="oil price rises again",
+        )
+        Post.objects.create(title="Weather", description="rain tomorrow")
+
+    def search(self, query: str) -> list[dict]:
+        response = self.client.get(reverse("posts-list"), {"search": query})
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def filter(self, query: str, **view_attrs):
+        request = Request(RequestFactory().get("/", {"search": query}))
+        view = type("View", (), {
+            "search_fields": ["title", "description"], **view_attrs,
+        })
+        return FullTextSearchFilter().filter_queryset(
+            request, Post.objects.all(), view
+        )
+
+    def test_stored_vector_ranks_title_above_description(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.search("oil")
+        self.assertEqual(
+            [post["id"] for post in results],
+            [self.in_title.pk, self.in_description.pk],
+        )
+        self.assertGreater(results[0]["rank"], results[1]["rank"])
+        sql = "\n".join(query["sql"] for query in queries)
+        self.assertIn('"search_vector" @@', sql)
+        self.assertNotIn("to_tsvector", sql)
+
+    def test_other_weights_fall_back_to_computed_vector(self):
+        queryset = self.filter(
+            "oil", search_weights={"title": "D", "description": "A"}
+        )
+        self.assertIn("search_vector_view", queryset.query.annotations)
+        # описание теперь весит больше заголовка
+        self.assertEqual(
+            [post.pk for post in queryset],
+            [self.in_description.pk, self.in_title.pk],
+        )
+        stored = self.filter("oil")
+        self.assertNotIn("search_vector_view", stored.query.annotations)
+
+    def test_websearch_syntax(self):
+        self.assertEqual(
+            [post["id"] for post in self.search("oil -price")],
+            [self.in_title.pk],
+        )
+        self.assertEqual(
+            [post["id"] for post in self.search('"price rises"')],
+            [self.in_description.pk],
+        )
+        self.assertEqual(self.search("oil rain"), [])
+
+
+class CategoryPostsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(title="news")
+        now = timezone.now()
+        # по две записи на дату: на границе страниц порядок держит id
+        cls.posts = []
+        for i in range(5):
+            post = Post.objects.create(
+                title=f"post {i}", description="text",
+                date_publication=now - timedelta(minutes=i // 2),
+            )
+            post.categories.add(cls.category)
+            cls.posts.append(post)
+
+    def read_all(self, page_size: int) -> list[int]:
+        url = reverse("categories-posts", args=[self.category.pk])
+        ids, params = [], {"page_size": page_size}
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids += [post["id"] for post in response.data["results"]]
+            if not response.data["has_more"]:
+                return ids
+            params["before_id"] = response.data["before_id"]
+
+    def test_pages_by_date_then_id(self):
+        expected = [
+            post.pk for post in sorted(
+                self.posts,
+                key=lambda post: (post.date_publication, post.pk),
+                reverse=True,
+            )
+        ]
+        self.assertEqual(self.read_all(page_size=2), expected)
+
+    def test_unknown_cursor_gives_empty_page(self):
+        other = Post.objects.create(title="other", description="text")
+        response = self.client.get(
+            reverse("categories-posts", args=[self.category.pk]),
+            {"before_id": other.pk},
+        )
+        self.assertEqual(response.data["results"], [])
+        self.assertFalse(response.data["has_more"])
+
+
+class TimelineTest(TestCase):
+    """Лента друзей в Redis (PRESENCE_REDIS_URL): ключ читателя чистится."""
+
+    @classmethod
+    def setUpTestData(cls):
+        with mock.patch("users.signals.ActivateAccountTask.apply_async"):
+            cls.reader, cls.author = (
+                Client.objects.create(
+                    username=name, email=f"{name}@test.local"
+                )
+                for name in ("reader", "writer")
+            )
+        cls.reader.friends.add(cls.author)
+        # все посты с одной датой: порядок держит только id в курсоре;
+        # id разной длины — как строки "9999999" > "10000000"
+        cls.published_at = timezone.now() - timedelta(hours=1)
+        cls.posts = [
+            Post.objects.create(
+                pk=pk, title=f"post {pk}", description="text",
+                user=cls.author, date_publication=cls.published_at,
+            )
+            for pk in (9_999_998, 9_999_999, 10_000_000, 10_000_001, 99_999_999)
+        ]
+        cls.expected = sorted((post.pk for post in cls.posts), reverse=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def tearDown(self):
+        get_sync_client().delete(timeline.timeline_key(self.reader.pk))
+
+    def read_all(self, page_size: int) -> list[int]:
+        ids, params = [], {"page_size": page_size}
+        while True:
+            response = self.client.get(reverse("timeline-list"), params)
+            self.assertEqual(response.status_code, 200)
+            ids += [post["id"] for post in response.data["results"]]
+            if not response.data["has_more"]:
+                return ids
+            params.update(
+                before=response.data["before"],
+                before_id=response.data["before_id"],
+            )
+
+    def test_same_date_posts_are_paged_by_id(self):
+        self.assertEqual(self.read_all(page_size=2), self.expected)
+
+    def test_fallback_pages_in_the_same_order(self):
+        with mock.patch(
+            "posts.timeline.page_ids", side_effect=RedisError("down")
+        ):
+            self.assertEqual(self.read_all(page_size=2), self.expected)
+
+    def test_mixed_pages_do_not_skip_or_repeat(self):
+        # первая страница из Redis, дальше Redis недоступен
+        response = self.client.get(reverse("timeline-list"), {"page_size": 2})
+        ids = [post["id"] for post in response.data["results"]]
+        with mock.patch(
+            "posts.timeline.page_ids", side_effect=RedisError("down")
+        ):
+            response = self.client.get(reverse("timeline-list"), {
+                "page_size": 10,
+                "before": response.data["before"],
+                "before_id": response.data["before_id"],
+            })
+        ids += [post["id"] for post in response.data["results"]]
+        self.assertEqual(ids, self.expected)
+
+    def test_rebuild_keeps_post_fanned_out_meanwhile(self):
+        # пост опубликован и разослан после чтения БД в rebuild:
+        # пустая лента уже записана, fan-out кладёт пост в неё
+        latest = timeline.latest
+        late = []
+
+        def publish_during_rebuild(user_id):
+            members = latest(user_id)
+            late.append(Post.objects.create(
+                title="late", description="text", user=self.author,
+            ))
+            self.assertEqual(timeline.fan_out(late[0].pk), 1)
+            return members
+
+        with mock.patch(
+            "posts.timeline.latest", side_effect=publish_during_rebuild
+        ) as read:
+            timeline.rebuild(self.reader.pk)
+        self.assertEqual(read.call_count, 1)
+        ids = [post_id for post_id, _ in timeline.page_ids(
+            self.reader.pk, None, 10
+        )]
+        self.assertEqual(ids[0], late[0].pk)
+        self.assertEqual(len(ids), len(self.posts) + 1)
+
+    def test_fan_out_retries_on_redis_error(self):
+        task = FanOutPostTask()
+        with mock.patch(
+            "posts.timeline.fan_out", side_effect=RedisError("down")
+        ), mock.patch.object(task, "retry", side_effect=Retry) as retry:
+            with self.assertRaises(Retry):
+                task.run(self.posts[0].pk)
+        self.assertIsInstance(retry.call_args.kwargs["exc"], RedisError)
+
+
+class NewsAPIStub(BaseHTTPRequestHandler):
+    """
+    Заглушка newsapi.org: /everything отдаёт 250 статей по 100 на
+    страницу, /top-headlines?country=xx падает с 500.
+    """
+    total = 250
+    requests = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.requests.append((url.path, params))
+        if url.path == "/top-headlines" and params.get("country") == "xx":
+            self.send_error(500)
+            return
+        page, size = int(params["page"]), int(params["pageSize"])
+        start = (page - 1) * size
+        articles = [
+            {
+                "source": {"id": None, "name": "stub"},
+                "title": f"{params.get('q', params.get('country'))} {n}",
+                "url": f"https://stub.local/{url.path}/{n}",
+                "publishedAt": "2025-01-01T00:00:00Z",
+            }
+            for n in range(start, min(start + size, self.total))
+        ]
+        body = json.dumps({
+            "status": "ok", "totalResults": self.total, "articles": articles,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class NewsIngestTest(TestCase):
+    """Загрузка статей против локальной заглушки вместо newsapi.org."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), NewsAPIStub)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings = override_settings(
+            NEWSAPI_BASE_URL=f"http://127.0.0.1:{cls.server.server_port}",
+            NEWSAPI_KEY="test",
+            NEWSAPI_CONCURRENCY=2,
+        )
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        NewsAPIStub.requests = []
+
+    def test_ingest_fetches_all_pages_and_records_errors(self):
+        job = NewsIngestJob.objects.create(params={
+            "queries": ["python"], "countries": ["xx"], "pages": 5,
+        })
+        news.ingest(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, NewsIngestJob.Status.DONE)
+        # 3 страницы /everything + 1 упавшая /top-headlines
+        self.assertEqual(job.pages_total, 4)
+        self.assertEqual(job.pages_done, 3)
+        self.assertEqual(job.fetched, 250)
+        self.assertEqual(job.inserted, 250)
+        self.assertEqual(job.updated, 0)
+        self.assertEqual(len(job.errors), 1)
+        self.assertEqual(Article.objects.count(), 250)
+        pages = sorted(
+            int(params["page"]) for path, params in NewsAPIStub.requests
+            if path == "/everything"
+        )
+        self.assertEqual(pages, [1, 2, 3])
+
+    def test_ingest_respects_page_limit(self):
+        job = NewsIngestJob.objects.create(params={
+            "queries": ["python"], "countries": [], "pages": 2,
+        })
+        news.ingest(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.pages_done, 2)
+        self.assertEqual(job.inserted, 200)
+
+    def test_second_run_skips_unchanged_articles(self):
+        params = {"queries": ["python"], "countries": [], "pages": 1}
+        news.ingest(NewsIngestJob.objects.create(params=params).pk)
+        job = NewsIngestJob.objects.create(params=params)
+        news.ingest(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.inserted, job.updated, job.skipped), (0, 0, 100)
+        )
+
+    def test_upsert_counts_inserted_updated_and_unchanged(self):
+        items = [
+            {
+                "url": f"https://stub.local/upsert/{n}",
+                "title": f"title {n}",
+                "publishedAt": "2025-01-01T00:00:00Z",
+            }
+            for n in range(5)
+        ]
+        self.assertEqual(
+            news.upsert_articles(items, batch_size=2),
+            {"inserted": 5, "updated": 0, "skipped": 0},
+        )
+        items[0] = {**items[0], "title": "changed"}
+        # повтор url рядом с оригиналом, в одной пачке из трёх,
+        # и статья без url — skipped
+        items[2:2] = [items[1]]
+        items.append({"title": "no url"})
+        self.assertEqual(
+            news.upsert_articles(items, batch_size=3),
+            {"inserted": 0, "updated": 1, "skipped": 6},
+        )
+        self.assertEqual(
+            Article.objects.get(url=items[0]["url"]).title, "changed"
+        )
+
+    def test_article_without_date_is_unchanged_on_rerun(self):
+        items = [{"url": "https://stub.local/undated", "title": "undated"}]
+        self.assertEqual(news.upsert_articles(items)["inserted"], 1)
+        published_at = Article.objects.get().published_at
+        self.assertEqual(
+            news.upsert_articles(items),
+            {"inserted": 0, "updated": 0, "skipped": 1},
+        )
+        self.assertEqual(Article.objects.get().published_at, published_at)
+
+    def test_failed_page_save_is_recorded_and_others_continue(self):
+        job = NewsIngestJob.objects.create(params={
+            "queries": ["python"], "countries": [], "pages": 3,
+        })
+        saved = {"inserted": 100, "updated": 0, "skipped": 0}
+        with mock.patch(
+            "posts.news.upsert_articles",
+            side_effect=[DataError("too long"), saved, saved],
+        ):
+            news.ingest(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, NewsIngestJob.Status.DONE)
+        self.assertEqual((job.pages_total, job.pages_done), (3, 2))
+        self.assertEqual(job.inserted, 200)
+        self.assertEqual(len(job.errors), 1)
+        self.assertIn("DataError", job.errors[0])
+
+    def test_to_article_limits_field_lengths(self):
+        long_url = "https://stub.local/" + "a" * 200
+        self.assertIsNone(news.to_article({"url": long_url}))
+        article = news.to_article({
+            "url": "https://stub.local/ok",
+            "urlToImage": long_url,
+            "author": "x" * 300,
+            "title": "t" * 600,
+            "source": {"id": "s" * 300, "name": "n" * 300},
+        })
+        self.assertEqual(article.url_to_image, "")
+        self.assertEqual(len(article.author), 255)
+        self.assertEqual(len(article.title), 500)
+        self.assertEqual(len(article.source_id), 255)
+        self.assertEqual(len(article.source_name), 255)
+
+    def test_task_failure_keeps_page_errors(self):
+        job = NewsIngestJob.objects.create(
+            params={"queries": [], "countries": []},
+            errors=["top-headlines page 1: HTTP 500"],
+        )
+        with mock.patch(
+            "posts.news.ingest", side_effect=ValueError("boom")
+        ), self.assertRaises(ValueError):
+            IngestNewsTask().run(str(job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, NewsIngestJob.Status.FAILED)
+        self.assertEqual(
+            job.errors, ["top-headlines page 1: HTTP 500", "ValueError"]
+        )
+
+    def test_only_errors_fail_the_job(self):
+        job = NewsIngestJob.objects.create(params={
+            "queries": [], "countries": ["xx"], "pages": 1,
+        })
+        news.ingest(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, NewsIngestJob.Status.FAILED)
+
+    def test_pull_returns_job_and_queues_task(self):
+        client = APIClient()
+        with mock.patch(
+            "posts.views.IngestNewsTask.apply_async"
+        ) as apply_async, self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                reverse("articles-pull"),
+                {"queries": ["python"], "pages": 2, "force": True},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data["id"]
+        apply_async.assert_called_once_with(kwargs={"job_id": str(job_id)})
+        status = client.get(reverse("articles-job", args=[job_id]))
+        self.assertEqual(status.data["status"], NewsIngestJob.Status.PENDING)
+        self.assertEqual(status.data["params"]["queries"], ["python"])
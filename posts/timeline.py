@@ -0,0 +1,206 @@
+from datetime import datetime, timezone
+
+import redis
+from django.conf import settings
+from django.db.models import Q
+from loguru import logger
+from redis.commands.core import Script
+from redis.exceptions import RedisError
+
+from common.redis_client import get_sync_client
+from posts.models import Post
+from users.models import Client
+
+
+# Лента друзей, fan-out on write: при публикации id поста кладётся
+# в sorted set каждого друга автора (score — время публикации),
+# множество обрезается до TIMELINE_SIZE. Кладём только в уже
+# существующие ленты: холодная (истёк TIMELINE_TTL или ещё не читали)
+# при первом чтении собирается из БД целиком (rebuild).
+# Member — id поста, дополненный нулями до MEMBER_WIDTH: при равном
+# score Redis сравнивает member как строки, с нулями это порядок id,
+# тот же, что у запасного чтения из БД. v2 — ключи с такими member,
+# старые ленты с голыми id просто истекут.
+TIMELINE_KEY = "timeline:v2:{user_id}"
+MEMBER_WIDTH = 20
+# лента без постов тоже должна существовать, иначе каждое чтение — rebuild
+EMPTY_MARKER = 0
+FAN_OUT_CHUNK = 1000
+
+# курсор страницы: (score, id) последнего отданного поста;
+# id None — только по score, как у курсоров до появления id
+Cursor = tuple[float, int | None]
+
+# только в существующую ленту: ZADD в отсутствующий ключ создал бы
+# ленту из одного поста, и rebuild для неё уже не случился бы.
+# ARGV[1] — TIMELINE_SIZE, дальше пары score, post_id.
+PUSH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('ZADD', KEYS[1], unpack(ARGV, 2))
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[1]) - 1)
+    return 1
+end
+return 0
+"""
+
+
+def timeline_key(user_id: int) -> str:
+    return TIMELINE_KEY.format(user_id=user_id)
+
+
+def member(post_id: int) -> str:
+    return f"{post_id:0{MEMBER_WIDTH}d}"
+
+
+def score(published_at: datetime) -> float:
+    return published_at.timestamp()
+
+
+def friend_ids(user_id: int):
+    return Client.friends.through.objects.filter(
+        from_client_id=user_id
+    ).values_list("to_client_id", flat=True)
+
+
+def friends_posts(user_id: int, before: Cursor | None = None):
+    # индекс post_user_date_idx: по диапазону на каждого друга
+    posts = Post.objects.filter(user_id__in=friend_ids(user_id))
+    if before is not None:
+        before_score, before_id = before
+        published_at = datetime.fromtimestamp(before_score, timezone.utc)
+        older = Q(date_publication__lt=published_at)
+        if before_id is not None:
+            older |= Q(date_publication=published_at, id__lt=before_id)
+        posts = posts.filter(older)
+    return posts.order_by("-date_publication", "-id")
+
+
+def latest(user_id: int) -> dict[int, float]:
+    posts = friends_posts(user_id).values_list(
+        "id", "date_publication"
+    )[:settings.TIMELINE_SIZE]
+    return {post_id: score(published_at) for post_id, published_at in posts}
+
+
+def fan_out(post_id: int) -> int:
+    post = Post.objects.filter(pk=post_id).values(
+        "user_id", "date_publication"
+    ).first()
+    if post is None or post["user_id"] is None:
+        return 0
+    client = get_sync_client()
+    push = client.register_script(PUSH_SCRIPT)
+    args = [
+        settings.TIMELINE_SIZE, score(post["date_publication"]), member(post_id)
+    ]
+    pushed = 0
+    chunk = []
+    recipients = friend_ids(post["user_id"]).iterator(chunk_size=FAN_OUT_CHUNK)
+    for user_id in recipients:
+        chunk.append(user_id)
+        if len(chunk) == FAN_OUT_CHUNK:
+            pushed += push_chunk(client, push, chunk, args)
+            chunk = []
+    if chunk:
+        pushed += push_chunk(client, push, chunk, args)
+    return pushed
+
+
+def push_chunk(
+    client: redis.Redis, push: Script, user_ids: list[int], args: list
+) -> int:
+    with client.pipeline(transaction=False) as pipe:
+        for user_id in user_ids:
+            push(keys=[timeline_key(user_id)], args=args, client=pipe)
+        return sum(pipe.execute())
+
+
+def rebuild(user_id: int):
+    # сначала пустая лента, потом чтение БД: пост, опубликованный после
+    # чтения, fan-out уже найдёт в ленте, а не пропустит
+    key = timeline_key(user_id)
+    client = get_sync_client()
+    with client.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.zadd(key, {EMPTY_MARKER: 0})
+        pipe.expire(key, settings.TIMELINE_TTL)
+        pipe.execute()
+    members = latest(user_id)
+    if members:
+        push = client.register_script(PUSH_SCRIPT)
+        push(keys=[key], args=[
+            settings.TIMELINE_SIZE,
+            *(
+                value for post_id, post_score in members.items()
+                for value in (post_score, member(post_id))
+            ),
+        ])
+
+
+def invalidate(*user_ids: int):
+    """Состав друзей изменился: лента соберётся заново при чтении."""
+    if not user_ids:
+        return
+    try:
+        get_sync_client().delete(*(timeline_key(u) for u in user_ids))
+    except RedisError as e:
+        logger.warning(f"Timeline cache unavailable: {e}")
+
+
+def page_ids(
+    user_id: int, before: Cursor | None, limit: int
+) -> list[tuple[int, float]]:
+    """
+    limit + 1 пар (id, score) после курсора before: по убыванию score,
+    при равном score — по убыванию id, как и friends_posts.
+    """
+    client = get_sync_client()
+    key = timeline_key(user_id)
+    if not client.exists(key):
+        rebuild(user_id)
+    top, skip = "+inf", 0
+    if before is not None:
+        top, before_id = before
+        # посты с тем же score, что у курсора: отданы уже те,
+        # у кого id не меньше before_id
+        ties = client.zrangebyscore(key, top, top)
+        skip = len(ties) if before_id is None else sum(
+            int(post_id) >= before_id for post_id in ties
+        )
+    # маркер лежит на score 0, полуинтервал (0 его отсекает
+    rows = client.zrevrangebyscore(
+        key, top, "(0", start=skip, num=limit + 1, withscores=True,
+    )
+    client.expire(key, settings.TIMELINE_TTL)
+    return [(int(post_id), post_score) for post_id, post_score in rows]
+
+
+def page(
+    user_id: int, before: Cursor | None, limit: int
+) -> tuple[list[Post], Cursor | None, bool]:
+    """
+    Страница ленты: посты, курсор следующей страницы и есть ли она.
+    Курсор — (score, id) последнего поста: посты с одинаковой датой
+    на границе страниц не теряются. Id из Redis превращаются в посты
+    одним запросом; удалённые с момента fan-out посты пропускаются.
+    """
+    try:
+        rows = page_ids(user_id, before, limit)
+    except RedisError as e:
+        logger.warning(f"Timeline cache unavailable: {e}")
+        rows = [
+            (post_id, score(published_at))
+            for post_id, published_at in friends_posts(user_id, before)
+            .values_list("id", "date_publication")[:limit + 1]
+        ]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    posts = Post.objects.select_related("user").in_bulk(
+        [post_id for post_id, _ in rows]
+    )
+    cursor = rows[-1][::-1] if rows else None
+    return (
+        [posts[post_id] for post_id, _ in rows if post_id in posts],
+        cursor,
+        has_more,
+    )
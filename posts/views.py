@@ -1,24 +1,80 @@
-import requests
-from datetime import datetime, timedelta
+import uuid
+from datetime import timedelta
 
 from django.utils import timezone
 from django.core.cache import cache
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
 
 from rest_framework import viewsets, permissions, status, serializers
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.request import Request
 from rest_framework.response import Response
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from .models import Article
+from common.filters import FullTextSearchFilter
+from common.paginators import CustomPageNumberPagination, KeysetPagination
+from images.serializers import ImagesSerializer
+from posts import categories, timeline
+from posts.tasks import IngestNewsTask
+from users.serializers import FriendSerializer
+from .models import Article, Category, NewsIngestJob, Post, PostImage
 
 
-api_key = getattr(settings, "NEWSAPI_KEY", None)
+def is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+class NewsPullSerializer(serializers.Serializer):
+    q = serializers.CharField(required=False, default="", allow_blank=True)
+    queries = serializers.ListField(
+        child=serializers.CharField(max_length=500), required=False,
+        default=list, max_length=20,
+    )
+    country = serializers.CharField(
+        required=False, default="", allow_blank=True, max_length=2,
+    )
+    countries = serializers.ListField(
+        child=serializers.CharField(max_length=2), required=False,
+        default=list, max_length=20,
+    )
+    pages = serializers.IntegerField(
+        required=False, default=1, min_value=1,
+        max_value=settings.NEWSAPI_MAX_PAGES,
+    )
+    force = serializers.BooleanField(required=False, default=False)
+
+
+class NewsIngestJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NewsIngestJob
+        fields = [
+            "id",
+            "status",
+            "params",
+            "pages_total",
+            "pages_done",
+            "fetched",
+            "inserted",
+            "updated",
+            "skipped",
+            "errors",
+            "created_at",
+            "finished_at",
+        ]
 
 
 class ArticleSerializer(serializers.ModelSerializer):
+    rank = serializers.SerializerMethodField()
+
     class Meta:
         model = Article
         fields = [
@@ -32,21 +88,29 @@ class ArticleSerializer(serializers.ModelSerializer):
             "url_to_image",
             "published_at",
             "content",
+            "rank",
         ]
 
+    def get_rank(self, obj) -> float | None:
+        # есть только при ?search= (FullTextSearchFilter)
+        return getattr(obj, "rank", None)
+
 
 class ArticleViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    GET  /api/v1/articles/?fresh=true&title_contains=...
-    POST /api/v1/articles/update/   (тянет из NewsAPI, сохраняет только новые)
+    GET  /api/v1/articles/?fresh=true&title_contains=...&search=...
+    POST /api/v1/articles/update/   (ставит загрузку из NewsAPI в очередь)
+    GET  /api/v1/articles/jobs/<id>/  прогресс загрузки
     """
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
     permission_classes = [permissions.AllowAny]
+    filter_backends = [FullTextSearchFilter]
+    search_fields = ["title", "description", "content"]
     swagger_tags = ["Articles"]
 
     @swagger_auto_schema(
-        operation_description="Список статей. Параметры: fresh=true (за 24ч), title_contains=<строка>.",
+        operation_description="Список статей. Параметры: fresh=true (за 24ч), title_contains=<строка>, search=<запрос>.",
         tags=["Articles"],
         manual_parameters=[
             openapi.Parameter(
@@ -61,14 +125,21 @@ class ArticleViewSet(viewsets.ReadOnlyModelViewSet):
                 type=openapi.TYPE_STRING,
                 description="поиск по заголовку (icontains)",
             ),
+            openapi.Parameter(
+                name="search",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="полнотекстовый поиск по заголовку, описанию и тексту, по релевантности",
+            ),
         ],
         responses={200: ArticleSerializer(many=True)},
     )
     def list(self, request, *args, **kwargs):
         fresh = (request.query_params.get("fresh", "").lower() == "true")
         title_contains = request.query_params.get("title_contains", "").strip()
+        search = request.query_params.get("search", "").strip()
 
-        cache_key = f"articles:list:{fresh}:{title_contains or '_'}"
+        cache_key = f"articles:list:{fresh}:{title_contains or '_'}:{search or '_'}"
         cached = cache.get(cache_key)
         if cached is not None:
             return Response(cached)
@@ -79,6 +150,7 @@ class ArticleViewSet(viewsets.ReadOnlyModelViewSet):
             qs = qs.filter(published_at__gte=since)
         if title_contains:
             qs = qs.filter(title__icontains=title_contains)
+        qs = self.filter_queryset(qs)
 
         data = self.get_serializer(qs, many=True).data
         cache.set(cache_key, data, 60 * 10)  # 10 минут
@@ -86,130 +158,283 @@ class ArticleViewSet(viewsets.ReadOnlyModelViewSet):
 
     @swagger_auto_schema(
         operation_description=(
-            "Подтягивает статьи из NewsAPI и сохраняет только новые (по уникальному url). "
-            "Кэширует результат на 30 минут. "
-            "Опциональные поля в JSON: {\"q\": \"python\", \"country\": \"us\", \"force\": true}"
+            "Ставит в очередь загрузку статей из NewsAPI и возвращает задание; "
+            "прогресс — GET /api/v1/articles/jobs/<id>/. Без force повторный "
+            "вызов в течение 30 минут возвращает предыдущее задание. "
+            "Поля в JSON: {\"q\": \"python\", \"queries\": [...], "
+            "\"country\": \"us\", \"countries\": [...], \"pages\": 1, "
+            "\"force\": true}"
         ),
         tags=["Articles"],
-        request_body=openapi.Schema(
-            type=openapi.TYPE_OBJECT,
-            properties={
-                "q": openapi.Schema(type=openapi.TYPE_STRING),
-                "country": openapi.Schema(type=openapi.TYPE_STRING),
-                "force": openapi.Schema(type=openapi.TYPE_BOOLEAN),
-            },
-        ),
+        request_body=NewsPullSerializer,
         responses={
-            200: openapi.Schema(
-                type=openapi.TYPE_OBJECT,
-                properties={
-                    "fetched": openapi.Schema(type=openapi.TYPE_INTEGER),
-                    "inserted": openapi.Schema(type=openapi.TYPE_INTEGER),
-                    "skipped": openapi.Schema(type=openapi.TYPE_INTEGER),
-                    "source": openapi.Schema(type=openapi.TYPE_STRING),
-                    "params": openapi.Schema(
-                        type=openapi.TYPE_OBJECT,
-                        properties={
-                            "q": openapi.Schema(type=openapi.TYPE_STRING),
-                            "country": openapi.Schema(type=openapi.TYPE_STRING),
-                        },
-                    ),
-                },
-            ),
+            200: NewsIngestJobSerializer,
+            202: NewsIngestJobSerializer,
             400: "NEWSAPI_KEY not set",
-            502: "newsapi error",
         },
     )
     @action(methods=["post"], detail=False, url_path="update", permission_classes=[permissions.AllowAny])
     def pull(self, request):
-        # кэш результата обновления (лимит по API)
+        # последнее задание (лимит по API)
         cache_key = "articles:update:last"
-        if not request.data.get("force"):
-            cached = cache.get(cache_key)
-            if cached is not None:
-                return Response(cached)
+        serializer = NewsPullSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if not data["force"]:
+            job = NewsIngestJob.objects.filter(
+                pk=cache.get(cache_key)
+            ).first()
+            if job is not None:
+                return Response(NewsIngestJobSerializer(job).data)
 
-        if not api_key:
+        if not settings.NEWSAPI_KEY:
             return Response({"detail": "NEWSAPI_KEY not set"}, status=status.HTTP_400_BAD_REQUEST)
 
-        q = (request.data.get("q") or "").strip()
-        country = (request.data.get("country") or "us").strip()
-
         # если есть q -> everything, иначе top-headlines по стране
-        if q:
-            url = "https://newsapi.org/v2/everything"
-            params = {
-                "q": q,
-                "sortBy": "publishedAt",
-                "pageSize": 100,
-                "language": "en",
-                "apiKey": api_key,
-            }
-            source_name = "everything"
-        else:
-            url = "https://newsapi.org/v2/top-headlines"
-            params = {"country": country, "pageSize": 100, "apiKey": api_key}
-            source_name = "top-headlines"
+        queries = data["queries"] + ([data["q"]] if data["q"] else [])
+        countries = data["countries"] + (
+            [data["country"]] if data["country"] else []
+        )
+        if not queries and not countries:
+            countries = ["us"]
+        job = NewsIngestJob.objects.create(params={
+            "queries": queries,
+            "countries": countries,
+            "pages": data["pages"],
+        })
+        transaction.on_commit(
+            lambda: IngestNewsTask().apply_async(kwargs={"job_id": str(job.pk)})
+        )
+        cache.set(cache_key, str(job.pk), 60 * 30)  # 30 минут
+        return Response(
+            NewsIngestJobSerializer(job).data, status=status.HTTP_202_ACCEPTED
+        )
 
-        try:
-            r = requests.get(url, params=params, timeout=10)
-            r.raise_for_status()
-        except requests.RequestException as e:
-            return Response({"detail": f"newsapi error: {e}"}, status=502)
+    @swagger_auto_schema(
+        tags=["Articles"],
+        responses={200: NewsIngestJobSerializer, 404: "job not found"},
+    )
+    @action(
+        methods=["get"], detail=False, url_path=r"jobs/(?P<job_id>[0-9a-f-]+)",
+        permission_classes=[permissions.AllowAny],
+    )
+    def job(self, request, job_id: str):
+        job = None
+        if is_uuid(job_id):
+            job = NewsIngestJob.objects.filter(pk=job_id).first()
+        if job is None:
+            raise NotFound(detail="job not found")
+        return Response(NewsIngestJobSerializer(job).data)
 
-        payload = r.json() or {}
-        items = payload.get("articles") or []
 
-        urls = [a.get("url") for a in items if a.get("url")]
-        existing = set(
-            Article.objects.filter(url__in=urls).values_list("url", flat=True)
-        )
+class TimelinePostSerializer(serializers.ModelSerializer):
+    user = FriendSerializer(read_only=True)
+
+    class Meta:
+        model = Post
+        fields = [
+            "id",
+            "title",
+            "description",
+            "date_publication",
+            "user",
+            "comments_count",
+        ]
 
-        new_objs = []
-        for a in items:
-            u = a.get("url")
-            if not u or u in existing:
-                continue
-            src = a.get("source") or {}
-
-            published_at = a.get("publishedAt")
-            if published_at:
-                try:
-                    # ISO8601, часто с 'Z'
-                    if published_at.endswith("Z"):
-                        published_at = datetime.fromisoformat(
-                            published_at.replace("Z", "+00:00")
-                        )
-                    else:
-                        published_at = datetime.fromisoformat(published_at)
-                except Exception:
-                    published_at = timezone.now()
-            else:
-                published_at = timezone.now()
-
-            new_objs.append(
-                Article(
-                    source_id=(src.get("id") or None),
-                    source_name=(src.get("name") or ""),
-                    author=(a.get("author") or ""),
-                    title=(a.get("title") or "")[:500],
-                    description=(a.get("description") or "") or "",
-                    url=u,
-                    url_to_image=(a.get("urlToImage") or "") or "",
-                    published_at=published_at,
-                    content=(a.get("content") or "") or "",
+
+class TimelineViewSet(viewsets.ViewSet):
+    """
+    GET /api/v1/timeline/?before=<cursor>&before_id=<cursor>&page_size=
+    Лента постов друзей из Redis (posts.timeline), новые сверху.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    page_size = 20
+    max_page_size = 100
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                name="before",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_NUMBER,
+                description="курсор из ответа предыдущей страницы",
+            ),
+            openapi.Parameter(
+                name="before_id",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="id из курсора предыдущей страницы",
+            ),
+            openapi.Parameter(
+                name="page_size",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+        responses={
+            200: TimelinePostSerializer(many=True),
+            400: "bad cursor",
+        },
+    )
+    def list(self, request: Request) -> Response:
+        try:
+            before = request.query_params.get("before")
+            before_id = request.query_params.get("before_id")
+            if before is not None:
+                before = float(before), (
+                    int(before_id) if before_id is not None else None
                 )
+            limit = int(request.query_params.get("page_size", self.page_size))
+        except ValueError:
+            raise ValidationError(
+                detail="before, before_id and page_size must be numbers"
             )
+        limit = min(max(limit, 1), self.max_page_size)
+        posts, cursor, has_more = timeline.page(request.user.pk, before, limit)
+        before, before_id = cursor or (None, None)
+        return Response(data={
+            "before": before,
+            "before_id": before_id,
+            "has_more": has_more,
+            "results": TimelinePostSerializer(posts, many=True).data,
+        })
+
 
-        if new_objs:
-            Article.objects.bulk_create(new_objs, ignore_conflicts=True)
-
-        result = {
-            "fetched": len(items),
-            "inserted": len(new_objs),
-            "skipped": len(items) - len(new_objs),
-            "source": source_name,
-            "params": {"q": q, "country": country},
-        }
-        cache.set(cache_key, result, 60 * 30)  # 30 минут
-        return Response(result)
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ["id", "title"]
+
+
+class PostImageSerializer(serializers.ModelSerializer):
+    image = ImagesSerializer(read_only=True)
+
+    class Meta:
+        model = PostImage
+        fields = ["position", "image"]
+
+
+class PostSerializer(serializers.ModelSerializer):
+    """
+    Все связи должны быть загружены заранее (PostViewSet.get_queryset):
+    posts/tests.py проверяет, что число запросов не зависит от страницы.
+    """
+    user = FriendSerializer(read_only=True)
+    categories = CategorySerializer(many=True, read_only=True)
+    images = PostImageSerializer(many=True, read_only=True)
+    rank = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Post
+        fields = [
+            "id",
+            "title",
+            "description",
+            "date_publication",
+            "user",
+            "categories",
+            "images",
+            "comments_count",
+            "rank",
+        ]
+
+    def get_rank(self, obj) -> float | None:
+        # есть только при ?search= (FullTextSearchFilter)
+        return getattr(obj, "rank", None)
+
+
+def posts_with_relations():
+    """Автор — JOIN, категории и картинки — по одному IN-запросу."""
+    return Post.objects.select_related("user").prefetch_related(
+        "categories",
+        Prefetch(
+            "images",
+            queryset=PostImage.objects.select_related("image")
+            .order_by("position", "id"),
+        ),
+    )
+
+
+class PostViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    GET /api/v1/posts/?search=   посты, новые сверху; с search —
+                                 по релевантности (Post.search_vector)
+    GET /api/v1/posts/<pk>/      один пост
+    """
+    serializer_class = PostSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = CustomPageNumberPagination
+    filter_backends = [FullTextSearchFilter]
+    # те же поля, что в Post.SEARCH_WEIGHTS: поиск идёт по GIN-индексу
+    search_fields = ["title", "description"]
+
+    def get_queryset(self):
+        return posts_with_relations().order_by("-date_publication", "-id")
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                name="search",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="полнотекстовый поиск по заголовку и описанию, по релевантности",
+            ),
+        ],
+        responses={200: PostSerializer(many=True)},
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
+class CategoryCountSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    posts_count = serializers.IntegerField()
+
+
+class CategoryViewSet(viewsets.ViewSet):
+    """
+    GET /api/v1/categories/                  категории с числом постов
+    GET /api/v1/categories/<pk>/posts/?before_id=&page_size=
+                                             свежие посты категории
+    """
+    permission_classes = [permissions.AllowAny]
+
+    @swagger_auto_schema(responses={200: CategoryCountSerializer(many=True)})
+    def list(self, request: Request) -> Response:
+        return Response(data=categories.category_list())
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                name="before_id",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="id последнего поста прошлой страницы",
+            ),
+            openapi.Parameter(
+                name="page_size",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+        responses={200: PostSerializer(many=True), 400: "bad cursor"},
+    )
+    @action(methods=["get"], detail=True)
+    def posts(self, request: Request, pk: int) -> Response:
+        paginator = KeysetPagination()
+        limit = paginator.get_page_size(request)
+        ids = categories.latest_post_ids(
+            category_id=pk,
+            before_id=paginator.get_int_param(request, "before_id"),
+            limit=limit,
+        )
+        has_more = len(ids) > limit
+        ids = ids[:limit]
+        posts = posts_with_relations().in_bulk(ids)
+        page = [posts[post_id] for post_id in ids if post_id in posts]
+        return Response(data={
+            "before_id": ids[-1] if ids else None,
+            "has_more": has_more,
+            "results": PostSerializer(page, many=True).data,
+        })
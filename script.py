@@ -1,21 +1,215 @@
+"""
+Нагрузочный тест чата по websocket.
+
+Запуск локально:
+    CHANNEL_LAYER=memory daphne settings.asgi:application -p 8000
+    python script.py --token <access> --rooms 1,2,3 --clients 1000 \
+        --rate 500 --duration 30
+
+Открывает --clients подключений к ws/chat/<room>/ (по кругу между
+комнатами и серверами из --url), шлёт суммарно --rate сообщений
+в секунду и считает задержку доставки от отправки до получения каждым
+участником комнаты. Результат пишется в --output (JSON).
+"""
+import argparse
 import asyncio
-import websockets
 import json
+import random
+import statistics
+import time
+
+import msgpack
+import websockets
+
+
+MARKER = "load:"
+
+
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.dropped = 0
+        self.sent = 0
+        self.received = 0
+        self.expected = 0
+        self.latencies: list[float] = []
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    index = max(0, int(round(len(values) * percent / 100)) - 1)
+    return values[index]
+
+
+def parse_sent_at(frame: str | bytes) -> float | None:
+    if isinstance(frame, bytes):
+        data = msgpack.unpackb(frame)
+    else:
+        data = json.loads(frame)
+    text = data.get("text") or ""
+    if not text.startswith(MARKER):
+        return None
+    return float(text.rsplit(":", 1)[1])
+
+
+async def reader(ws, stats: Stats):
+    try:
+        async for frame in ws:
+            sent_at = parse_sent_at(frame)
+            if sent_at is None:
+                continue
+            stats.received += 1
+            stats.latencies.append(time.perf_counter() - sent_at)
+    except websockets.ConnectionClosed:
+        stats.dropped += 1
+
+
+async def writer(
+    ws, index: int, members: int, interval: float, deadline: float,
+    args, stats: Stats,
+):
+    await asyncio.sleep(random.uniform(0, interval))
+    next_send = time.perf_counter()
+    while next_send < deadline:
+        payload = {"text": f"{MARKER}{index}:{time.perf_counter()}"}
+        if args.protocol == "msgpack":
+            payload = msgpack.packb(payload)
+        else:
+            payload = json.dumps(payload)
+        try:
+            await ws.send(payload)
+        except websockets.ConnectionClosed:
+            return
+        stats.sent += 1
+        stats.expected += members
+        next_send += interval
+        await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+
+async def open_client(
+    url: str, protocol: str, semaphore: asyncio.Semaphore, stats: Stats,
+):
+    async with semaphore:
+        try:
+            ws = await websockets.connect(
+                url, subprotocols=[f"chat.{protocol}"], open_timeout=30
+            )
+        except (OSError, websockets.InvalidHandshake, asyncio.TimeoutError):
+            stats.failed += 1
+            return None
+    stats.connected += 1
+    return ws
+
+
+async def run(args) -> dict:
+    rooms = [room for room in args.rooms.split(",") if room]
+    servers = [url for url in args.url.split(",") if url]
+    stats = Stats()
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    # участники одной комнаты распределяются по всем серверам,
+    # так проверяется доставка между процессами через channel layer
+    targets = [
+        (rooms[i % len(rooms)], servers[(i // len(rooms)) % len(servers)])
+        for i in range(args.clients)
+    ]
+    sockets = await asyncio.gather(*(
+        open_client(
+            f"{server}/ws/chat/{room}/?token={args.token}",
+            args.protocol, semaphore, stats,
+        )
+        for room, server in targets
+    ))
+    clients = [
+        (room, ws) for (room, _), ws in zip(targets, sockets) if ws is not None
+    ]
+    members: dict[str, int] = {}
+    for room, _ in clients:
+        members[room] = members.get(room, 0) + 1
+
+    readers = [
+        asyncio.create_task(reader(ws, stats)) for _, ws in clients
+    ]
+    interval = len(clients) / args.rate if args.rate else float("inf")
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(
+        writer(ws, index, members[room], interval, deadline, args, stats)
+        for index, (room, ws) in enumerate(clients)
+    ))
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(args.drain)
+
+    for _, ws in clients:
+        await ws.close()
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+
+    latencies = sorted(stats.latencies)
+    return {
+        "config": vars(args),
+        "connected": stats.connected,
+        "failed_connects": stats.failed,
+        "dropped": stats.dropped,
+        "sent": stats.sent,
+        "received": stats.received,
+        "expected": stats.expected,
+        "lost": max(0, stats.expected - stats.received),
+        "duration_sec": round(elapsed, 3),
+        "sent_per_sec": round(stats.sent / elapsed, 1),
+        "messages_per_sec": round(stats.received / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "mean": round(
+                statistics.fmean(latencies) * 1000 if latencies else 0.0, 3
+            ),
+            "max": round(latencies[-1] * 1000 if latencies else 0.0, 3),
+        },
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="websocket chat load test")
+    parser.add_argument(
+        "--url", default="ws://127.0.0.1:8000",
+        help="один или несколько серверов через запятую",
+    )
+    parser.add_argument(
+        "--rooms", default="1", help="id чатов через запятую"
+    )
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument(
+        "--rate", type=float, default=100.0,
+        help="сообщений в секунду суммарно",
+    )
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--drain", type=float, default=2.0,
+        help="сколько ждать доставки после последней отправки",
+    )
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument(
+        "--protocol", choices=["json", "msgpack"], default="json",
+        help="подпротокол websocket (формат кадров)",
+    )
+    parser.add_argument(
+        "--token", required=True,
+        help="access JWT отправителя (пользователь — участник чатов)",
+    )
+    parser.add_argument("--output", default="load_result.json")
+    return parser.parse_args()
 
 
-async def test():
-    uri = "ws://127.0.0.1:8000/ws/chat/room1/"
-    async with websockets.connect(uri) as ws:
-        data = json.dumps({
-            "user": {
-                "id": 1,
-                "username": "Brick_92",
-                "first_name": "Anatoliy",
-                "last_name": "Shevchenko"
-            },
-            "text": "Hello World!"
-        })
-        await ws.send(data)
-        print(await ws.recv())
-
-asyncio.run(test())
+if __name__ == "__main__":
+    args = parse_args()
+    result = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(
+        {key: value for key, value in result.items() if key != "config"},
+        indent=2,
+    ))
@@ -16,9 +16,21 @@ REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/2"
 app: Celery = Celery(main="proj", broker=REDIS_URL, backend=REDIS_URL)
 app.autodiscover_tasks()
 app.conf.timezone = "Asia/Almaty"
-# app.conf.beat_schedule = {
+app.conf.beat_schedule = {
     # "congratulations": {
     #     "task": "send-congrats",
     #     "schedule": crontab(hour=20, minute=46)
     # }
-# }
+    "expire-presence": {
+        "task": "expire-presence",
+        "schedule": 60.0,
+    },
+    "archive-messages": {
+        "task": "archive-messages",
+        "schedule": crontab(hour=4, minute=30),
+    },
+    "flush-reactions": {
+        "task": "flush-reactions",
+        "schedule": 10.0,
+    },
+}
@@ -3,7 +3,7 @@ import os
 import sys
 from datetime import timedelta
 
-from decouple import config
+from decouple import config, Csv
 from loguru import logger
 
 
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 ]
 
 MIDDLEWARE = [
@@ -85,15 +86,76 @@ DATABASES = {
     }
 }
 NEWSAPI_KEY = config("NEWSAPI_KEY")
-
+# загрузка статей (posts.news): адрес API подменяется заглушкой в тестах
+NEWSAPI_BASE_URL = config("NEWSAPI_BASE_URL", default="https://newsapi.org/v2")
+NEWSAPI_TIMEOUT = 10
+# одновременных запросов к API на одну задачу загрузки
+NEWSAPI_CONCURRENCY = 4
+NEWSAPI_MAX_PAGES = 5
+# статей в одном INSERT ... ON CONFLICT (posts.news.upsert_articles)
+ARTICLE_UPSERT_BATCH_SIZE = 1000
+
+# Несколько Redis-шардов через запятую: redis://r1:6379/0,redis://r2:6379/0
+# Группы и каналы раскладываются по шардам консистентным хешированием.
+CHANNEL_REDIS_HOSTS = config(
+    "CHANNEL_REDIS_HOSTS",
+    cast=Csv(),
+    default=f"redis://{REDIS_HOST}:{REDIS_PORT}/0",
+)
+# Комнаты с массовой рассылкой идут через pub/sub layer
+# (один PUBLISH на группу вместо записи в очередь каждого участника)
+CHAT_BROADCAST_ROOMS = set(
+    config("CHAT_BROADCAST_ROOMS", cast=Csv(cast=int), default="")
+)
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [(REDIS_HOST, REDIS_PORT, 0)],
+            "hosts": CHANNEL_REDIS_HOSTS,
+        },
+    },
+    "broadcast": {
+        "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+        "CONFIG": {
+            "hosts": CHANNEL_REDIS_HOSTS,
         },
     },
 }
+# CHANNEL_LAYER=memory — для локальных прогонов script.py без Redis
+if config("CHANNEL_LAYER", default="redis") == "memory":
+    CHANNEL_LAYERS = {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+        "broadcast": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+    }
+
+# write-behind запись сообщений чата: N сообщений или M миллисекунд
+CHAT_WRITE_BATCH_SIZE = 100
+CHAT_WRITE_FLUSH_MS = 200
+
+# присутствие и "печатает..." (chats.presence)
+PRESENCE_REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/3"
+CHAT_PRESENCE_TTL = 60
+CHAT_HEARTBEAT_INTERVAL = 20
+CHAT_TYPING_INTERVAL_MS = 1000
+# кольцевой буфер последних рассылок комнаты для переподключений
+# (chats.replay); 0 — выключен
+CHAT_REPLAY_SIZE = 500
+CHAT_REPLAY_TTL = 60 * 60 * 24
+# исходящая очередь на подключение и лимит входящих кадров (chats.backpressure)
+# политика переполнения: drop_oldest | coalesce | disconnect
+CHAT_SEND_QUEUE_SIZE = 256
+CHAT_SEND_QUEUE_POLICY = config("CHAT_SEND_QUEUE_POLICY", default="drop_oldest")
+CHAT_INBOUND_RATE = 10.0
+CHAT_INBOUND_BURST = 30
+# сколько чатов мультиплексный сокет ws/ подписывает сразу и максимум всего
+CHAT_MULTIPLEX_MAX_CHATS = 200
+# участники чатов для проверки каждого кадра (chats.membership):
+# Redis set на все процессы и копия в памяти процесса на LOCAL_TTL секунд
+CHAT_MEMBERSHIP_TTL = 600
+CHAT_MEMBERSHIP_LOCAL_TTL = 5
+CHAT_MEMBERSHIP_CACHE_SIZE = 10000
+# LRU проверенных JWT для websocket (chats.middleware)
+CHAT_WS_TOKEN_CACHE_SIZE = 10000
 
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
@@ -142,6 +204,24 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# холодный архив сообщений чатов (chats.archive): старше N дней
+# уходят из Message в gzip NDJSON сегменты по чатам
+CHAT_ARCHIVE_DIR = "chat_archive"
+CHAT_ARCHIVE_AFTER_DAYS = config("CHAT_ARCHIVE_AFTER_DAYS", cast=int, default=90)
+CHAT_ARCHIVE_SEGMENT_SIZE = 5000
+
+# счётчики реакций на картинки (comments.reactions): дельты копятся
+# в Redis и переносятся в Image пачками по N картинок
+REACTION_FLUSH_BATCH_SIZE = 500
+
+# лента друзей (posts.timeline): последние N постов на пользователя,
+# лента неактивного пользователя удаляется из Redis через TTL секунд
+TIMELINE_SIZE = 800
+TIMELINE_TTL = 7 * 24 * 60 * 60
+
+# список категорий с числом постов (posts.categories) кэшируется целиком
+CATEGORY_LIST_CACHE_TTL = 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
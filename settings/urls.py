@@ -21,6 +21,8 @@ from users.views import (
     FriendInvitesView,
 )
 from images.views import ImageViewSet
+from chats.views import ChatHistoryViewSet, ChatListViewSet
+from comments.views import CommentThreadViewSet, ReactionViewSet
 
 
 router = DefaultRouter()
@@ -36,6 +38,20 @@ router.register(
     prefix="invites", viewset=FriendInvitesView, basename="invites"
 )
 router.register(prefix="images", viewset=ImageViewSet, basename="images")
+router.register(prefix="chats", viewset=ChatListViewSet, basename="chats")
+router.register(
+    prefix=r"chats/(?P<chat_pk>\d+)/history",
+    viewset=ChatHistoryViewSet,
+    basename="chat-history",
+)
+router.register(
+    prefix=r"posts/(?P<post_pk>\d+)/comments",
+    viewset=CommentThreadViewSet,
+    basename="post-comments",
+)
+router.register(
+    prefix="reactions", viewset=ReactionViewSet, basename="reactions"
+)
 
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -60,9 +76,16 @@ template_patterns = [
         name="base",
     ),
 ]
-from posts.views import ArticleViewSet  # добавить к импортам
+from posts.views import (  # добавить к импортам
+    ArticleViewSet, CategoryViewSet, PostViewSet, TimelineViewSet,
+)
 
 router.register(prefix="articles", viewset=ArticleViewSet, basename="articles")
+router.register(prefix="timeline", viewset=TimelineViewSet, basename="timeline")
+router.register(prefix="posts", viewset=PostViewSet, basename="posts")
+router.register(
+    prefix="categories", viewset=CategoryViewSet, basename="categories"
+)
 
 urlpatterns = (
     [
@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
+from loguru import logger
+from redis.exceptions import RedisError
 
 from users.models import Client, FriendInvite
 from images.serializers import ImagesSerializer
+from chats.presence import online_users
 
 
 class FriendSerializer(serializers.ModelSerializer):
@@ -17,6 +20,24 @@ class FriendSerializer(serializers.ModelSerializer):
         ]
 
 
+class OnlineFriendSerializer(FriendSerializer):
+    """
+    Друг с присутствием: context["online"] — id онлайн-друзей,
+    собранные одним ZMSCORE на весь список; None — Redis недоступен,
+    online тоже None (неизвестно).
+    """
+    online = serializers.SerializerMethodField()
+
+    class Meta(FriendSerializer.Meta):
+        fields = FriendSerializer.Meta.fields + ["online"]
+
+    def get_online(self, obj: Client) -> bool | None:
+        online = self.context.get("online")
+        if online is None:
+            return None
+        return obj.pk in online
+
+
 class UserModelSerializer(serializers.ModelSerializer):
     join_friends = serializers.ListField(
         child=serializers.IntegerField(), write_only=True, required=False
@@ -55,8 +76,15 @@ class UserModelSerializer(serializers.ModelSerializer):
     def serialize_friends(self, obj: Client):
         method = self.context.get("view").action
         if method == "retrieve":
-            return FriendSerializer(
-                instance=obj.friends, many=True, read_only=True
+            friends = list(obj.friends.all())
+            try:
+                online = online_users(friend.pk for friend in friends)
+            except RedisError as e:
+                logger.warning(f"Presence unavailable: {e}")
+                online = None
+            return OnlineFriendSerializer(
+                instance=friends, many=True, read_only=True,
+                context={"online": online},
             ).data
         return []
 
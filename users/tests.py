@@ -0,0 +1,53 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from redis.exceptions import RedisError
+from rest_framework.test import APIClient
+
+from users.models import Client
+
+
+class FriendsPresenceTest(TestCase):
+    """Присутствие друзей в карточке пользователя — одним запросом в Redis."""
+
+    @classmethod
+    def setUpTestData(cls):
+        with mock.patch("users.signals.ActivateAccountTask.apply_async"):
+            cls.user, *cls.friends = [
+                Client.objects.create(
+                    username=f"user{i}", email=f"user{i}@test.local"
+                )
+                for i in range(3)
+            ]
+        cls.user.friends.add(*cls.friends)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def friends_online(self) -> dict:
+        response = self.client.get(reverse("users-detail", args=[self.user.pk]))
+        self.assertEqual(response.status_code, 200)
+        return {
+            friend["pk"]: friend["online"]
+            for friend in response.data["friends"]
+        }
+
+    def test_friends_carry_online_status(self):
+        online = {self.friends[0].pk}
+        with mock.patch(
+            "users.serializers.online_users", return_value=online
+        ) as online_users:
+            friends = self.friends_online()
+        online_users.assert_called_once()
+        self.assertEqual(friends, {
+            self.friends[0].pk: True, self.friends[1].pk: False,
+        })
+
+    def test_presence_is_unknown_without_redis(self):
+        with mock.patch(
+            "users.serializers.online_users", side_effect=RedisError("down")
+        ):
+            friends = self.friends_online()
+        self.assertEqual(set(friends.values()), {None})
@@ -90,7 +90,8 @@ class UserModelViewSet(
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
-    @method_decorator(cache_page(timeout=600))
+    # без cache_page: в списке друзей присутствие (chats.presence),
+    # оно меняется чаще, чем раз в 10 минут
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 